@@ -1,14 +1,13 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_restx import Api, Resource, fields
 from flask_cors import CORS
-from selenium import webdriver
-from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, ElementNotInteractableException, NoSuchElementException
-import time, traceback, json
-from logger import logger
+import time, traceback, json, os
+from logger import configure_logging, logger
+from metrics import enter_section, record_fallback, run_report, set_report_label
 from functions import (
     AutomationHelper,
     safe_checkbox_click,
@@ -17,14 +16,28 @@ from functions import (
     safe_dropdown_select,
     wait_for_page_load,
     wait_for_form_ready,
-    wait_for_navigation,
     wait_for_ajax_complete,
     smart_wait_and_click,
+    captcha_step_timings,
     smart_wait_and_send_keys,
     wait_for_suggestions
 )
 import promoter_partner, authorized_signatory
 import requests
+from werkzeug.exceptions import HTTPException
+from validation import validate_config
+from jobs import JobQueue, ingest_jsonl
+from profiling import profile_job
+from documents import submit_documents, prepare_documents, document_cache_stats
+from run_history import record_job, run_history
+from browser import create_driver, is_headless, keep_for_review, quit_driver
+from displays import display_allocator
+from browser_watchdog import browser_watchdog
+from error_policy import ErrorPolicy
+from redis_queue import QUEUE_BACKEND, RedisJobQueue, RedisWorker
+from governor import portal_governor
+from captcha_solver import solver_stats
+from scheduling import PRIORITIES
 
 # --- Flask & Swagger UI Setup ---
 app = Flask(__name__)
@@ -46,14 +59,20 @@ config_model = api.model('GSTConfig', {
     'promoter_partner_details': fields.Raw(required=True, description='Details for all promoters/partners'),
     'authorized_signatory_details': fields.Raw(required=True, description='Details for all authorized signatories'),
     'principal_place_of_business_details': fields.Raw(required=True, description='Details for the main place of business'),
-    'goods_services_details': fields.Raw(required=True, description='Details for HSN codes (goods and services)')
+    'goods_services_details': fields.Raw(required=True, description='Details for HSN codes (goods and services)'),
+    'error_policy': fields.Raw(description="Optional: 'lenient', 'strict' or {mode, <section>: abort|continue|retry}"),
+    'priority': fields.String(description="Optional: 'urgent', 'normal' (default) or 'bulk'"),
+    'deadline': fields.String(description='Optional SLA deadline as an ISO 8601 date-time; jobs near it run first')
 })
 
 response_model = api.model('Response', {
     'status': fields.String(required=True, description='The status of the operation (e.g., success, error)'),
     'message': fields.String(required=True, description='A descriptive message about the result'),
     'errors': fields.List(fields.String, description='A list of errors, if any occurred'),
-    'traceback': fields.String(description='The full error traceback for debugging purposes')
+    'traceback': fields.String(description='The full error traceback for debugging purposes'),
+    'job_id': fields.String(description='The id of the job that ran this registration'),
+    'profile': fields.Raw(description='Paths of the profiler artifacts, when profiling was requested'),
+    'report': fields.Raw(description='Timing report: seconds per section, retries, captcha attempts, fallbacks and waits')
 })
 
 # --- Helper functions are now imported from functions.py ---
@@ -64,19 +83,17 @@ def run_full_automation(config):
     This function contains the entire automation flow, corrected to handle
     OTP and TRN verification sequentially and reliably.
     """
-    # Overwrite the main config file so that the imported modules can use it
-    with open('config.json', 'w') as f:
-        json.dump(config, f, indent=4)
-    
+    # The config is handed to the section modules directly, so concurrent jobs never share config.json
+    enter_section('browser_start')
     logger.info("Starting automation with the provided configuration.")
-    options = Options()
-    # Run in visible mode for debugging and monitoring
-    # options.add_argument('--headless')  # Disabled to show browser window
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--window-size=1920,1080')
-    driver = webdriver.Firefox(options=options)
+    error_policy = ErrorPolicy.from_config(config)
+    # Queue for a portal session slot; the governor lowers the cap while the portal is slow
+    portal_governor.sessions.acquire()
+    try:
+        driver = create_driver()
+    except BaseException:
+        portal_governor.sessions.release()
+        raise
     
     try:
         # --- Start of Corrected Flow ---
@@ -85,6 +102,7 @@ def run_full_automation(config):
         wait_for_page_load(driver)  # Replace time.sleep(5)
 
         # 1. Initial Registration (Part A)
+        enter_section('part_a')
         wait_for_form_ready(driver)  # Replace time.sleep(2)
         logger.info("Filling Part A: Initial Registration Details...")
         registration = config['initial_registration_details']
@@ -115,18 +133,27 @@ def run_full_automation(config):
             "District dropdown"
         )
         
+        # Wait for a Part A submission slot before the captcha, so the answer is still fresh at submit
+        portal_governor.part_a.acquire()
+        # Start solving the captcha now so the API call overlaps with typing the fields below
+        captcha_prefetch = helper.prefetch_captcha()
         helper.send_text((By.ID, "bnm"), registration['business_name'])
         helper.send_text((By.ID, "pan_card"), registration['pan_card'])
         helper.send_text((By.ID, "email"), registration['email'])
         helper.send_text((By.ID, "mobile"), registration['mobile_number'])
-        helper.solve_and_enter_captcha()
-        safe_click_with_dimmer_wait(driver, "/html/body/div[2]/div[2]/div/div[2]/div/form/div[2]/div/div[2]/div/button", "Submit button")
-        
-        # Wait for page transition instead of arbitrary sleep
-        wait_for_navigation(driver, timeout=5)  # Replace time.sleep(0.7)
-        safe_click_with_dimmer_wait(driver, "/html/body/table-view/div/div/div/div/div[2]/a[2]", "Continue link")
+        # Submits Part A and retries with a fresh captcha until the portal moves on to the Continue link
+        continue_link = "/html/body/table-view/div/div/div/div/div[2]/a[2]"
+        helper.solve_and_enter_captcha(
+            submit_callable=lambda: safe_click_with_dimmer_wait(driver, "/html/body/div[2]/div[2]/div/div[2]/div/form/div[2]/div/div[2]/div/button", "Submit button"),
+            success_condition=EC.presence_of_element_located((By.XPATH, continue_link)),
+            prefetched=captcha_prefetch,
+        )
+        # The portal has accepted Part A and sent OTPs; rerunning the job now would file a second application
+        set_report_label('part_a_submitted', 'yes')
+        safe_click_with_dimmer_wait(driver, continue_link, "Continue link")
 
         # 2. Handle Mobile and Email OTP
+        enter_section('mobile_otp')
         logger.info("Waiting for Mobile and Email OTP submission...")
         mobile_otp = helper.poll_for_otp("mobile_otp")
         helper.send_text((By.ID, "mobile_otp"), mobile_otp)
@@ -138,18 +165,26 @@ def run_full_automation(config):
         safe_click_with_dimmer_wait(driver, "/html/body/div[2]/div[2]/div/div[2]/div/div[2]/div/form/div/div/button", "Proceed after OTPs button") # Proceed after OTPs
 
         # 3. Handle TRN (Temporary Reference Number)
+        enter_section('trn')
         logger.info("Waiting for TRN submission to log in...")
         wait_for_page_load(driver)  # Replace time.sleep(5) # Wait for TRN success page to load
         
         # Proceed to login page
         safe_click_with_dimmer_wait(driver, "/html/body/div[2]/div[2]/div/div[2]/div/div[2]/div/div[2]/div/a", "Login page link") 
         
+        # Solve the login captcha while waiting for the TRN to be submitted
+        captcha_prefetch = helper.prefetch_captcha(visible=True)
         trn = helper.poll_for_otp("trn")
         helper.send_text((By.ID, "trnno"), trn)
-        helper.handle_initial_captcha()
-        safe_click_with_dimmer_wait(driver, "/html/body/div[2]/div[2]/div/div[2]/div/form/div[2]/div/div[2]/div/button", "Proceed with TRN button") # Proceed with TRN
+        # Proceeds with the TRN and retries with a fresh captcha until the login OTP field appears
+        helper.handle_initial_captcha(
+            submit_callable=lambda: safe_click_with_dimmer_wait(driver, "/html/body/div[2]/div[2]/div/div[2]/div/form/div[2]/div/div[2]/div/button", "Proceed with TRN button"),
+            success_condition=EC.presence_of_element_located((By.ID, "mobile_otp")),
+            prefetched=captcha_prefetch,
+        )
 
         # 4. Handle Post-TRN Login OTP
+        enter_section('login_otp')
         logger.info("Waiting for OTP after TRN login...")
         login_otp = helper.poll_for_otp("mobile_otp") # GST portal asks for mobile/email OTP again
         helper.send_text((By.ID, "mobile_otp"), login_otp)
@@ -162,6 +197,7 @@ def run_full_automation(config):
         safe_click_with_dimmer_wait(driver, "/html/body/div[2]/div[1]/div/div[3]/div[2]/div/div/table/tbody/tr/td[6]/button", "Action button")
 
         # Business Details
+        enter_section('business_details')
         logger.info("Filling Part B: Business Details...")
         business_details = config['business_details']
         wait_for_form_ready(driver)  # Replace time.sleep(5)
@@ -237,49 +273,17 @@ def run_full_automation(config):
         wait_for_ajax_complete(driver)
         driver.find_element(By.XPATH, "/html/body/div[2]/div/div/div[3]/form/div/div/button[2]").click()
 
-        # Promoter/Partner Details with enhanced error handling
+        # Promoter/Partner Details; on failure the error policy continues, retries or aborts
+        enter_section('promoter_partner')
         logger.info("📋 Starting Promoter/Partner Details processing...")
-        try:
-            promoter_partner.fill_promoter_partner_details(driver)
-            logger.info("✅ Promoter/Partner details filled successfully")
-            
-        except TimeoutException as timeout_error:
-            logger.error(f"⏰ Timeout occurred while filling promoter/partner details: {timeout_error}")
-            logger.warning("🔄 Continuing with automation despite timeout - promoter section may be incomplete")
-            
-        except NoSuchElementException as element_error:
-            logger.error(f"🔍 Required element not found in promoter/partner section: {element_error}")
-            logger.warning("🔄 Continuing with automation despite missing element")
-            
-        except ElementNotInteractableException as interaction_error:
-            logger.error(f"🚫 Element not interactable in promoter/partner section: {interaction_error}")
-            logger.warning("🔄 Continuing with automation despite interaction issue")
-            
-        except Exception as promoter_error:
-            logger.error(f"❌ Unexpected error in promoter/partner details: {type(promoter_error).__name__}: {promoter_error}")
-            logger.warning("🔄 Continuing with automation despite promoter error...")
+        if error_policy.run('promoter_partner', lambda: promoter_partner.fill_promoter_partner_details(driver, config), driver):
+            logger.info("✅ Promoter/Partner details step finished")
         
-        # Authorized Signatory with enhanced error handling
+        # Authorized Signatory; same policy handling
+        enter_section('authorized_signatory')
         logger.info("📋 Starting Authorized Signatory Details processing...")
-        try:
-            authorized_signatory.fill_authorized_signatory_details(driver)
-            logger.info("✅ Authorized Signatory details filled successfully")
-            
-        except TimeoutException as timeout_error:
-            logger.error(f"⏰ Timeout occurred while filling authorized signatory details: {timeout_error}")
-            logger.warning("🔄 Continuing with automation despite timeout - signatory section may be incomplete")
-            
-        except NoSuchElementException as element_error:
-            logger.error(f"🔍 Required element not found in authorized signatory section: {element_error}")
-            logger.warning("🔄 Continuing with automation despite missing element")
-            
-        except ElementNotInteractableException as interaction_error:
-            logger.error(f"🚫 Element not interactable in authorized signatory section: {interaction_error}")
-            logger.warning("🔄 Continuing with automation despite interaction issue")
-            
-        except Exception as signatory_error:
-            logger.error(f"❌ Unexpected error in authorized signatory details: {type(signatory_error).__name__}: {signatory_error}")
-            logger.warning("🔄 Continuing with automation despite signatory error...")
+        if error_policy.run('authorized_signatory', lambda: authorized_signatory.fill_authorized_signatory_details(driver, config), driver):
+            logger.info("✅ Authorized Signatory details step finished")
             
         safe_click_with_dimmer_wait(driver, "/html/body/div[2]/div/div/div[3]/form/div[2]/div[3]/div/button[3]", "Authorized Signatory Save & Continue button") # Save & Continue
 
@@ -288,6 +292,7 @@ def run_full_automation(config):
         safe_click_with_dimmer_wait(driver, "/html/body/div[2]/div/div/div[3]/form/div/div/button[2]", "Principal Place Save & Continue button") # Save & Continue
 
         # Principal Place of Business
+        enter_section('principal_place')
         logger.info("Filling Principal Place of Business Details...")
         principal_details = config['principal_place_of_business_details']
         wait_for_form_ready(driver)  # Replace time.sleep(5)
@@ -316,6 +321,7 @@ def run_full_automation(config):
                 
             except TimeoutException:
                 logger.warning("Normal click failed, trying JavaScript click...")
+                record_fallback('map_confirm_js_click')
                 # Method 2: JavaScript click fallback
                 try:
                     confirm_button = driver.find_element(By.ID, "confirm-mapquery-btn3")
@@ -336,7 +342,7 @@ def run_full_automation(config):
                         logger.warning("All map confirmation methods failed - proceeding without map confirmation")
                         
         except Exception as map_error:
-            logger.error(f"Map search failed: {map_error}")
+            error_policy.handle('map_search', map_error, driver)
             logger.info("Proceeding without map search - will fill address manually")
         
 
@@ -357,6 +363,7 @@ def run_full_automation(config):
                 helper.send_text((By.ID, "loc"), City)
             except Exception as loc_error:
                 logger.warning(f"Normal send_text failed for 'loc' field, trying JavaScript approach: {loc_error}")
+                record_fallback('js_fill')
                 try:
                     # Use JavaScript to handle disabled field
                     loc_element = driver.find_element(By.ID, "loc")
@@ -637,12 +644,14 @@ def run_full_automation(config):
             
         except (TimeoutException, Exception) as e:
             logger.warning(f"Normal click failed for Additional Place of Business button, trying JavaScript click: {e}")
+            record_fallback('js_click')
             # Fallback: Use JavaScript click to bypass the overlay
             button = driver.find_element(By.XPATH, "/html/body/div[2]/div/div/div[3]/form/div/div[2]/div/button[2]")
             driver.execute_script("arguments[0].click();", button)
             logger.info("Additional Place of Business button clicked with JavaScript")
 
         # Goods & Services Details
+        enter_section('goods_services')
         logger.info("Filling Goods and Services Details...")
         gst_details = config['goods_services_details']
         try:
@@ -656,7 +665,7 @@ def run_full_automation(config):
                 wait_for_ajax_complete(driver) 
                 safe_click_with_dimmer_wait(driver, f"//*[text()='{gst_details['hsn_value']}']", "HSN exact match")
         except Exception as e:
-            logger.error(f"Failed to click HSN exact match: {e}")
+            error_policy.handle('hsn', e, driver)
 
         wait_for_ajax_complete(driver) 
         safe_click_with_dimmer_wait(driver, "/html/body/div[2]/div/div/div[3]/form/div[2]/div/button", "Goods Services Save & Continue button") # Save & Continue
@@ -675,6 +684,7 @@ def run_full_automation(config):
 
 
         ## Pop Up
+        enter_section('verification')
         safe_click_with_dimmer_wait(driver, "/html/body/div[2]/div/div/div[3]/div[2]/div/div/div[2]/button", "Pop Up button") # Save & Continue
 
         # Check BOX
@@ -700,34 +710,61 @@ def run_full_automation(config):
         raise
 
     finally:
-        logger.info("🎉 Automation process finished. Browser will remain open for your review.")
-        logger.info("ℹ️ You can now manually review the filled form and submit it when ready.")
-        logger.info("🌐 To close the browser, simply close the browser window manually.")
-        # driver.quit()  # Browser will stay open for user review
+        portal_governor.sessions.release()
+        if is_headless():
+            # Nobody can review a headless browser, so free its memory for the next job
+            quit_driver(driver)
+            logger.info("🎉 Automation process finished. Headless browser closed.")
+        else:
+            logger.info("🎉 Automation process finished. Browser will remain open for your review.")
+            logger.info("ℹ️ You can now manually review the filled form and submit it when ready.")
+            logger.info("🌐 To close the browser, simply close the browser window manually.")
+            # driver.quit()  # Browser will stay open for user review
+            keep_for_review(driver)
+
+# --- Job Queue ---
+# Every run (single API call, batch line or CLI batch) goes through this queue; documents are
+# preprocessed in a process pool from submit time so the browser only sees ready-to-upload files,
+# and every finished job is written to the run history store.
+# With GST_QUEUE_BACKEND=redis the API only enqueues; `app.py --worker` nodes run the jobs on their local queue
+local_queue = JobQueue(run_full_automation, prepare=submit_documents, on_finish=record_job)
+job_queue = RedisJobQueue() if QUEUE_BACKEND == 'redis' else local_queue
+browser_watchdog.job_active = local_queue.is_active
 
 # --- API Endpoints ---
 @api.route('/automate-gst-registration')
 class GSTAutomation(Resource):
     @api.expect(config_model)
+    @api.doc(params={'profile': 'Set to 1 to run the job under the sampling profiler and save a flame graph'})
     @api.marshal_with(response_model)
     def post(self):
         """
         Accepts a JSON payload and runs the full GST registration automation.
         """
         try:
-            config = request.get_json()
-            # Basic validation
-            required_sections = [
-                'initial_registration_details', 'business_details', 'promoter_partner_details',
-                'authorized_signatory_details', 'principal_place_of_business_details', 'goods_services_details'
-            ]
-            if not all(key in config for key in required_sections):
-                api.abort(400, 'Missing one or more required sections in the JSON payload.', errors=f"Required: {required_sections}")
-
-            run_full_automation(config)
-            
-            return {'status': 'success', 'message': 'GST automation process completed.'}
-
+            config = request.get_json(silent=True)
+            # Validate the whole payload up front, before any browser, captcha or OTP is spent
+            errors = validate_config(config)
+            if errors:
+                logger.warning(f"❌ Rejected invalid configuration with {len(errors)} error(s)")
+                api.abort(400, 'Invalid configuration payload.', errors=errors)
+
+            # Runs share the worker pool with batch jobs; this request simply waits for its own job
+            profile = request.args.get('profile', '0') in ('1', 'true', 'yes')
+            job = job_queue.submit(config, source='api', profile=profile)
+            job.wait()
+            if job.status == 'cancelled':
+                api.abort(409, f'Job {job.id} was cancelled.', errors=[job.error], job_id=job.id, report=job.report)
+            if job.status == 'failed':
+                logger.error(f"A critical error occurred in the API: {job.error}")
+                api.abort(500, 'An unexpected error occurred during automation.', errors=[job.error], traceback=job.traceback,
+                          job_id=job.id, report=job.report)
+
+            return {'status': 'success', 'message': f'GST automation process completed (job {job.id}).',
+                    'job_id': job.id, 'profile': job.profile_artifacts, 'report': job.report}
+
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"A critical error occurred in the API: {e}")
             tb = traceback.format_exc()
@@ -735,15 +772,84 @@ class GSTAutomation(Resource):
             # Use api.abort for proper error response formatting
             api.abort(500, 'An unexpected error occurred during automation.', errors=[str(e)], traceback=tb)
 
+@api.route('/automate-gst-registration/batch')
+class GSTBatchAutomation(Resource):
+    @api.doc(params={'wait': 'Set to 1 to keep the stream open and also emit each job result as it finishes',
+                     'profile': 'Set to 1 to profile every job in the batch',
+                     'priority': "Priority for records that don't set one, e.g. 'bulk' for a backfill"})
+    def post(self):
+        """
+        Accepts a JSONL/NDJSON body (one config per line) and streams back one result line per record.
+        Records are validated and queued as they are read, so the batch is never held in memory.
+        """
+        wait = request.args.get('wait', '0') in ('1', 'true', 'yes')
+        profile = request.args.get('profile', '0') in ('1', 'true', 'yes')
+        priority = request.args.get('priority')
+        if priority is not None and priority not in PRIORITIES:
+            api.abort(400, f'priority must be one of {list(PRIORITIES)}.')
+
+        def generate():
+            queued = []
+            for result in ingest_jsonl(request.stream, job_queue, source='batch', profile=profile, priority=priority):
+                if result['status'] == 'queued':
+                    queued.append(job_queue.get(result['job_id']))
+                yield json.dumps(result) + '\n'
+            for job in queued if wait else []:
+                job.wait()
+                yield json.dumps(job.to_dict()) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@api.route('/jobs/<string:job_id>')
+class JobStatus(Resource):
+    def get(self, job_id):
+        """Returns the status of a queued, running or finished job."""
+        job = job_queue.get(job_id)
+        if job is None:
+            api.abort(404, f'Job {job_id} not found.')
+        return job.to_dict(), 200
+
+    @api.doc(params={'reason': 'Optional note stored with the cancellation'})
+    def delete(self, job_id):
+        """Cancels a queued or running job, closing its browser and freeing its worker."""
+        job = job_queue.cancel(job_id, reason=request.args.get('reason') or 'cancelled by request')
+        if job is None:
+            api.abort(404, f'Job {job_id} not found.')
+        if job.finished and job.status != 'cancelled':
+            api.abort(409, f'Job {job_id} already {job.status}.')
+        # Running jobs stop within a WebDriver poll; give the worker a moment to report back
+        job.wait(timeout=5)
+        return job.to_dict(), 202 if not job.finished else 200
+
+@api.route('/stats')
+class RunStats(Resource):
+    @api.doc(params={'hours': 'Time window in hours (default 24)',
+                     'state': 'Only include runs for this state',
+                     'limit': 'Number of slowest runs to return (default 10)'})
+    def get(self):
+        """Returns P50/P95/P99 durations per step and the slowest runs from the run history."""
+        try:
+            hours = float(request.args.get('hours', '24'))
+            limit = int(request.args.get('limit', '10'))
+        except ValueError:
+            api.abort(400, 'hours must be a number and limit an integer.')
+        if hours <= 0 or limit < 0:
+            api.abort(400, 'hours must be positive and limit non-negative.')
+        return run_history.stats(hours=hours, state=request.args.get('state'), slowest=limit), 200
+
 @api.route('/health')
 class HealthCheck(Resource):
     def get(self):
         """Provides a simple health check for the API."""
-        return {'status': 'ok', 'message': 'API is running.'}, 200
+        return {'status': 'ok', 'message': 'API is running.', 'jobs': job_queue.stats(),
+                'document_cache': document_cache_stats(), 'displays': display_allocator.stats(),
+                'browsers': browser_watchdog.stats(), 'governor': portal_governor.stats(),
+                'captcha_solvers': solver_stats(), 'captcha_steps': captcha_step_timings()}, 200
 
 if __name__ == '__main__':
     # Check if we should run direct automation or API server (default)
     import sys
+    configure_logging()
     
     if len(sys.argv) > 1 and sys.argv[1] == '--direct':
         # Run direct automation using config.json
@@ -751,9 +857,26 @@ if __name__ == '__main__':
         try:
             with open('config.json', 'r') as f:
                 config = json.load(f)
-            
-            run_full_automation(config)
+
+            errors = validate_config(config)
+            if errors:
+                print(f"❌ config.json is invalid ({len(errors)} error(s)):")
+                for error in errors:
+                    print(f"   - {error}")
+                sys.exit(1)
+
+            # --profile samples the run and writes a flame graph under logs/jobs/
+            run_id = time.strftime('direct-%Y%m%d_%H%M%S')
+            report = None
+            try:
+                with profile_job(run_id, enabled='--profile' in sys.argv), run_report() as report:
+                    run_full_automation(prepare_documents(config))
+            finally:
+                if report is not None:
+                    run_history.record_run(run_id, config, report.to_dict(), report.status, source='direct',
+                                           started_at=report.started_at, finished_at=report.finished_at)
             print("✅ GST automation completed successfully!")
+            print(json.dumps(report.to_dict(), indent=2))
             
         except FileNotFoundError:
             print("❌ Error: config.json file not found!")
@@ -762,9 +885,36 @@ if __name__ == '__main__':
             print(f"❌ Error during automation: {e}")
             logger.error(f"Automation failed: {e}")
             logger.error(traceback.format_exc())
+    elif len(sys.argv) > 2 and sys.argv[1] == '--batch':
+        # Stream a JSONL file of configs through the job queue, printing one result line per record
+        batch_path = sys.argv[2]
+        print(f"Running GST automation batch from {batch_path}...", file=sys.stderr)
+        queued = []
+        with open(batch_path, 'rb') as batch_file:
+            for result in ingest_jsonl(batch_file, job_queue, source=os.path.basename(batch_path)):
+                if result['status'] == 'queued':
+                    queued.append(job_queue.get(result['job_id']))
+                print(json.dumps(result), flush=True)
+        for job in queued:
+            job.wait()
+            print(json.dumps(job.to_dict()), flush=True)
+        failed = sum(1 for job in queued if job.status == 'failed')
+        print(f"✅ Batch finished: {len(queued) - failed} succeeded, {failed} failed", file=sys.stderr)
+        sys.exit(1 if failed else 0)
+    elif len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        # Claim jobs from the shared Redis queue and run them in this node's browser pool
+        browser_watchdog.start()
+        RedisWorker(RedisJobQueue(), local_queue).run()
+    elif len(sys.argv) > 1 and sys.argv[1] == '--requeue-dead':
+        # Put dead-lettered Redis jobs (one id, or all) back on the queue
+        moved = RedisJobQueue().requeue_dead(sys.argv[2] if len(sys.argv) > 2 else None)
+        print(f"✅ Requeued {moved} dead-lettered job(s)")
     else:
         # Default: Start Flask API server
+        browser_watchdog.start()
         print("Starting GST Automation API on http://localhost:8001")
         print("Swagger UI is available at http://localhost:8001/docs/")
-        print("To run automation directly, use: python3 app.py --direct")
+        print("To run automation directly, use: python3 app.py --direct [--profile]")
+        print("To run a JSONL batch, use: python3 app.py --batch registrations.jsonl")
+        print("To serve the Redis job queue (GST_QUEUE_BACKEND=redis), use: python3 app.py --worker")
         app.run(host='0.0.0.0', port=8001, debug=True) 
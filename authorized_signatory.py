@@ -19,17 +19,20 @@ from functions import (
 )
 import time
 from logger import logger
+from metrics import record_fallback
 import json
 
 # --- Helper functions are now imported from functions.py ---
 
-def fill_authorized_signatory_details(driver):
+def fill_authorized_signatory_details(driver, config=None):
     """
     Main function to orchestrate filling details for all authorized signatories.
     It assumes the driver is on the page that lists the signatories.
+    Falls back to config.json when no config is passed in.
     """
-    with open('config.json', 'r') as f:
-        config = json.load(f)
+    if config is None:
+        with open('config.json', 'r') as f:
+            config = json.load(f)
 
     signatories_data = config.get('authorized_signatory_details', [])
     nigga = AutomationHelper(driver, logger)
@@ -161,6 +164,7 @@ def fill_single_signatory_details(driver, nigga, signatory_data):
                     wait_for_element_stable(driver, (By.ID, "auth_prim"))  # Replace time.sleep(0.5)
                     driver.execute_script("arguments[0].click();", checkbox)
                     logger.info("✅ Primary Signatory checkbox clicked (Strategy 2: JavaScript)")
+                    record_fallback('primary_signatory_strategy_2_js')
                     checkbox_clicked = True
                     
                 except Exception as e:
@@ -180,6 +184,7 @@ def fill_single_signatory_details(driver, nigga, signatory_data):
                         checkbox = driver.find_element(By.XPATH, selector)
                         driver.execute_script("arguments[0].click();", checkbox)
                         logger.info(f"✅ Primary Signatory checkbox clicked (Strategy 3: {selector})")
+                        record_fallback('primary_signatory_strategy_3')
                         checkbox_clicked = True
                         break
                         
@@ -0,0 +1,383 @@
+# File: browser.py
+#
+# Firefox launch for automation runs
+# GST_BROWSER_MODE selects a headless browser (production workers: no X display needed, the
+# browser is quit when the run ends) or a visible one left open for manual review.
+# In lean mode (the default) the browser starts from a cached, pre-tuned profile template:
+# analytics, web fonts and other non-essential hosts are blocked through a PAC file,
+# telemetry/updates/prefetch are off and caches are small. Each run gets its own copy of the
+# template so concurrent browsers never share a profile lock. Visible browsers each get their
+# own virtual display from displays.py when Xvfb is available.
+
+import hashlib
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from selenium import webdriver
+from selenium.webdriver.firefox.options import Options
+from selenium.webdriver.firefox.service import Service
+from selenium.webdriver.remote.command import Command
+
+from browser_watchdog import browser_watchdog
+from cancellation import check_cancelled, on_cancel
+from displays import PER_JOB_DISPLAY, display_allocator
+from logger import logger
+from metrics import set_report_label
+
+BROWSER_MODE = os.getenv('GST_BROWSER_MODE', 'visible').lower()
+if BROWSER_MODE not in ('headless', 'visible'):
+    logger.warning(f"⚠️ Unknown GST_BROWSER_MODE {BROWSER_MODE!r}, using visible")
+    BROWSER_MODE = 'visible'
+# Per-process cap on Firefox's data segment in MB (0 = no cap); applies to geckodriver and every
+# Firefox process it starts, so a runaway content process fails alone instead of starving the host
+BROWSER_MEMORY_MB = int(os.getenv('GST_BROWSER_MEMORY_MB', '0'))
+CONTENT_PROCESSES = int(os.getenv('GST_FIREFOX_CONTENT_PROCESSES', '2'))
+WINDOW_WIDTH, WINDOW_HEIGHT = 1920, 1080
+LEAN_PROFILE = os.getenv('GST_LEAN_PROFILE', '1').lower() not in ('0', 'false', 'no')
+PROFILE_CACHE_DIR = os.getenv('GST_FIREFOX_PROFILE_DIR', os.path.join('uploads', '.firefox_profiles'))
+BLOCK_MAP_TILES = os.getenv('GST_BLOCK_MAP_TILES', '0').lower() in ('1', 'true', 'yes')
+EXTRA_BLOCKED_HOSTS = [host.strip() for host in os.getenv('GST_BLOCKED_HOSTS', '').split(',') if host.strip()]
+STALE_PROFILE_HOURS = float(os.getenv('GST_FIREFOX_PROFILE_MAX_AGE_HOURS', '24'))
+
+# Hosts the registration flow never needs; a leading dot also matches subdomains
+BLOCKED_HOSTS = [
+    '.google-analytics.com', '.googletagmanager.com', '.doubleclick.net', '.googlesyndication.com',
+    '.googleadservices.com', '.hotjar.com', '.facebook.net', '.clarity.ms',
+    'fonts.googleapis.com', 'fonts.gstatic.com', 'use.fontawesome.com',
+]
+# The address map on the principal place page; only blocked on request, since map search
+# results are still clicked (the confirm step already tolerates a missing map)
+MAP_TILE_HOSTS = ['.tile.openstreetmap.org', 'maps.gstatic.com', 'khms0.googleapis.com', 'khms1.googleapis.com',
+                  'mt0.google.com', 'mt1.google.com', 'api.mapbox.com']
+
+LEAN_PREFS: Dict[str, object] = {
+    # Telemetry, crash reports, studies and health reports
+    'toolkit.telemetry.enabled': False,
+    'toolkit.telemetry.unified': False,
+    'toolkit.telemetry.archive.enabled': False,
+    'datareporting.healthreport.uploadEnabled': False,
+    'datareporting.policy.dataSubmissionEnabled': False,
+    'app.shield.optoutstudies.enabled': False,
+    'app.normandy.enabled': False,
+    'browser.crashReports.unsubmittedCheck.autoSubmit2': False,
+    # Updates and background services
+    'app.update.auto': False,
+    'app.update.enabled': False,
+    'extensions.update.enabled': False,
+    'browser.search.update': False,
+    'browser.safebrowsing.malware.enabled': False,
+    'browser.safebrowsing.phishing.enabled': False,
+    'browser.safebrowsing.downloads.enabled': False,
+    'browser.newtabpage.enabled': False,
+    'browser.startup.page': 0,
+    'browser.aboutHomeSnippets.updateUrl': '',
+    'extensions.pocket.enabled': False,
+    # Speculative connections and prefetching
+    'network.prefetch-next': False,
+    'network.dns.disablePrefetch': True,
+    'network.http.speculative-parallel-limit': 0,
+    'network.predictor.enabled': False,
+    'browser.urlbar.speculativeConnect.enabled': False,
+    'browser.places.speculativeConnect.enabled': False,
+    # Web fonts and media the forms don't need
+    'gfx.downloadable_fonts.enabled': False,
+    'media.autoplay.default': 5,
+    'media.peerconnection.enabled': False,
+    # Smaller caches
+    'browser.cache.disk.enable': True,
+    'browser.cache.disk.capacity': 51200,
+    'browser.cache.disk.smart_size.enabled': False,
+    'browser.cache.memory.capacity': 16384,
+    'browser.sessionhistory.max_entries': 5,
+    'browser.sessionstore.resume_from_crash': False,
+    'browser.sessionstore.interval': 600000,
+    # Blocked hosts are routed to a dead proxy by the PAC file; the rest use the environment's proxy
+    'network.proxy.type': 2,
+}
+
+
+# Applied in every mode: the portal is a single tab, so a few content processes are enough
+MEMORY_PREFS: Dict[str, object] = {
+    'dom.ipc.processCount': CONTENT_PROCESSES,
+    'dom.ipc.processCount.webIsolated': 1,
+    'fission.autostart': False,
+    'dom.ipc.processPrelaunch.enabled': False,
+    'browser.sessionhistory.max_total_viewers': 0,
+    'browser.tabs.unloadOnLowMemory': True,
+    'image.mem.decode_bytes_at_a_time': 65536,
+    'javascript.options.wasm': False,
+}
+
+
+def blocked_hosts() -> List[str]:
+    return BLOCKED_HOSTS + (MAP_TILE_HOSTS if BLOCK_MAP_TILES else []) + EXTRA_BLOCKED_HOSTS
+
+
+def _proxy_directive(value: str) -> Optional[str]:
+    """PAC directive for a proxy URL such as http://proxy:3128 or socks5://proxy:1080"""
+    parts = urlsplit(value if '://' in value else 'http://' + value)
+    if not parts.hostname:
+        return None
+    scheme = parts.scheme.lower()
+    kind, port = {'http': ('PROXY', 80), 'https': ('HTTPS', 443), 'socks4': ('SOCKS', 1080), 'socks4a': ('SOCKS', 1080),
+                  'socks5': ('SOCKS5', 1080), 'socks5h': ('SOCKS5', 1080), 'socks': ('SOCKS5', 1080)}.get(scheme, (None, None))
+    if kind is None:
+        return None
+    return f"{kind} {parts.hostname}:{parts.port or port}"
+
+
+def _env_proxies() -> Dict[str, object]:
+    """
+    The proxy the browser would otherwise use (Firefox's default is the system proxy, i.e. the
+    *_PROXY variables), as PAC directives per URL scheme plus the NO_PROXY exceptions. The PAC
+    file sends allowed hosts through it, so forcing PAC mode doesn't bypass the proxy.
+    """
+    env = lambda name: os.getenv(name) or os.getenv(name.lower()) or ''
+    proxies = {}
+    for scheme, value in (('http', env('HTTP_PROXY') or env('ALL_PROXY')), ('https', env('HTTPS_PROXY') or env('ALL_PROXY'))):
+        if value:
+            directive = _proxy_directive(value)
+            if directive is None:
+                raise ValueError(f"unsupported proxy {value!r}")
+            proxies[scheme] = directive
+    no_proxy = [host.strip() for host in env('NO_PROXY').split(',') if host.strip()]
+    return {'proxies': proxies, 'no_proxy': no_proxy}
+
+
+def _pac_script(hosts: List[str], proxies: Dict[str, str], no_proxy: List[str]) -> str:
+    # 127.0.0.1:9 (discard) refuses the connection immediately, so blocked requests fail fast
+    return (
+        "var BLOCKED = " + json.dumps(hosts) + ";\n"
+        "var PROXIES = " + json.dumps(proxies) + ";\n"
+        "var NO_PROXY = " + json.dumps(no_proxy) + ";\n"
+        "function matches(host, rule) {\n"
+        "  if (rule === '*') return true;\n"
+        "  var domain = rule.charAt(0) === '.' ? rule.substring(1) : rule;\n"
+        "  return host === domain || dnsDomainIs(host, '.' + domain);\n"
+        "}\n"
+        "function FindProxyForURL(url, host) {\n"
+        "  for (var i = 0; i < BLOCKED.length; i++) {\n"
+        "    var rule = BLOCKED[i];\n"
+        "    if (rule.charAt(0) === '.' ? (dnsDomainIs(host, rule) || host === rule.substring(1)) : host === rule) {\n"
+        "      return 'PROXY 127.0.0.1:9';\n"
+        "    }\n"
+        "  }\n"
+        "  for (var j = 0; j < NO_PROXY.length; j++) {\n"
+        "    if (matches(host, NO_PROXY[j])) return 'DIRECT';\n"
+        "  }\n"
+        "  var scheme = url.substring(0, url.indexOf(':'));\n"
+        "  if (scheme === 'ws') scheme = 'http';\n"
+        "  if (scheme === 'wss') scheme = 'https';\n"
+        "  return PROXIES[scheme] || 'DIRECT';\n"
+        "}\n"
+    )
+
+
+def _user_js(prefs: Dict[str, object]) -> str:
+    return ''.join(f'user_pref({json.dumps(name)}, {json.dumps(value)});\n' for name, value in prefs.items())
+
+
+def lean_profile_template() -> str:
+    """
+    Build (once) the lean profile template and return its path. The directory name is a hash
+    of the prefs, block list and environment proxy, so changing any of them produces a fresh template.
+    """
+    hosts = blocked_hosts()
+    prefs = dict(LEAN_PREFS)
+    try:
+        proxy = _env_proxies()
+    except ValueError as e:
+        # A proxy the PAC file can't express: keep Firefox's own proxy handling and skip the block list
+        logger.warning(f"⚠️ {e}; the lean profile will not block hosts")
+        proxy, hosts = None, []
+        del prefs['network.proxy.type']
+    digest = hashlib.sha256(json.dumps([prefs, hosts, proxy], sort_keys=True).encode()).hexdigest()[:16]
+    template = os.path.abspath(os.path.join(PROFILE_CACHE_DIR, f'template-{digest}'))
+    if os.path.isdir(template):
+        return template
+
+    os.makedirs(PROFILE_CACHE_DIR, exist_ok=True)
+    building = tempfile.mkdtemp(prefix='template-', suffix='.part', dir=PROFILE_CACHE_DIR)
+    if proxy is not None:
+        prefs['network.proxy.autoconfig_url'] = 'file://' + os.path.join(template, 'blocklist.pac')
+        with open(os.path.join(building, 'blocklist.pac'), 'w') as f:
+            f.write(_pac_script(hosts, proxy['proxies'], proxy['no_proxy']))
+    with open(os.path.join(building, 'user.js'), 'w') as f:
+        f.write(_user_js(prefs))
+    try:
+        os.rename(building, template)
+        logger.info(f"🧰 Built lean Firefox profile template ({len(hosts)} blocked hosts)")
+    except OSError:
+        # Another worker finished the same template first
+        shutil.rmtree(building, ignore_errors=True)
+    return template
+
+
+def _sweep_stale_profiles():
+    """Remove per-run profile copies left behind by browsers that were never quit"""
+    cutoff = time.time() - STALE_PROFILE_HOURS * 3600
+    try:
+        entries = os.listdir(PROFILE_CACHE_DIR)
+    except FileNotFoundError:
+        return
+    for name in entries:
+        path = os.path.join(PROFILE_CACHE_DIR, name)
+        if name.startswith('run-') or name.endswith('.part'):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+
+def browser_profile_mode() -> str:
+    return 'lean' if LEAN_PROFILE else 'default'
+
+
+def is_headless() -> bool:
+    return BROWSER_MODE == 'headless'
+
+
+class _MemoryLimitedService(Service):
+    """
+    geckodriver service whose data segment is capped right after it is spawned, before the
+    session starts Firefox, so Firefox and its content processes inherit the limit. Set from
+    the parent with prlimit(2) rather than a preexec_fn, which is unsafe in a threaded server.
+    """
+
+    def start(self):
+        super().start()
+        limit = BROWSER_MEMORY_MB * 1024 * 1024
+        try:
+            resource.prlimit(self.process.pid, resource.RLIMIT_DATA, (limit, limit))
+        except (OSError, AttributeError) as e:
+            logger.warning(f"⚠️ Could not apply the {BROWSER_MEMORY_MB} MB browser memory limit: {e}")
+
+
+def create_driver() -> webdriver.Firefox:
+    """Launch Firefox for one run; quit it with quit_driver() so its profile copy is removed"""
+    options = Options()
+    if is_headless():
+        options.add_argument('-headless')
+    # Visible mode (default) is kept for debugging and manual review of the filled form
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+    options.add_argument(f'--width={WINDOW_WIDTH}')
+    options.add_argument(f'--height={WINDOW_HEIGHT}')
+    for name, value in MEMORY_PREFS.items():
+        options.set_preference(name, value)
+
+    profile_dir = None
+    if LEAN_PROFILE:
+        _sweep_stale_profiles()
+        template = lean_profile_template()
+        profile_dir = tempfile.mkdtemp(prefix='run-', dir=os.path.abspath(PROFILE_CACHE_DIR))
+        shutil.copytree(template, profile_dir, dirs_exist_ok=True)
+        options.add_argument('-profile')
+        options.add_argument(profile_dir)
+        logger.info(f"🪶 Starting Firefox with lean profile ({len(blocked_hosts())} blocked hosts)")
+    set_report_label('browser_profile', browser_profile_mode())
+    set_report_label('browser_mode', BROWSER_MODE)
+
+    display = None
+    service_kwargs = {}
+    service_cls = _MemoryLimitedService if BROWSER_MEMORY_MB > 0 else Service
+    try:
+        if not is_headless() and PER_JOB_DISPLAY and display_allocator.available:
+            # Passed to geckodriver (and so Firefox) only; the process-wide DISPLAY is left alone
+            display = display_allocator.acquire()
+            service_kwargs['env'] = dict(os.environ, DISPLAY=display.name)
+            set_report_label('display', display.name)
+        logger.info(f"🦊 Launching {BROWSER_MODE} Firefox ({CONTENT_PROCESSES} content processes"
+                    + (f", {BROWSER_MEMORY_MB} MB per process" if BROWSER_MEMORY_MB > 0 else "")
+                    + (f", display {display.name})" if display else ")"))
+        driver = webdriver.Firefox(options=options, service=service_cls(**service_kwargs))
+    except BaseException:
+        # Also on a cancel while waiting for a display slot (JobCancelled is a BaseException)
+        if profile_dir:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+        if display is not None:
+            display_allocator.release(display)
+        raise
+    driver.gst_profile_dir = profile_dir
+    driver.gst_display = display
+    # The watchdog kills the tree if it outgrows its budget or outlives its job
+    driver.gst_root_pid = driver.service.process.pid
+    browser_watchdog.track(driver.gst_root_pid, cleanup=lambda: _release_resources(driver))
+    _make_cancellable(driver)
+    if is_headless():
+        driver.set_window_size(WINDOW_WIDTH, WINDOW_HEIGHT)
+    return driver
+
+
+def _make_cancellable(driver):
+    """
+    Check for cancellation before every WebDriver command, so every wait and click in the flow
+    stops within one poll of a cancel, and kill the browser on cancel so a command already in
+    flight fails immediately instead of running to its timeout.
+    """
+    execute = driver.execute
+
+    def cancellable_execute(driver_command, params=None):
+        if driver_command != Command.QUIT:
+            check_cancelled()
+        return execute(driver_command, params)
+
+    driver.execute = cancellable_execute
+    on_cancel(lambda: browser_watchdog.kill(driver.gst_root_pid, 'cancelled'))
+
+
+def _close_browser(driver):
+    root_pid = getattr(driver, 'gst_root_pid', None)
+    if root_pid is not None:
+        browser_watchdog.untrack(root_pid)
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.warning(f"⚠️ Could not quit browser cleanly: {e}")
+    finally:
+        profile_dir = getattr(driver, 'gst_profile_dir', None)
+        if profile_dir:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+
+
+def _release_resources(driver):
+    """Profile copy and display of a browser whose processes are already gone"""
+    profile_dir = getattr(driver, 'gst_profile_dir', None)
+    if profile_dir:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+    display = getattr(driver, 'gst_display', None)
+    if display is not None:
+        display_allocator.release(display)
+
+
+def quit_driver(driver):
+    """Quit the browser, remove its per-run profile copy and stop its display; never raises"""
+    _close_browser(driver)
+    display = getattr(driver, 'gst_display', None)
+    if display is not None:
+        display_allocator.release(display)
+
+
+def keep_for_review(driver):
+    """
+    Leave a visible browser open. One on its own display is closed when the review hold
+    expires; any browser is killed by the watchdog once it has been idle too long.
+    """
+    root_pid = getattr(driver, 'gst_root_pid', None)
+    if root_pid is not None:
+        browser_watchdog.job_finished(root_pid)
+    display = getattr(driver, 'gst_display', None)
+    if display is not None:
+        display_allocator.hold_for_review(display, on_expire=lambda: _close_browser(driver))
+
+
+__all__ = ['create_driver', 'quit_driver', 'keep_for_review', 'browser_profile_mode', 'is_headless',
+           'lean_profile_template', 'blocked_hosts']
@@ -0,0 +1,305 @@
+# File: browser_watchdog.py
+#
+# Browser process watchdog
+# Every browser started for a job is registered with its geckodriver pid. A background thread
+# samples the whole process tree (geckodriver, Firefox and its content processes) from /proc
+# and kills browsers that exceed the memory ceiling, sit idle too long after their job ended,
+# or whose job thread is gone. Untracked geckodriver/marionette Firefox processes left behind
+# by a previous server are reaped as orphans. Processes the watchdog kills are waited on so
+# they don't linger as zombies; collecting every zombie in a container is left to an init
+# process (docker run --init). Reclaimed memory is logged and counted.
+
+import os
+import signal
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from logger import current_job_id, logger
+
+WATCHDOG_INTERVAL = float(os.getenv('GST_WATCHDOG_INTERVAL', '15'))
+BROWSER_MAX_RSS_MB = int(os.getenv('GST_BROWSER_MAX_RSS_MB', '2048'))
+BROWSER_IDLE_MINUTES = float(os.getenv('GST_BROWSER_IDLE_MINUTES', '20'))
+# CPU seconds per interval below which a finished job's browser counts as idle
+IDLE_CPU_SECONDS = float(os.getenv('GST_BROWSER_IDLE_CPU_SECONDS', '0.5'))
+REAP_ORPHANS = os.getenv('GST_REAP_ORPHANS', '1').lower() not in ('0', 'false', 'no')
+ORPHAN_GRACE_SECONDS = 60
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def _read_stat(pid: int) -> Optional[dict]:
+    """ppid, comm, cpu seconds and start time of one process from /proc, or None if it is gone"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            raw = f.read()
+        with open(f'/proc/{pid}/statm') as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    # comm is wrapped in parentheses and may itself contain spaces
+    comm = raw[raw.index('(') + 1:raw.rindex(')')]
+    fields = raw[raw.rindex(')') + 2:].split()
+    return {
+        'pid': pid,
+        'comm': comm,
+        'state': fields[0],
+        'ppid': int(fields[1]),
+        'cpu': (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS,
+        'start': int(fields[19]) / _CLOCK_TICKS,
+        'rss': rss_pages * _PAGE_SIZE,
+    }
+
+
+def _read_cmdline(pid: int) -> List[str]:
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            return [part.decode(errors='replace') for part in f.read().split(b'\0') if part]
+    except OSError:
+        return []
+
+
+def _snapshot() -> Dict[int, dict]:
+    processes = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            stat = _read_stat(int(entry))
+            # Zombies hold no memory and can't be killed again
+            if stat is not None and stat['state'] != 'Z':
+                processes[stat['pid']] = stat
+    return processes
+
+
+def _tree(root: int, processes: Dict[int, dict]) -> List[int]:
+    children: Dict[int, List[int]] = {}
+    for stat in processes.values():
+        children.setdefault(stat['ppid'], []).append(stat['pid'])
+    pids, pending = [], [root]
+    while pending:
+        pid = pending.pop()
+        if pid in processes:
+            pids.append(pid)
+            pending.extend(children.get(pid, []))
+    return pids
+
+
+def _uptime() -> float:
+    try:
+        with open('/proc/uptime') as f:
+            return float(f.read().split()[0])
+    except OSError:
+        return 0.0
+
+
+def _kill_tree(pids: List[int], grace: float = 3.0):
+    """SIGTERM the tree, then SIGKILL whatever is still alive after the grace period"""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        alive = []
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+                alive.append(pid)
+            except (ProcessLookupError, PermissionError):
+                pass
+        if not alive or sig == signal.SIGKILL:
+            return
+        deadline = time.monotonic() + grace
+        while time.monotonic() < deadline:
+            # Zombies are already dead; they only wait for their parent to collect them
+            if not any((_read_stat(pid) or {}).get('state', 'Z') != 'Z' for pid in alive):
+                return
+            time.sleep(0.1)
+        pids = alive
+
+
+def _wait_children(pids: List[int], timeout: float = 2.0):
+    """
+    Collect the exit status of killed processes that are our own children (geckodriver), so
+    they don't linger as zombies. Processes with another parent raise ChildProcessError and are
+    left to it.
+    """
+    pending = set(pids)
+    deadline = time.monotonic() + timeout
+    while pending:
+        for pid in list(pending):
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                    pending.discard(pid)
+            except ChildProcessError:
+                pending.discard(pid)
+        if not pending or time.monotonic() >= deadline:
+            return
+        time.sleep(0.05)
+
+
+class TrackedBrowser:
+    def __init__(self, job_id: Optional[str], root_pid: int, cleanup: Optional[Callable[[], None]]):
+        self.job_id = job_id
+        self.root_pid = root_pid
+        self.cleanup = cleanup
+        self.thread = threading.current_thread()
+        self.registered_at = time.time()
+        self.job_finished_at: Optional[float] = None
+        self.idle_since: Optional[float] = None
+        self.last_cpu: Optional[float] = None
+        self.rss = 0
+        self.peak_rss = 0
+
+
+class BrowserWatchdog:
+    """Samples tracked browser trees and reaps the ones that are too big, idle or abandoned"""
+
+    def __init__(self, interval: float = WATCHDOG_INTERVAL, max_rss_mb: int = BROWSER_MAX_RSS_MB,
+                 idle_minutes: float = BROWSER_IDLE_MINUTES, reap_orphans: bool = REAP_ORPHANS):
+        self.interval = interval
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.idle_seconds = idle_minutes * 60
+        self.reap_orphans = reap_orphans
+        self.enabled = os.path.isdir('/proc')
+        self._browsers: Dict[int, TrackedBrowser] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.reaped: Dict[str, int] = {}
+        self.reclaimed_bytes = 0
+        # Set by the app: job_id -> whether that job is still queued or running
+        self.job_active: Optional[Callable[[str], bool]] = None
+
+    def start(self):
+        """Start sampling (also reaps orphans left by a previous server); idempotent"""
+        if self._thread is None and self.enabled:
+            self._thread = threading.Thread(target=self._loop, name='gst-browser-watchdog', daemon=True)
+            self._thread.start()
+            logger.info(f"🐕 Browser watchdog started (every {self.interval:g}s, ceiling {self.max_rss // 2 ** 20} MB, "
+                        f"idle limit {self.idle_seconds / 60:g} min)")
+
+    def track(self, root_pid: int, cleanup: Optional[Callable[[], None]] = None, job_id: Optional[str] = None):
+        """Watch the process tree under root_pid (geckodriver) for the current job"""
+        with self._lock:
+            self._browsers[root_pid] = TrackedBrowser(job_id or current_job_id(), root_pid, cleanup)
+            self.start()
+
+    def job_finished(self, root_pid: int):
+        """The job is done with this browser; from now on it may be reaped once idle"""
+        with self._lock:
+            browser = self._browsers.get(root_pid)
+            if browser is not None:
+                browser.job_finished_at = time.time()
+
+    def untrack(self, root_pid: int):
+        with self._lock:
+            self._browsers.pop(root_pid, None)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning(f"⚠️ Browser watchdog sample failed: {e}")
+
+    def sample(self):
+        processes = _snapshot()
+        now = time.time()
+        with self._lock:
+            browsers = list(self._browsers.values())
+        tracked_pids = set()
+        for browser in browsers:
+            pids = _tree(browser.root_pid, processes)
+            tracked_pids.update(pids)
+            if not pids:
+                # Quit normally (or died on its own) - nothing left to reclaim
+                self.untrack(browser.root_pid)
+                continue
+            browser.rss = sum(processes[pid]['rss'] for pid in pids)
+            browser.peak_rss = max(browser.peak_rss, browser.rss)
+            cpu = sum(processes[pid]['cpu'] for pid in pids)
+            busy = browser.last_cpu is None or cpu - browser.last_cpu > IDLE_CPU_SECONDS
+            browser.last_cpu = cpu
+            if busy or browser.job_finished_at is None:
+                browser.idle_since = None
+            elif browser.idle_since is None:
+                browser.idle_since = max(now, browser.job_finished_at)
+
+            reason = None
+            if self.max_rss and browser.rss > self.max_rss:
+                reason = 'memory'
+            elif browser.idle_since is not None and now - browser.idle_since >= self.idle_seconds:
+                reason = 'idle'
+            elif browser.job_finished_at is None and self._job_dead(browser):
+                reason = 'dead_job'
+            if reason:
+                self._reap(browser, pids, reason)
+
+        if self.reap_orphans:
+            self._reap_orphans(processes, tracked_pids)
+
+    def kill(self, root_pid: int, reason: str) -> bool:
+        """Kill a tracked browser now (e.g. its job was cancelled); False if it isn't tracked"""
+        with self._lock:
+            browser = self._browsers.get(root_pid)
+        if browser is None:
+            return False
+        processes = _snapshot()
+        pids = _tree(root_pid, processes)
+        browser.rss = sum(processes[pid]['rss'] for pid in pids)
+        self._reap(browser, pids, reason)
+        return True
+
+    def _job_dead(self, browser: TrackedBrowser) -> bool:
+        if not browser.thread.is_alive():
+            return True
+        return bool(browser.job_id and self.job_active is not None and not self.job_active(browser.job_id))
+
+    def _reap(self, browser: TrackedBrowser, pids: List[int], reason: str):
+        logger.warning(f"🪓 Killing browser of job {browser.job_id} ({reason}, {browser.rss / 2 ** 20:.0f} MB "
+                       f"in {len(pids)} processes)")
+        _kill_tree(pids)
+        _wait_children(pids)
+        self.untrack(browser.root_pid)
+        self._count(reason, browser.rss)
+        if browser.cleanup is not None:
+            try:
+                browser.cleanup()
+            except Exception as e:
+                logger.warning(f"⚠️ Cleanup after killing browser of job {browser.job_id} failed: {e}")
+
+    def _reap_orphans(self, processes: Dict[int, dict], tracked_pids: set):
+        """Kill geckodriver and WebDriver-controlled Firefox trees whose parent process is gone"""
+        uptime = _uptime()
+        for stat in processes.values():
+            if stat['pid'] in tracked_pids or stat['ppid'] != 1 or uptime - stat['start'] < ORPHAN_GRACE_SECONDS:
+                continue
+            comm = stat['comm']
+            # As pid 1 our own geckodriver children (starting, or never tracked) also have ppid 1,
+            # so only a marionette Firefox whose geckodriver died can be told apart as an orphan
+            if comm == 'geckodriver' and os.getpid() != 1 or (comm.startswith('firefox') and '-marionette' in _read_cmdline(stat['pid'])):
+                pids = _tree(stat['pid'], processes)
+                rss = sum(processes[pid]['rss'] for pid in pids)
+                logger.warning(f"🪓 Reaping orphaned {comm} (pid {stat['pid']}, {rss / 2 ** 20:.0f} MB)")
+                _kill_tree(pids)
+                _wait_children(pids)
+                self._count('orphan', rss)
+
+    def _count(self, reason: str, rss: int):
+        with self._lock:
+            self.reaped[reason] = self.reaped.get(reason, 0) + 1
+            self.reclaimed_bytes += rss
+        logger.info(f"♻️ Reclaimed {rss / 2 ** 20:.0f} MB ({self.reclaimed_bytes / 2 ** 20:.0f} MB since start)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            browsers = list(self._browsers.values())
+            return {
+                'enabled': self.enabled,
+                'tracked': len(browsers),
+                'finished_jobs': sum(1 for browser in browsers if browser.job_finished_at is not None),
+                'rss_mb': round(sum(browser.rss for browser in browsers) / 2 ** 20, 1),
+                'reaped': dict(self.reaped),
+                'reclaimed_mb': round(self.reclaimed_bytes / 2 ** 20, 1),
+            }
+
+
+browser_watchdog = BrowserWatchdog()
+
+__all__ = ['BrowserWatchdog', 'browser_watchdog']
@@ -0,0 +1,127 @@
+# File: cancellation.py
+#
+# Cooperative job cancellation
+# Each job runs inside a cancel scope bound to a contextvar. Long waits (OTP polling, captcha
+# solves, every WebDriver command) call check_cancelled(), and cancel() also runs the job's
+# registered callbacks, e.g. killing its browser so an in-flight WebDriver call fails at once.
+
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+from logger import logger
+
+_current_token: contextvars.ContextVar = contextvars.ContextVar('gst_cancel_token', default=None)
+
+CHECK_INTERVAL = 0.25
+
+
+class JobCancelled(BaseException):
+    """
+    Raised inside a cancelled job. Derives from BaseException (like KeyboardInterrupt) so the
+    flow's many `except Exception` fallbacks don't swallow it and carry on.
+    """
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+        self.cancelled_at: Optional[float] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = 'cancelled') -> bool:
+        """Cancel once; returns False if already cancelled"""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self.cancelled_at = time.time()
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"⚠️ Cancel callback failed: {e}")
+        return True
+
+    def on_cancel(self, callback: Callable[[], None]):
+        """Run callback on cancel (immediately if already cancelled)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def wait(self, timeout: float) -> bool:
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise JobCancelled(self.reason)
+
+
+@contextmanager
+def cancel_scope(token: CancelToken):
+    """Bind token to the current context for the duration of the block"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+
+def check_cancelled():
+    """Raise JobCancelled if the current job has been cancelled; no-op outside a job"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def on_cancel(callback: Callable[[], None]):
+    token = _current_token.get()
+    if token is not None:
+        token.on_cancel(callback)
+
+
+def cancellable_sleep(seconds: float):
+    """time.sleep() that returns early with JobCancelled when the job is cancelled"""
+    token = _current_token.get()
+    if token is None:
+        time.sleep(seconds)
+        return
+    token.wait(seconds)
+    token.raise_if_cancelled()
+
+
+def cancellable_result(future: Future, timeout: Optional[float] = None):
+    """future.result() that gives up (and cancels the future) when the job is cancelled"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    token = _current_token.get()
+    while True:
+        if token is not None and token.cancelled:
+            future.cancel()
+            token.raise_if_cancelled()
+        step = CHECK_INTERVAL if deadline is None else max(0.0, min(CHECK_INTERVAL, deadline - time.monotonic()))
+        try:
+            return future.result(timeout=step)
+        except FutureTimeout:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise
+
+
+__all__ = ['JobCancelled', 'CancelToken', 'cancel_scope', 'current_token', 'check_cancelled', 'on_cancel',
+           'cancellable_sleep', 'cancellable_result']
@@ -0,0 +1,483 @@
+# File: captcha_solver.py
+#
+# Captcha solver backends for the GST registration automation
+# Provides a common solver interface with pooled keep-alive HTTP sessions,
+# per-backend latency/accuracy accounting and a local stand-in for offline runs
+
+import base64
+import contextvars
+import io
+import os
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from dotenv import load_dotenv
+
+from cancellation import CHECK_INTERVAL as CANCEL_CHECK_INTERVAL, CancelToken, check_cancelled
+from governor import portal_governor
+from logger import logger
+from metrics import percentile
+
+# --- Environment Variables for Captcha Backends ---
+load_dotenv()
+TRUECAPTCHA_URL = 'https://api.apitruecaptcha.org/one/gettext'
+TRUECAPTCHA_USER = os.getenv('TRUECAPTCHA_USER')
+TRUECAPTCHA_KEY = os.getenv('TRUECAPTCHA_KEY')
+# Stand-in solver served by otp_server.py, used for offline benchmarking against a mock portal
+CAPTCHA_LOCAL_URL = os.getenv('CAPTCHA_LOCAL_URL', "http://127.0.0.1:3000/solve-captcha")
+CAPTCHA_BACKEND = os.getenv('CAPTCHA_BACKEND', 'truecaptcha')
+CAPTCHA_POOL_SIZE = int(os.getenv('CAPTCHA_POOL_SIZE', '4'))
+# Hedging: if the primary backend is slower than its P90, race it against these backends
+CAPTCHA_HEDGE = os.getenv('CAPTCHA_HEDGE', 'false').lower() in ('1', 'true', 'yes')
+CAPTCHA_HEDGE_BACKENDS = [b.strip() for b in os.getenv('CAPTCHA_HEDGE_BACKENDS', 'ocr').split(',') if b.strip()]
+CAPTCHA_HEDGE_AFTER = float(os.getenv('CAPTCHA_HEDGE_AFTER', '15'))  # Used until the primary has enough samples
+CAPTCHA_HEDGE_MIN_SAMPLES = int(os.getenv('CAPTCHA_HEDGE_MIN_SAMPLES', '20'))
+
+
+class CaptchaSolverError(Exception):
+    pass
+
+
+class SolverStats:
+    """Thread-safe latency and accuracy accounting for a single solver backend"""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)  # Successful solve latencies in seconds
+        self.solved = 0
+        self.failed = 0
+        self.accepted = 0
+        self.rejected = 0
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.solved += 1
+            self._latencies.append(latency)
+
+    def record_failure(self):
+        with self._lock:
+            self.failed += 1
+
+    def record_outcome(self, accepted: bool):
+        """Record whether the portal accepted an answer produced by this backend"""
+        with self._lock:
+            if accepted:
+                self.accepted += 1
+            else:
+                self.rejected += 1
+
+    def mean_above(self, threshold: float) -> Optional[float]:
+        """Mean of the recorded latencies longer than threshold (how long a slow solve usually takes)"""
+        with self._lock:
+            slower = [latency for latency in self._latencies if latency > threshold]
+        return sum(slower) / len(slower) if slower else None
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._latencies)
+        return percentile(samples, pct)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = list(self._latencies)
+            judged = self.accepted + self.rejected
+            snapshot = {
+                'solved': self.solved,
+                'failed': self.failed,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'accuracy': round(self.accepted / judged, 3) if judged else None,
+                'mean_latency': round(sum(samples) / len(samples), 3) if samples else None,
+            }
+        for pct in (50, 90, 99):
+            value = self.percentile(pct)
+            snapshot[f'p{pct}_latency'] = round(value, 3) if value is not None else None
+        return snapshot
+
+
+class CaptchaSolver:
+    """Base class for captcha backends. Subclasses implement _solve()."""
+
+    name = 'base'
+    # Paid backends with a request quota; their solves go through the shared captcha rate limit
+    quota_limited = False
+
+    def __init__(self):
+        self.stats = SolverStats()
+
+    def is_configured(self) -> bool:
+        return True
+
+    def solve(self, image_b64: str) -> str:
+        """Solve a base64-encoded captcha image and return the answer text."""
+        return self.solve_with_backend(image_b64)[0]
+
+    def solve_with_backend(self, image_b64: str, abort: Optional[CancelToken] = None) -> Tuple[str, 'CaptchaSolver']:
+        """
+        Solve and also return the backend that produced the answer, for accuracy reporting.
+        Cancelling `abort` stops an in-flight HTTP request (used for hedging losers).
+        """
+        if self.quota_limited:
+            portal_governor.captcha.acquire()
+        if abort is not None and abort.cancelled:
+            raise CaptchaSolverError(f"{self.name} solve aborted before it was sent")
+        start = time.monotonic()
+        _request_abort.token = abort
+        try:
+            captcha_text = self._solve(image_b64)
+        except Exception as e:
+            if abort is not None and abort.cancelled:
+                # Aborted on purpose; not a backend failure
+                raise CaptchaSolverError(f"{self.name} solve aborted")
+            self.stats.record_failure()
+            if isinstance(e, CaptchaSolverError):
+                raise
+            raise CaptchaSolverError(f"{self.name} solver failed: {type(e).__name__}: {e}")
+        finally:
+            _request_abort.token = None
+
+        if not captcha_text:
+            self.stats.record_failure()
+            raise CaptchaSolverError(f"{self.name} solver returned an empty answer")
+
+        self.stats.record_success(time.monotonic() - start)
+        return captcha_text, self
+
+    def report_outcome(self, accepted: bool):
+        self.stats.record_outcome(accepted)
+
+    def _solve(self, image_b64: str) -> str:
+        raise NotImplementedError
+
+
+# Abort token of the solve running on this thread, picked up by the connection sending its request
+_request_abort = threading.local()
+
+
+def _abortable(connection_cls):
+    class AbortableConnection(connection_cls):
+        """Registers itself with the thread's abort token so the request can be cut off mid-flight"""
+
+        _abort_token = None
+
+        def request(self, *args, **kwargs):
+            token = self._abort_token = getattr(_request_abort, 'token', None)
+            if token is not None:
+                token.on_cancel(lambda: self._shutdown_socket(token))
+            return super().request(*args, **kwargs)
+
+        def _shutdown_socket(self, token):
+            # Unblocks the thread waiting on the response; urllib3 then discards the connection.
+            # A pooled connection already serving another solve is left alone.
+            sock = self.sock
+            if sock is not None and self._abort_token is token:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    return AbortableConnection
+
+
+class _AbortableHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _abortable(HTTPConnection)
+
+
+class _AbortableHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _abortable(HTTPSConnection)
+
+
+class _AbortableAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _AbortableHTTPPool, 'https': _AbortableHTTPSPool}
+
+
+def _build_session(pool_size: int) -> requests.Session:
+    """Keep-alive session so repeated solves reuse TLS connections"""
+    session = requests.Session()
+    adapter = _AbortableAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class HttpCaptchaSolver(CaptchaSolver):
+    """Solver speaking the TrueCaptcha JSON protocol over a pooled session"""
+
+    name = 'http'
+
+    def __init__(self, url: str, timeout: float = 70, pool_size: int = CAPTCHA_POOL_SIZE):
+        super().__init__()
+        self.url = url
+        self.timeout = timeout
+        self.session = _build_session(pool_size)
+
+    def _payload(self, image_b64: str) -> dict:
+        return {'data': image_b64, 'numeric': True, 'mode': 'human'}
+
+    def _solve(self, image_b64: str) -> str:
+        try:
+            response = self.session.post(self.url, json=self._payload(image_b64), timeout=self.timeout)
+            response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
+            result = response.json()
+        except requests.exceptions.RequestException as req_err:
+            raise CaptchaSolverError(f"Network or API error from {self.name} solver: {req_err}")
+
+        if 'result' not in result or not result['result']:
+            raise CaptchaSolverError(f"Failed to get CAPTCHA result from {self.name} solver. Response: {result}")
+        return result['result'].strip()
+
+
+class TrueCaptchaSolver(HttpCaptchaSolver):
+    """TrueCaptcha API backend"""
+
+    name = 'truecaptcha'
+    quota_limited = True
+
+    def __init__(self, user: Optional[str] = TRUECAPTCHA_USER, key: Optional[str] = TRUECAPTCHA_KEY, **kwargs):
+        super().__init__(TRUECAPTCHA_URL, **kwargs)
+        self.user = user
+        self.key = key
+
+    def is_configured(self) -> bool:
+        return bool(self.user and self.key)
+
+    def _payload(self, image_b64: str) -> dict:
+        payload = super()._payload(image_b64)
+        payload.update({'userid': self.user, 'apikey': self.key})
+        return payload
+
+
+class LocalCaptchaSolver(HttpCaptchaSolver):
+    """Local stand-in backend (see /solve-captcha in otp_server.py)"""
+
+    name = 'local'
+
+    def __init__(self, url: str = CAPTCHA_LOCAL_URL, timeout: float = 10, **kwargs):
+        super().__init__(url, timeout=timeout, **kwargs)
+
+
+class OcrCaptchaSolver(CaptchaSolver):
+    """Local Tesseract OCR backend (optional: pytesseract, Pillow and the tesseract binary)"""
+
+    name = 'ocr'
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import pytesseract
+            from PIL import Image
+            self._pytesseract, self._image = pytesseract, Image
+        except ImportError:
+            self._pytesseract, self._image = None, None
+
+    def is_configured(self) -> bool:
+        return self._pytesseract is not None
+
+    def _solve(self, image_b64: str) -> str:
+        if not self.is_configured():
+            raise CaptchaSolverError("OCR solver needs pytesseract and Pillow installed")
+        image = self._image.open(io.BytesIO(base64.b64decode(image_b64))).convert('L')
+        # Portal captchas are numeric, so restrict OCR to a single line of digits
+        text = self._pytesseract.image_to_string(image, config='--psm 7 -c tessedit_char_whitelist=0123456789')
+        return ''.join(ch for ch in text if ch.isdigit())
+
+
+class HedgeStats:
+    """Counts how often hedges fire and how much tail latency they save"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.solves = 0
+        self.hedges_fired = 0
+        self.fast_failures = 0  # Primary errored before its P90, so the hedge fired at once
+        self.hedge_wins = 0
+        self.losers_aborted = 0
+        self._savings: List[float] = []
+
+    def record_solve(self, hedged: bool, fast_failure: bool = False):
+        with self._lock:
+            self.solves += 1
+            if hedged:
+                self.hedges_fired += 1
+            if fast_failure:
+                self.fast_failures += 1
+
+    def record_hedge_win(self, saved: Optional[float]):
+        """saved: estimated seconds the aborted primary would still have taken (None if unknown)"""
+        with self._lock:
+            self.hedge_wins += 1
+            if saved is not None:
+                self._savings.append(saved)
+
+    def record_aborted(self, count: int):
+        with self._lock:
+            self.losers_aborted += count
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'solves': self.solves,
+                'hedges_fired': self.hedges_fired,
+                'hedge_rate': round(self.hedges_fired / self.solves, 3) if self.solves else None,
+                'fast_failures': self.fast_failures,
+                'hedge_wins': self.hedge_wins,
+                'losers_aborted': self.losers_aborted,
+                'tail_seconds_saved': round(sum(self._savings), 3),
+                'mean_seconds_saved': round(sum(self._savings) / len(self._savings), 3) if self._savings else None,
+            }
+
+
+class HedgedCaptchaSolver(CaptchaSolver):
+    """
+    Sends the image to the primary backend and, if it has not answered within its
+    P90 latency, to the hedge backends as well. The first valid answer wins and the
+    remaining requests are abandoned.
+    """
+
+    name = 'hedged'
+
+    def __init__(self, primary: CaptchaSolver, hedges: List[CaptchaSolver],
+                 default_hedge_after: float = CAPTCHA_HEDGE_AFTER, min_samples: int = CAPTCHA_HEDGE_MIN_SAMPLES):
+        super().__init__()
+        self.primary = primary
+        self.hedges = [solver for solver in hedges if solver.is_configured()]
+        self.default_hedge_after = default_hedge_after
+        self.min_samples = min_samples
+        self.hedge_stats = HedgeStats()
+        self._executor = ThreadPoolExecutor(max_workers=4 * (1 + len(self.hedges)), thread_name_prefix="captcha-hedge")
+
+    def is_configured(self) -> bool:
+        return self.primary.is_configured()
+
+    def hedge_after(self) -> float:
+        """Seconds to wait for the primary before hedging: its P90 once enough samples exist"""
+        if self.primary.stats.solved >= self.min_samples:
+            p90 = self.primary.stats.percentile(90)
+            if p90 is not None:
+                return p90
+        return self.default_hedge_after
+
+    def solve_with_backend(self, image_b64: str, abort: Optional[CancelToken] = None) -> Tuple[str, CaptchaSolver]:
+        start = time.monotonic()
+        hedge_at = start + self.hedge_after()
+        # Cancelled once the race is settled (or the job is cancelled), cutting off every loser
+        losers = CancelToken()
+        if abort is not None:
+            abort.on_cancel(lambda: losers.cancel('outer solve aborted'))
+        submit = lambda solver: self._executor.submit(
+            contextvars.copy_context().run, solver.solve_with_backend, image_b64, losers)
+        futures = {submit(self.primary): self.primary}
+        hedged = fast_failure = False
+        errors = []
+        try:
+            while True:
+                if not hedged and self.hedges and (fast_failure or time.monotonic() >= hedge_at):
+                    hedged = True
+                    reason = 'failed' if fast_failure else f'slower than {self.hedge_after():.1f}s'
+                    logger.info(f"🧩 {self.primary.name} {reason}, hedging with {[s.name for s in self.hedges]}")
+                    for solver in self.hedges:
+                        futures[submit(solver)] = solver
+                if not futures:
+                    break
+                check_cancelled()
+                timeout = CANCEL_CHECK_INTERVAL if hedged else max(0.0, min(CANCEL_CHECK_INTERVAL, hedge_at - time.monotonic()))
+                done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    solver = futures.pop(future)
+                    try:
+                        captcha_text, backend = future.result()
+                    except Exception as e:
+                        errors.append(f"{solver.name}: {e}")
+                        if solver is self.primary and not hedged:
+                            # Don't wait out the P90 for a backend that has already given up
+                            fast_failure = True
+                        continue
+
+                    elapsed = time.monotonic() - start
+                    if backend is not self.primary:
+                        primary_pending = any(other is self.primary for other in futures.values())
+                        expected = self.primary.stats.mean_above(elapsed) if primary_pending else None
+                        self.hedge_stats.record_hedge_win(expected - elapsed if expected is not None else None)
+                        logger.info(f"🧩 Hedge backend '{backend.name}' answered first after {elapsed:.1f}s")
+                    self.stats.record_success(elapsed)
+                    return captcha_text, backend
+        finally:
+            pending = sum(1 for future in futures if not future.done())
+            losers.cancel('hedge settled')
+            if pending:
+                self.hedge_stats.record_aborted(pending)
+            self.hedge_stats.record_solve(hedged, fast_failure)
+
+        self.stats.record_failure()
+        raise CaptchaSolverError(f"All captcha backends failed: {errors}")
+
+    def report_outcome(self, accepted: bool):
+        self.stats.record_outcome(accepted)
+
+
+SOLVER_BACKENDS = {
+    'truecaptcha': TrueCaptchaSolver,
+    'local': LocalCaptchaSolver,
+    'ocr': OcrCaptchaSolver,
+}
+
+_solvers: Dict[str, CaptchaSolver] = {}
+_solvers_lock = threading.Lock()
+
+
+def get_captcha_solver(backend: Optional[str] = None) -> CaptchaSolver:
+    """Return the shared solver for a backend (CAPTCHA_BACKEND by default, hedged if CAPTCHA_HEDGE is set)"""
+    if backend is None and CAPTCHA_HEDGE:
+        return _get_hedged_solver()
+    backend = (backend or CAPTCHA_BACKEND).strip().lower()
+    with _solvers_lock:
+        if backend not in _solvers:
+            if backend not in SOLVER_BACKENDS:
+                raise CaptchaSolverError(f"Unknown captcha backend '{backend}'. Available: {sorted(SOLVER_BACKENDS)}")
+            _solvers[backend] = SOLVER_BACKENDS[backend]()
+            logger.info(f"🧩 Captcha solver backend '{backend}' initialized")
+        return _solvers[backend]
+
+
+def _get_hedged_solver() -> CaptchaSolver:
+    primary = get_captcha_solver(CAPTCHA_BACKEND)
+    hedges = [get_captcha_solver(name) for name in CAPTCHA_HEDGE_BACKENDS if name != primary.name]
+    with _solvers_lock:
+        if 'hedged' not in _solvers:
+            _solvers['hedged'] = HedgedCaptchaSolver(primary, hedges)
+            logger.info(f"🧩 Captcha hedging enabled: {primary.name} -> {[s.name for s in _solvers['hedged'].hedges]}")
+        return _solvers['hedged']
+
+
+def solver_stats() -> Dict[str, dict]:
+    """Latency/accuracy snapshot for every backend used so far"""
+    with _solvers_lock:
+        solvers = dict(_solvers)
+    stats = {name: solver.stats.snapshot() for name, solver in solvers.items()}
+    if 'hedged' in solvers:
+        stats['hedged'].update(solvers['hedged'].hedge_stats.snapshot())
+    return stats
+
+
+__all__ = [
+    'CaptchaSolver',
+    'CaptchaSolverError',
+    'HedgedCaptchaSolver',
+    'HttpCaptchaSolver',
+    'LocalCaptchaSolver',
+    'OcrCaptchaSolver',
+    'SolverStats',
+    'TrueCaptchaSolver',
+    'get_captcha_solver',
+    'solver_stats',
+]
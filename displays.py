@@ -0,0 +1,239 @@
+# File: displays.py
+#
+# Virtual display allocation for visible browsers
+# Each visible run gets its own Xvfb display, started on demand and stopped when the run's
+# browser is closed, so concurrent browsers never compete for window focus on one shared
+# :99. Browsers left open for review keep their display until the review hold expires.
+# When every slot is taken by a running job, acquire() waits for one to be released.
+
+import atexit
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Dict, Optional
+
+from cancellation import CHECK_INTERVAL, check_cancelled
+from logger import logger
+from metrics import record_wait
+
+DISPLAY_BASE = int(os.getenv('GST_DISPLAY_BASE', '100'))
+MAX_DISPLAYS = int(os.getenv('GST_MAX_DISPLAYS', '8'))
+DISPLAY_SCREEN = os.getenv('GST_DISPLAY_SCREEN', '1920x1080x24')
+DISPLAY_START_TIMEOUT = float(os.getenv('GST_DISPLAY_START_TIMEOUT', '10'))
+REVIEW_HOLD_MINUTES = float(os.getenv('GST_REVIEW_HOLD_MINUTES', '30'))
+# How long a run waits for a display slot held by other running jobs before failing
+DISPLAY_WAIT_SECONDS = float(os.getenv('GST_DISPLAY_WAIT_SECONDS', '600'))
+PER_JOB_DISPLAY = os.getenv('GST_PER_JOB_DISPLAY', '1').lower() not in ('0', 'false', 'no')
+
+
+class DisplayError(RuntimeError):
+    pass
+
+
+class VirtualDisplay:
+    """One running Xvfb server"""
+
+    def __init__(self, number: int, process: subprocess.Popen):
+        self.number = number
+        self.process = process
+        self.started_at = time.time()
+        self.review_until: Optional[float] = None
+        self.on_expire = None
+
+    @property
+    def name(self) -> str:
+        return f':{self.number}'
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # A zombie still answers signal 0 but no longer holds the display
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except (OSError, IndexError):
+        return True
+
+
+class DisplayAllocator:
+    """Hands out numbered Xvfb displays, at most max_displays at once"""
+
+    def __init__(self, base: int = DISPLAY_BASE, max_displays: int = MAX_DISPLAYS, screen: str = DISPLAY_SCREEN):
+        self.base = base
+        self.max_displays = max(1, max_displays)
+        self.screen = screen
+        self.xvfb = shutil.which('Xvfb')
+        self._displays: Dict[int, VirtualDisplay] = {}
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._reaper: Optional[threading.Thread] = None
+
+    @property
+    def available(self) -> bool:
+        return self.xvfb is not None
+
+    def _free_number(self) -> Optional[int]:
+        for number in range(self.base, self.base + self.max_displays):
+            # Skip numbers held by us or by a live X server we didn't start
+            if number not in self._displays and not self._locked_by_live_server(number):
+                return number
+        return None
+
+    @staticmethod
+    def _locked_by_live_server(number: int) -> bool:
+        """True if display `number` has a lock file whose X server is still running; stale locks are removed"""
+        lock_path = f'/tmp/.X{number}-lock'
+        try:
+            with open(lock_path) as f:
+                pid = int(f.read().strip())
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError):
+            return True  # Unreadable: leave the number alone
+        if _pid_alive(pid):
+            return True
+        # Left behind by an Xvfb that was SIGKILLed (OOM killer, watchdog) and never cleaned up
+        logger.warning(f"🧹 Removing stale lock for display :{number} (pid {pid} is gone)")
+        for path in (lock_path, f'/tmp/.X11-unix/X{number}'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"⚠️ Could not remove {path}: {e}")
+                return True
+        return False
+
+    def _oldest_in_review(self) -> Optional[VirtualDisplay]:
+        held = [display for display in self._displays.values() if display.review_until is not None]
+        return min(held, key=lambda display: display.review_until) if held else None
+
+    def acquire(self, timeout: float = DISPLAY_WAIT_SECONDS) -> VirtualDisplay:
+        """
+        Start a new Xvfb and wait for its socket. When all slots are used the oldest review hold
+        is evicted; if every slot belongs to a running job, waits (cancellably) up to `timeout`
+        seconds for one to be released.
+        """
+        if not self.available:
+            raise DisplayError('Xvfb is not installed')
+        started = time.monotonic()
+        waiting = False
+        while True:
+            with self._released:
+                number = self._free_number()
+                if number is not None:
+                    process = subprocess.Popen(
+                        [self.xvfb, f':{number}', '-screen', '0', self.screen, '-nolisten', 'tcp', '-ac', '-noreset'],
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                    )
+                    display = self._displays[number] = VirtualDisplay(number, process)
+                    break
+                evicted = self._oldest_in_review()
+                if evicted is None:
+                    if time.monotonic() - started >= timeout:
+                        raise DisplayError(f'all {self.max_displays} virtual displays stayed in use for {timeout:g}s')
+                    if not waiting:
+                        waiting = True
+                        logger.info(f"🚦 All {self.max_displays} virtual displays are in use, waiting for one to be released")
+                    self._released.wait(CHECK_INTERVAL)
+                    check_cancelled()
+                    continue
+                del self._displays[evicted.number]
+            # Stopping Xvfb removes its lock file, so the slot is free on the next pass
+            logger.warning(f"⚠️ Display slots exhausted - closing review browser on {evicted.name}")
+            self._stop(evicted)
+
+        if waiting:
+            record_wait('display', time.monotonic() - started)
+        deadline = time.monotonic() + DISPLAY_START_TIMEOUT
+        while not os.path.exists(f'/tmp/.X11-unix/X{number}'):
+            if not display.alive or time.monotonic() > deadline:
+                self.release(display)
+                raise DisplayError(f'Xvfb did not start on {display.name}')
+            time.sleep(0.05)
+        logger.info(f"📺 Started virtual display {display.name}")
+        return display
+
+    def release(self, display: VirtualDisplay):
+        with self._lock:
+            tracked = self._displays.get(display.number) is display
+            if tracked:
+                del self._displays[display.number]
+        if tracked or display.alive:
+            self._stop(display)
+        with self._released:
+            self._released.notify_all()
+
+    def _stop(self, display: VirtualDisplay):
+        on_expire, display.on_expire = display.on_expire, None
+        if on_expire is not None:
+            try:
+                on_expire()
+            except Exception as e:
+                logger.warning(f"⚠️ Cleanup for display {display.name} failed: {e}")
+        if display.alive:
+            display.process.terminate()
+            try:
+                display.process.wait(5)
+            except subprocess.TimeoutExpired:
+                display.process.kill()
+        logger.info(f"📴 Stopped virtual display {display.name}")
+
+    def hold_for_review(self, display: VirtualDisplay, on_expire=None, minutes: float = REVIEW_HOLD_MINUTES):
+        """Keep the display (and its browser) up for review; on_expire runs before it is stopped"""
+        display.review_until = time.time() + minutes * 60
+        display.on_expire = on_expire
+        logger.info(f"👀 Browser kept open on display {display.name} for {minutes:g} minutes of review")
+        with self._lock:
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, name='gst-display-reaper', daemon=True)
+                self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(30)
+            now = time.time()
+            with self._lock:
+                expired = [display for display in self._displays.values()
+                           if (display.review_until is not None and display.review_until <= now) or not display.alive]
+                for display in expired:
+                    del self._displays[display.number]
+            for display in expired:
+                self._stop(display)
+            if expired:
+                with self._released:
+                    self._released.notify_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            displays = list(self._displays.values())
+        return {
+            'available': self.available,
+            'in_use': sum(1 for display in displays if display.review_until is None),
+            'in_review': sum(1 for display in displays if display.review_until is not None),
+            'capacity': self.max_displays,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            displays = list(self._displays.values())
+            self._displays.clear()
+        for display in displays:
+            self._stop(display)
+
+
+display_allocator = DisplayAllocator()
+atexit.register(display_allocator.shutdown)
+
+__all__ = ['DisplayAllocator', 'DisplayError', 'VirtualDisplay', 'display_allocator', 'PER_JOB_DISPLAY']
@@ -6,13 +6,26 @@ echo "🚀 Starting GST Automation API in Docker..."
 # Create necessary directories
 mkdir -p /app/logs /app/uploads /app/downloads
 
-# Start Xvfb for headless browser display
-echo "📺 Starting virtual display..."
-Xvfb :99 -screen 0 1920x1080x24 -ac +extension GLX +render -noreset &
-export DISPLAY=:99
-
-# Wait for Xvfb to start
-sleep 3
+if [ "${GST_BROWSER_MODE:-visible}" = "headless" ]; then
+    # Headless Firefox renders without an X server
+    echo "🕶️ Headless browser mode - skipping virtual display"
+    unset DISPLAY
+elif [ "${GST_PER_JOB_DISPLAY:-1}" != "0" ]; then
+    # The API starts a separate Xvfb (:100 and up) for each visible browser
+    echo "📺 Virtual displays will be started per job"
+    unset DISPLAY
+else
+    # Start one shared Xvfb for the visible browser
+    echo "📺 Starting virtual display..."
+    Xvfb :99 -screen 0 1920x1080x24 -ac +extension GLX +render -noreset &
+    export DISPLAY=:99
+
+    # Wait for the X socket instead of a fixed sleep (up to 5s)
+    for _ in $(seq 1 50); do
+        [ -S /tmp/.X11-unix/X99 ] && break
+        sleep 0.1
+    done
+fi
 
 # Check if Firefox is accessible
 echo "🦊 Checking Firefox installation..."
@@ -29,7 +42,8 @@ chmod -R 755 /app/logs 2>/dev/null || true
 echo "🌐 Environment Information:"
 echo "   - Python version: $(python --version)"
 echo "   - Working directory: $(pwd)"
-echo "   - Display: $DISPLAY"
+echo "   - Browser mode: ${GST_BROWSER_MODE:-visible}"
+echo "   - Display: ${DISPLAY:-none}"
 echo "   - Timezone: ${TZ:-UTC}"
 
 # Health check for dependencies
@@ -0,0 +1,356 @@
+# File: documents.py
+#
+# Document preprocessing for GST uploads
+# Every file referenced by a config is checked and, where needed, recompressed or shrunk to the
+# portal limits in a process pool before the browser starts. The browser stage only ever sees
+# ready-to-upload paths.
+
+import copy
+import hashlib
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from logger import logger
+
+DOCUMENT_CACHE_DIR = os.getenv('GST_DOCUMENT_CACHE_DIR', os.path.join('uploads', '.doc_cache'))
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv('GST_DOCUMENT_CACHE_MB', '512')) * 1024 * 1024
+# Entries used this recently are never evicted, so a queued job's prepared paths stay valid
+DOCUMENT_CACHE_MIN_AGE = float(os.getenv('GST_DOCUMENT_CACHE_MIN_AGE', '3600'))
+DOCUMENT_WORKERS = int(os.getenv('GST_DOCUMENT_WORKERS', str(min(4, os.cpu_count() or 1))))
+PHOTO_MAX_BYTES = int(os.getenv('GST_PHOTO_MAX_KB', '100')) * 1024
+DOCUMENT_MAX_BYTES = int(os.getenv('GST_DOCUMENT_MAX_KB', '1024')) * 1024
+GHOSTSCRIPT = os.getenv('GST_GHOSTSCRIPT', 'gs')
+
+# Portal rules per upload kind: accepted formats, size limit and the longest image side we keep
+DOCUMENT_PROFILES = {
+    'photo': {'formats': ('jpeg', 'png'), 'max_bytes': PHOTO_MAX_BYTES, 'max_side': 800},
+    'document': {'formats': ('pdf', 'jpeg', 'png'), 'max_bytes': DOCUMENT_MAX_BYTES, 'max_side': 2000},
+}
+
+# Where uploads live in a config: (section, field, kind); list sections apply to every entry
+DOCUMENT_FIELDS = (
+    ('business_details', 'proof_of_consititution', 'document'),
+    ('promoter_partner_details', 'document_upload', 'photo'),
+    ('authorized_signatory_details', 'document_upload1', 'photo'),
+    ('authorized_signatory_details', 'document_upload2', 'document'),
+    ('principal_place_of_business_details', 'document_upload', 'document'),
+    ('principal_place_of_business_details', 'document_upload_2', 'document'),
+)
+
+JPEG_QUALITIES = (85, 75, 65, 55, 45, 35)
+PDF_SETTINGS = ('/ebook', '/screen')
+
+
+class DocumentError(Exception):
+    """Raised when one or more documents cannot be made ready for upload"""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+class DocumentCache:
+    """
+    Content-addressed store of preprocessed documents on the uploads volume.
+    Keys combine the source's SHA-256 with the kind and size limit, so identical files are
+    processed once across jobs and a limit change never serves a stale copy. Recency is the
+    file mtime (touched on every hit), which makes LRU eviction a directory scan.
+    """
+
+    def __init__(self, directory: str = DOCUMENT_CACHE_DIR, max_bytes: int = DOCUMENT_CACHE_MAX_BYTES,
+                 min_age: float = DOCUMENT_CACHE_MIN_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, digest: str, kind: str, extension: str) -> str:
+        max_kb = DOCUMENT_PROFILES[kind]['max_bytes'] // 1024
+        return os.path.join(self.directory, f"{digest}-{kind}-{max_kb}k.{extension}")
+
+    def lookup(self, path: str) -> Optional[str]:
+        """Return the absolute cached path if present, marking it as recently used"""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return os.path.abspath(path)
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.is_file() and not entry.name.endswith('.part'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the cache fits its byte budget"""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            cutoff = time.time() - self.min_age
+            removed = 0
+            for mtime, size, path in entries:
+                if total <= self.max_bytes or mtime > cutoff:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self.evictions += removed
+        if removed:
+            logger.info(f"🧹 Evicted {removed} document(s) from the cache, {total // 1024} KB in use")
+        return removed
+
+    def stats(self) -> Dict:
+        entries = self._entries()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+            }
+
+
+document_cache = DocumentCache()
+
+
+# --- Worker-side processing (runs in the process pool) ---
+
+def _sniff_format(path: str) -> Optional[str]:
+    with open(path, 'rb') as f:
+        head = f.read(8)
+    if head.startswith(b'%PDF'):
+        return 'pdf'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    return None
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _shrink_image(source: str, target: str, max_bytes: int, max_side: int) -> int:
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise RuntimeError("Pillow is required to recompress images (pip install Pillow)")
+
+    with Image.open(source) as opened:
+        image = ImageOps.exif_transpose(opened).convert('RGB')
+    image.thumbnail((max_side, max_side))
+    # Walk down the quality ladder, then the resolution, until the JPEG fits
+    for _ in range(6):
+        for quality in JPEG_QUALITIES:
+            image.save(target, 'JPEG', quality=quality, optimize=True, progressive=True)
+            size = os.path.getsize(target)
+            if size <= max_bytes:
+                return size
+        image = image.resize((max(1, int(image.width * 0.8)), max(1, int(image.height * 0.8))))
+    raise RuntimeError(f"could not compress image below {max_bytes // 1024} KB")
+
+
+def _shrink_pdf(source: str, target: str, max_bytes: int) -> int:
+    if not shutil.which(GHOSTSCRIPT):
+        raise RuntimeError(f"PDF exceeds {max_bytes // 1024} KB and Ghostscript ('{GHOSTSCRIPT}') is not installed")
+    for setting in PDF_SETTINGS:
+        subprocess.run(
+            [GHOSTSCRIPT, '-sDEVICE=pdfwrite', '-dCompatibilityLevel=1.4', f'-dPDFSETTINGS={setting}',
+             '-dNOPAUSE', '-dQUIET', '-dBATCH', f'-sOutputFile={target}', source],
+            check=True, capture_output=True, timeout=120,
+        )
+        size = os.path.getsize(target)
+        if size <= max_bytes:
+            return size
+    raise RuntimeError(f"could not shrink PDF below {max_bytes // 1024} KB")
+
+
+def preprocess_document(source: str, kind: str) -> Dict:
+    """Validate one file and return a result dict whose 'output' path is ready to upload"""
+    profile = DOCUMENT_PROFILES[kind]
+    result = {'source': source, 'kind': kind, 'output': None, 'action': None, 'cache': None, 'error': None}
+    try:
+        if not os.path.isfile(source):
+            raise RuntimeError("file not found")
+        original_size = os.path.getsize(source)
+        result['original_bytes'] = original_size
+        if original_size == 0:
+            raise RuntimeError("file is empty")
+        file_format = _sniff_format(source)
+        if file_format not in profile['formats']:
+            raise RuntimeError(f"unsupported file type '{file_format or 'unknown'}', expected one of {list(profile['formats'])}")
+
+        # Photos must be JPEG; everything else only needs attention when over the limit
+        needs_work = original_size > profile['max_bytes'] or (kind == 'photo' and file_format != 'jpeg')
+        if not needs_work:
+            result.update(output=source, action='unchanged', final_bytes=original_size)
+            return result
+
+        extension = 'pdf' if file_format == 'pdf' else 'jpg'
+        target = document_cache.path_for(_file_digest(source), kind, extension)
+        cached = document_cache.lookup(target)
+        if cached:
+            result.update(output=cached, action='cached', cache='hit', final_bytes=os.path.getsize(cached))
+            return result
+
+        os.makedirs(document_cache.directory, exist_ok=True)
+        # Write beside the target and rename, so concurrent jobs never upload a half-written file
+        partial = f"{target}.{os.getpid()}.part"
+        try:
+            if file_format == 'pdf':
+                final_size = _shrink_pdf(source, partial, profile['max_bytes'])
+                action = 'shrunk'
+            else:
+                final_size = _shrink_image(source, partial, profile['max_bytes'], profile['max_side'])
+                action = 'recompressed'
+            os.replace(partial, target)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        result.update(output=os.path.abspath(target), action=action, cache='miss', final_bytes=final_size)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}" if not isinstance(e, RuntimeError) else str(e)
+    return result
+
+
+# --- Coordinator (runs in the API process) ---
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _get_pool(rebuild: bool = False) -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if rebuild and _POOL is not None:
+            logger.warning("⚠️ Document process pool is broken, starting a new one")
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
+        if _POOL is None:
+            # spawn, not fork: the API process runs Flask and job worker threads
+            _POOL = ProcessPoolExecutor(max_workers=max(1, DOCUMENT_WORKERS),
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _POOL
+
+
+def _document_slots(config: dict) -> Iterator[Tuple[dict, str, str, str]]:
+    """Yield (container, field, kind, label) for every upload path set in the config"""
+    for section, field, kind in DOCUMENT_FIELDS:
+        value = config.get(section)
+        entries = value if isinstance(value, list) else [value]
+        for index, entry in enumerate(entries):
+            if isinstance(entry, dict) and entry.get(field):
+                label = f"{section}[{index}].{field}" if isinstance(value, list) else f"{section}.{field}"
+                yield entry, field, kind, label
+
+
+def submit_documents(config: dict) -> "Future[dict]":
+    """
+    Start preprocessing every document in the config and return a Future of the prepared config.
+    The Future fails with DocumentError listing every file that could not be made ready.
+    """
+    prepared = copy.deepcopy(config)
+    slots = list(_document_slots(prepared))
+    outcome: "Future[dict]" = Future()
+    if not slots:
+        outcome.set_result(prepared)
+        return outcome
+
+    # Each distinct (file, kind) is processed once even if several people share it
+    pending: Dict[Tuple[str, str], Future] = {}
+    pool = _get_pool()
+    for entry, field, kind, _ in slots:
+        key = (entry[field], kind)
+        if key not in pending:
+            try:
+                pending[key] = pool.submit(preprocess_document, entry[field], kind)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM on a huge image); replace the pool rather than failing forever
+                pool = _get_pool(rebuild=True)
+                pending[key] = pool.submit(preprocess_document, entry[field], kind)
+
+    remaining = [len(pending)]
+    lock = threading.Lock()
+
+    def _finish(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        # Hits and misses are counted here, once per distinct file, since workers run in other processes
+        for future in pending.values():
+            if not future.exception() and future.result().get('cache'):
+                document_cache.record(future.result()['cache'] == 'hit')
+        errors = []
+        for entry, field, kind, label in slots:
+            try:
+                result = pending[(entry[field], kind)].result()
+            except Exception as e:
+                result = {'error': f"preprocessing crashed: {e}", 'source': entry[field]}
+            if result.get('error'):
+                errors.append(f"{label}: {result['error']} ({result['source']})")
+                continue
+            if result['action'] == 'cached':
+                logger.info(f"♻️ {label}: reused cached copy ({result['final_bytes'] // 1024} KB)")
+            elif result['action'] != 'unchanged':
+                logger.info(f"🗜️ {label}: {result['action']} {result['original_bytes'] // 1024} KB -> {result['final_bytes'] // 1024} KB")
+            entry[field] = result['output']
+        if any(not future.exception() and future.result().get('cache') == 'miss' for future in pending.values()):
+            document_cache.evict()
+        if errors:
+            outcome.set_exception(DocumentError(errors))
+        else:
+            outcome.set_result(prepared)
+
+    for future in pending.values():
+        future.add_done_callback(_finish)
+    return outcome
+
+
+def prepare_documents(config: dict) -> dict:
+    """Blocking form of submit_documents"""
+    return submit_documents(config).result()
+
+
+def document_cache_stats() -> Dict:
+    return document_cache.stats()
+
+
+__all__ = ['DocumentError', 'DocumentCache', 'DOCUMENT_PROFILES', 'document_cache', 'preprocess_document',
+           'submit_documents', 'prepare_documents', 'document_cache_stats']
@@ -0,0 +1,139 @@
+# File: error_policy.py
+#
+# Per-section error policy for the registration flow
+# Sections that used to log an error and carry on now ask the run's ErrorPolicy what to do:
+# 'continue' (the old behaviour), 'retry' the section, or 'abort' the job right there with a
+# SectionFailed naming the section, page and cause. 'lenient' mode continues everywhere,
+# 'strict' mode aborts everywhere; individual sections can be overridden in either mode.
+
+import os
+from typing import Callable, Dict, List, Optional
+
+from selenium.common.exceptions import ElementNotInteractableException, NoSuchElementException, TimeoutException
+
+from functions import AutomationError
+from logger import logger
+from metrics import record_retry, record_section_error
+
+POLICIES = ('abort', 'retry', 'continue')
+MODES = {'lenient': 'continue', 'strict': 'abort'}
+# Sections run as a single call that can be started over
+RETRYABLE_SECTIONS = ('promoter_partner', 'authorized_signatory')
+# Blocks inside a longer section; they can only be skipped or aborted
+INLINE_SECTIONS = ('map_search', 'hsn')
+SECTIONS = RETRYABLE_SECTIONS + INLINE_SECTIONS
+
+ERROR_MODE = os.getenv('GST_ERROR_POLICY', 'lenient').lower()
+SECTION_RETRIES = int(os.getenv('GST_SECTION_RETRIES', '1'))
+# e.g. "promoter_partner=retry,map_search=continue"
+SECTION_POLICIES = dict(
+    item.strip().split('=', 1) for item in os.getenv('GST_SECTION_POLICIES', '').split(',') if '=' in item
+)
+
+_ERROR_LABELS = (
+    (TimeoutException, '⏰ Timeout in'),
+    (NoSuchElementException, '🔍 Required element not found in'),
+    (ElementNotInteractableException, '🚫 Element not interactable in'),
+)
+
+
+class SectionFailed(AutomationError):
+    """A section failed under an 'abort' policy; the message names the failure point"""
+
+    def __init__(self, section: str, cause: BaseException, url: Optional[str] = None, attempts: int = 1):
+        self.section = section
+        self.cause = cause
+        self.url = url
+        self.attempts = attempts
+        where = f" on {url}" if url else ""
+        tries = f" after {attempts} attempts" if attempts > 1 else ""
+        super().__init__(f"Section '{section}' failed{tries}{where}: {type(cause).__name__}: {str(cause).strip()}")
+
+
+def policy_errors(value, path: str) -> List[str]:
+    """Validation for the optional `error_policy` config key: a mode name or {mode, section: policy}"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [] if value in MODES else [f"{path}: must be one of {list(MODES)} (got '{value}')"]
+    if not isinstance(value, dict):
+        return [f"{path}: expected a mode name or an object, got {type(value).__name__}"]
+    errors = []
+    for key, policy in value.items():
+        if key == 'mode':
+            if policy not in MODES:
+                errors.append(f"{path}.mode: must be one of {list(MODES)} (got '{policy}')")
+        elif key not in SECTIONS:
+            errors.append(f"{path}.{key}: unknown section, expected one of {list(SECTIONS)}")
+        elif policy not in POLICIES or (policy == 'retry' and key not in RETRYABLE_SECTIONS):
+            allowed = POLICIES if key in RETRYABLE_SECTIONS else ('abort', 'continue')
+            errors.append(f"{path}.{key}: must be one of {list(allowed)} (got '{policy}')")
+    return errors
+
+
+class ErrorPolicy:
+    """What each tolerant section does when it fails, for one run"""
+
+    def __init__(self, mode: str = ERROR_MODE, overrides: Optional[Dict[str, str]] = None, retries: int = SECTION_RETRIES):
+        if mode not in MODES:
+            logger.warning(f"⚠️ Unknown error policy mode {mode!r}, using lenient")
+            mode = 'lenient'
+        self.mode = mode
+        self.overrides = dict(overrides or {})
+        self.retries = max(0, retries)
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> 'ErrorPolicy':
+        """Env defaults (GST_ERROR_POLICY, GST_SECTION_POLICIES) overridden by the payload's error_policy"""
+        mode, overrides = ERROR_MODE, dict(SECTION_POLICIES)
+        setting = (config or {}).get('error_policy')
+        if isinstance(setting, str):
+            mode = setting
+        elif isinstance(setting, dict):
+            mode = setting.get('mode', mode)
+            overrides.update({key: value for key, value in setting.items() if key != 'mode'})
+        return cls(mode, overrides)
+
+    def action(self, section: str) -> str:
+        return self.overrides.get(section, MODES[self.mode])
+
+    def run(self, section: str, fn: Callable[[], None], driver=None) -> bool:
+        """Run a retryable section under its policy; False means it failed and the run continues"""
+        attempts = 1 + (self.retries if self.action(section) == 'retry' else 0)
+        for attempt in range(1, attempts + 1):
+            try:
+                fn()
+                return True
+            except Exception as error:
+                if attempt < attempts:
+                    logger.warning(f"🔁 Section {section} failed ({type(error).__name__}: {error}), "
+                                   f"retrying ({attempt + 1}/{attempts})...")
+                    record_retry(section)
+                    continue
+                self.handle(section, error, driver, attempts=attempt)
+        return False
+
+    def handle(self, section: str, error: BaseException, driver=None, attempts: int = 1):
+        """
+        Apply the policy to a section's final error: raise SectionFailed to abort, or log and
+        return to continue. An exhausted 'retry' falls back to the mode's default.
+        """
+        action = self.action(section)
+        if action == 'retry':
+            action = MODES[self.mode]
+        label = next((text for kind, text in _ERROR_LABELS if isinstance(error, kind)), '❌ Unexpected error in')
+        logger.error(f"{label} {section}: {type(error).__name__}: {error}")
+        record_section_error(section, error, 'aborted' if action == 'abort' else 'continued')
+        if action == 'abort':
+            url = None
+            if driver is not None:
+                try:
+                    url = driver.current_url
+                except Exception:
+                    pass
+            logger.error(f"🛑 Aborting job: {section} failed and the error policy is 'abort'")
+            raise SectionFailed(section, error, url=url, attempts=attempts) from error
+        logger.warning(f"🔄 Continuing with automation despite {section} error - section may be incomplete")
+
+
+__all__ = ['ErrorPolicy', 'SectionFailed', 'policy_errors', 'SECTIONS', 'RETRYABLE_SECTIONS', 'POLICIES', 'MODES']
@@ -4,7 +4,9 @@ import requests
 import logging
 import base64
 from selenium.webdriver.remote.webdriver import WebDriver
+from selenium.webdriver.remote.command import Command
 from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
@@ -13,21 +15,30 @@ from selenium.common.exceptions import (
     StaleElementReferenceException,
     ElementNotInteractableException,
     ElementClickInterceptedException,
-    NoSuchElementException
+    NoSuchElementException,
+    WebDriverException
 )
 import platform
 import subprocess
+import contextvars
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from config import ELEMENTS
 from logger import logger
+from captcha_solver import CaptchaSolver, CaptchaSolverError, get_captcha_solver
+from cancellation import cancellable_result, check_cancelled
+from governor import portal_governor
+from metrics import record_captcha_attempt, record_captcha_outcome, record_fallback, record_retry, record_wait
 from typing import Callable, Tuple, Optional, Any
 
 # --- Environment Variables for APIs ---
 from dotenv import load_dotenv
 load_dotenv()
-TRUECAPTCHA_USER = os.getenv('TRUECAPTCHA_USER')
-TRUECAPTCHA_KEY = os.getenv('TRUECAPTCHA_KEY')
 OTP_SERVER_URL = "http://127.0.0.1:3000"
+# Optional captcha preprocessing before upload to the solver (0 = keep the natural width)
+CAPTCHA_IMAGE_MAX_WIDTH = int(os.getenv('CAPTCHA_IMAGE_MAX_WIDTH', '0'))
+CAPTCHA_IMAGE_GRAYSCALE = os.getenv('CAPTCHA_IMAGE_GRAYSCALE', 'false').lower() in ('1', 'true', 'yes')
 
 # --- Custom Exceptions for Clear Error Handling ---
 class AutomationError(Exception):
@@ -36,6 +47,94 @@ class AutomationError(Exception):
 class VerificationStepFailed(AutomationError):
     pass
 
+# --- Background Captcha Solving ---
+# Captcha API calls are network-bound, so a small thread pool lets them overlap with browser work
+_CAPTCHA_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="captcha")
+# The portal's wrong-captcha messages ("Enter valid Letters shown." on the registration forms)
+CAPTCHA_REJECTED_LOCATOR = (By.XPATH, "//*[contains(text(), 'Enter valid Letters shown') or contains(text(), 'Invalid Captcha')]")
+
+# Reads the captcha straight from the <img> in one call: the already-decoded image is drawn
+# onto a canvas (optionally downscaled/grayscaled) and PNG-encoded, avoiding a composited
+# element screenshot. If the canvas is tainted, the image source is fetched in-page from
+# the browser cache instead.
+_CAPTCHA_IMAGE_SCRIPT = """
+var img = arguments[0], maxWidth = arguments[1], grayscale = arguments[2];
+var done = arguments[arguments.length - 1];
+function encode(source, width, height) {
+    var scale = (maxWidth > 0 && width > maxWidth) ? maxWidth / width : 1;
+    var canvas = document.createElement('canvas');
+    canvas.width = Math.max(1, Math.round(width * scale));
+    canvas.height = Math.max(1, Math.round(height * scale));
+    var ctx = canvas.getContext('2d');
+    ctx.drawImage(source, 0, 0, canvas.width, canvas.height);
+    if (grayscale) {
+        var pixels = ctx.getImageData(0, 0, canvas.width, canvas.height);
+        var d = pixels.data;
+        for (var i = 0; i < d.length; i += 4) {
+            var y = Math.round(0.299 * d[i] + 0.587 * d[i + 1] + 0.114 * d[i + 2]);
+            d[i] = d[i + 1] = d[i + 2] = y;
+        }
+        ctx.putImageData(pixels, 0, 0);
+    }
+    return canvas.toDataURL('image/png').split(',')[1];
+}
+function viaFetch() {
+    fetch(img.src, {credentials: 'include', cache: 'force-cache'})
+        .then(function (r) { return r.blob(); })
+        .then(function (blob) { return createImageBitmap(blob); })
+        .then(function (bitmap) { done({data: encode(bitmap, bitmap.width, bitmap.height), via: 'fetch', src: img.src}); })
+        .catch(function (e) { done({error: String(e)}); });
+}
+function capture() {
+    try {
+        done({data: encode(img, img.naturalWidth, img.naturalHeight), via: 'canvas', src: img.src});
+    } catch (e) {
+        viaFetch();  // SecurityError: cross-origin image tainted the canvas
+    }
+}
+if (img.complete && img.naturalWidth > 0) {
+    capture();
+} else {
+    img.addEventListener('load', capture, {once: true});
+    img.addEventListener('error', function () { done({error: 'captcha image failed to load'}); }, {once: true});
+}
+"""
+
+class CaptchaStepTimings:
+    """Time-to-success of captcha-gated steps, grouped by the number of attempts needed"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}  # step name -> attempts -> [elapsed seconds]
+
+    def record(self, step_name: str, attempts: int, elapsed: float):
+        with self._lock:
+            self._samples.setdefault(step_name, {}).setdefault(attempts, []).append(elapsed)
+
+    def expected_times(self, step_name: str) -> dict:
+        """Mean seconds to success for each attempt count, e.g. {1: {'mean': 14.2, 'runs': 9}}"""
+        with self._lock:
+            by_attempts = dict(self._samples.get(step_name, {}))
+        return {
+            attempts: {'mean': round(sum(times) / len(times), 1), 'runs': len(times)}
+            for attempts, times in sorted(by_attempts.items())
+        }
+
+_CAPTCHA_STEP_TIMINGS = CaptchaStepTimings()
+
+def captcha_step_timings() -> dict:
+    """Expected time-to-success per attempt count for every captcha step seen so far"""
+    with _CAPTCHA_STEP_TIMINGS._lock:
+        steps = list(_CAPTCHA_STEP_TIMINGS._samples)
+    return {step: _CAPTCHA_STEP_TIMINGS.expected_times(step) for step in steps}
+
+class CaptchaPrefetch:
+    """A captcha image captured early whose solution is being computed in the background"""
+
+    def __init__(self, image_src: Optional[str], future: Future):
+        self.image_src = image_src
+        self.future = future
+
 # --- Helper Functions for Safe UI Interactions ---
 
 def safe_checkbox_click(driver, checkbox_id, description="checkbox"):
@@ -55,6 +154,7 @@ def safe_checkbox_click(driver, checkbox_id, description="checkbox"):
         
     except (TimeoutException, Exception) as e:
         logger.warning(f"Normal {description} click failed, trying JavaScript click: {e}")
+        record_fallback('js_click')
         try:
             # Fallback: JavaScript click
             checkbox = driver.find_element(By.ID, checkbox_id)
@@ -122,6 +222,7 @@ def safe_click_with_dimmer_wait(driver, xpath, description="button", handle_dial
         
     except (TimeoutException, Exception) as e:
         logger.warning(f"Normal click failed for {description}, trying JavaScript click: {e}")
+        record_fallback('js_click')
         # Fallback: Use JavaScript click to bypass the overlay
         try:
             button = driver.find_element(By.XPATH, xpath)
@@ -176,6 +277,7 @@ def safe_click(driver, locator, timeout=10):
         
     except ElementClickInterceptedException:
         logger.warning(f"Element {locator} is obscured, trying JavaScript click...")
+        record_fallback('js_click')
         try:
             element = driver.find_element(*locator)
             driver.execute_script("arguments[0].click();", element)
@@ -221,6 +323,7 @@ def safe_fill_field(driver, field_id, value, field_name):
         
         if not is_enabled or is_readonly or is_disabled:
             logger.warning(f"⚠️ {field_name} field is disabled/readonly - trying JavaScript approach")
+            record_fallback('js_fill')
             try:
                 # Enable the field temporarily and fill it
                 driver.execute_script("arguments[0].removeAttribute('disabled');", element)
@@ -247,6 +350,7 @@ def safe_fill_field(driver, field_id, value, field_name):
                 return True
             except Exception as fill_error:
                 logger.warning(f"⚠️ Normal fill failed for {field_name}, trying JavaScript: {fill_error}")
+                record_fallback('js_fill')
                 try:
                     driver.execute_script("arguments[0].value = arguments[1];", element, value)
                     driver.execute_script("arguments[0].dispatchEvent(new Event('input', { bubbles: true }));", element)
@@ -327,6 +431,7 @@ def safe_click_element(nigga, driver, locator):
 
 def wait_for_page_load(driver, timeout=30):
     """Wait for page to fully load using document.readyState and absence of loading indicators"""
+    started = time.monotonic()
     try:
         # Wait for document to be ready
         WebDriverWait(driver, timeout).until(
@@ -349,15 +454,96 @@ def wait_for_page_load(driver, timeout=30):
     except TimeoutException:
         logger.warning("⚠️ Page load timeout - continuing anyway")
         return False
-
-def wait_for_element_stable(driver, locator, timeout=10):
-    """Wait for element to be present, visible, and stable (not moving/changing)"""
+    finally:
+        elapsed = time.monotonic() - started
+        record_wait('page_load', elapsed)
+        # Page loads are the portal latency signal the session governor adapts to
+        portal_governor.sessions.observe(elapsed)
+
+# In-browser stability probe: watches the element's bounding rect across animation
+# frames and resolves once it has held still for `stableFrames` consecutive frames.
+# Falls back to setTimeout when the document is hidden (rAF is paused there).
+_ELEMENT_STABLE_SCRIPT = """
+var el = arguments[0], stableFrames = arguments[1], deadline = Date.now() + arguments[2];
+var done = arguments[arguments.length - 1];
+var schedule = document.hidden
+    ? function (fn) { return window.setTimeout(fn, 16); }
+    : function (fn) { return window.requestAnimationFrame(fn); };
+var last = null, count = 0, everShown = false;
+function tick() {
+    if (!el.isConnected) { done('detached'); return; }
+    var r = el.getBoundingClientRect();
+    var style = window.getComputedStyle(el);
+    var shown = r.width > 0 && r.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+    everShown = everShown || shown;
+    if (shown && !el.disabled && last !== null &&
+        r.top === last.top && r.left === last.left && r.width === last.width && r.height === last.height) {
+        count++;
+    } else {
+        count = 0;
+    }
+    last = r;
+    if (count >= stableFrames) { done('stable'); return; }
+    if (Date.now() >= deadline) { done(everShown ? 'timeout' : 'hidden'); return; }
+    schedule(tick);
+}
+schedule(tick);
+"""
+_STABLE_PROBE_MAX_SECONDS = 25
+
+def wait_for_element_stable(driver, locator, timeout=10, stable_frames=3):
+    """Wait for element to be present, visible, and stable (not moving/changing).
+
+    The stability check runs inside the browser as a single async script call that
+    compares the element's bounding rect across animation frames, instead of polling
+    location/size/is_displayed/is_enabled over WebDriver.
+    """
+    deadline = time.time() + timeout
     try:
         # Wait for element to be present
         element = WebDriverWait(driver, timeout).until(
             EC.presence_of_element_located(locator)
         )
         
+        while True:
+            # Keep each probe under geckodriver's default 30s script timeout
+            remaining_ms = int(min(max(deadline - time.time(), 0.1), _STABLE_PROBE_MAX_SECONDS) * 1000)
+            try:
+                state = driver.execute_async_script(_ELEMENT_STABLE_SCRIPT, element, stable_frames, remaining_ms)
+            except StaleElementReferenceException:
+                state = 'detached'
+            except WebDriverException as e:
+                logger.debug(f"⚠️ In-browser stability probe unavailable for {locator} ({type(e).__name__}), using WebDriver polling")
+                record_fallback('stability_polling')
+                return _wait_for_element_stable_polling(driver, locator, element, max(deadline - time.time(), 1))
+            
+            if state == 'stable':
+                logger.debug(f"✅ Element {locator} is stable and ready")
+                return element
+            
+            if time.time() < deadline:
+                if state == 'detached':
+                    # Element was re-rendered, probe the replacement
+                    logger.debug(f"⚠️ Element {locator} still changing, continuing stability check...")
+                    element = WebDriverWait(driver, max(deadline - time.time(), 0.1)).until(
+                        EC.presence_of_element_located(locator)
+                    )
+                continue
+            
+            if state == 'hidden':
+                raise TimeoutException(f"Element {locator} never became visible")
+            
+            # If we get here, element might still be moving but we'll return it anyway
+            logger.debug(f"⚠️ Element {locator} stability check completed (may still be moving)")
+            return driver.find_element(*locator)
+            
+    except (TimeoutException, NoSuchElementException):
+        logger.warning(f"⚠️ Element {locator} not stable within {timeout}s")
+        return None
+
+def _wait_for_element_stable_polling(driver, locator, element, timeout):
+    """WebDriver round-trip stability check, used when async scripts cannot run"""
+    try:
         # Wait for element to be visible
         WebDriverWait(driver, timeout).until(
             EC.visibility_of_element_located(locator)
@@ -369,7 +555,7 @@ def wait_for_element_stable(driver, locator, timeout=10):
         
         previous_location = element.location
         previous_size = element.size
-        
+
         for check in range(max_stability_checks):
             try:
                 # Use WebDriverWait with a very short timeout instead of time.sleep
@@ -524,6 +710,7 @@ def wait_for_navigation(driver, expected_url_part=None, timeout=30):
 
 def wait_for_ajax_complete(driver, timeout=15):
     """Wait for AJAX/XHR requests to complete"""
+    started = time.monotonic()
     try:
         # Wait for jQuery AJAX if jQuery is present
         try:
@@ -555,6 +742,8 @@ def wait_for_ajax_complete(driver, timeout=15):
     except TimeoutException:
         logger.warning(f"⚠️ AJAX completion timeout after {timeout}s")
         return False
+    finally:
+        record_wait('ajax_settle', time.monotonic() - started)
 
 def wait_for_button_clickable(driver, button_locator, timeout=15):
     """Wait for button to be clickable and not disabled"""
@@ -610,6 +799,7 @@ def smart_wait_and_click(driver, locator, description="element", timeout=15):
         
     except TimeoutException:
         logger.warning(f"⚠️ Smart click timeout for {description}, trying JavaScript click")
+        record_fallback('js_click')
         try:
             element = driver.find_element(*locator)
             driver.execute_script("arguments[0].click();", element)
@@ -692,6 +882,7 @@ def safe_dropdown_select(driver, dropdown_locator, option_text, description="dro
         except NoSuchElementException:
             # If exact text doesn't work, try partial match
             logger.warning(f"⚠️ Exact text match failed, trying partial match for '{option_text}'")
+            record_fallback('dropdown_partial_match')
             options = select.options
             for option in options:
                 if option_text.lower() in option.text.lower():
@@ -705,6 +896,7 @@ def safe_dropdown_select(driver, dropdown_locator, option_text, description="dro
         
     except TimeoutException:
         logger.warning(f"⚠️ Dropdown {description} not ready, trying JavaScript approach")
+        record_fallback('js_dropdown')
         try:
             # Fallback: Try JavaScript approach
             element = driver.find_element(*locator)
@@ -731,19 +923,115 @@ def safe_dropdown_select(driver, dropdown_locator, option_text, description="dro
         logger.error(f"❌ Unexpected error selecting from {description}: {e}")
         return False
 
+# --- Navigation Tracking for the Document-Ready Cache ---
+
+# Commands that can replace the current document or move to another browsing context
+_NAVIGATING_COMMANDS = {
+    Command.GET,
+    Command.GO_BACK,
+    Command.GO_FORWARD,
+    Command.REFRESH,
+    Command.CLICK_ELEMENT,
+    Command.NEW_WINDOW,
+    Command.CLOSE,
+    Command.SWITCH_TO_WINDOW,
+    Command.SWITCH_TO_FRAME,
+    Command.SWITCH_TO_PARENT_FRAME,
+}
+_SCRIPT_COMMANDS = {Command.W3C_EXECUTE_SCRIPT, Command.W3C_EXECUTE_SCRIPT_ASYNC}
+# Injected scripts containing any of these may click, submit or change location
+_NAVIGATING_SCRIPT_HINTS = ('click', 'submit', 'location', 'history', 'reload')
+_SUBMIT_KEYS = ('\n', Keys.ENTER, Keys.RETURN)
+
+# Returns the page-load token once the document is complete, creating it on first sight.
+# A fresh document has no token, so a changed token means the page was replaced.
+_DOCUMENT_READY_SCRIPT = """
+if (document.readyState !== 'complete') { return null; }
+if (!window.__gstPageToken) { window.__gstPageToken = arguments[0]; }
+return window.__gstPageToken;
+"""
+
+class _NavigationTracker:
+    """Counts WebDriver commands that may have navigated, shared by every helper on a driver"""
+
+    def __init__(self, driver: WebDriver):
+        self.generation = 0
+        self.confirmed_generation = -1
+        self.confirmed_at = 0.0
+        self.page_token: Optional[str] = None
+        self._execute = driver.execute
+        # Every driver and element command funnels through driver.execute
+        driver.execute = self._tracked_execute
+
+    @classmethod
+    def for_driver(cls, driver: WebDriver) -> "_NavigationTracker":
+        tracker = getattr(driver, '_gst_navigation_tracker', None)
+        if tracker is None:
+            tracker = cls(driver)
+            driver._gst_navigation_tracker = tracker
+        return tracker
+
+    def _tracked_execute(self, driver_command, params=None):
+        if self._may_navigate(driver_command, params):
+            self.generation += 1
+        return self._execute(driver_command, params)
+
+    @staticmethod
+    def _may_navigate(driver_command, params) -> bool:
+        if driver_command in _NAVIGATING_COMMANDS:
+            return True
+        if driver_command in _SCRIPT_COMMANDS:
+            script = (params or {}).get('script', '')
+            return any(hint in script for hint in _NAVIGATING_SCRIPT_HINTS)
+        if driver_command == Command.SEND_KEYS_TO_ELEMENT:
+            text = (params or {}).get('text', '')
+            return any(key in text for key in _SUBMIT_KEYS)
+        return False
+
+    def is_confirmed(self, max_age: float) -> bool:
+        return (self.confirmed_generation == self.generation
+                and time.time() - self.confirmed_at < max_age)
+
+    def confirm(self, generation: int, page_token: str):
+        self.confirmed_generation = generation
+        self.confirmed_at = time.time()
+        self.page_token = page_token
+
+    def invalidate(self):
+        self.generation += 1
+
 class AutomationHelper:
-    def __init__(self, driver: WebDriver, logger: logging.Logger, default_timeout: int = 30, default_retries: int = 5):
+    def __init__(self, driver: WebDriver, logger: logging.Logger, default_timeout: int = 30, default_retries: int = 5, ready_cache_ttl: float = 15.0, captcha_solver: Optional[CaptchaSolver] = None):
         self.driver = driver
         self.logger = logger
         self.default_timeout = default_timeout
         self.default_retries = default_retries
+        self.ready_cache_ttl = ready_cache_ttl
+        self.captcha_solver = captcha_solver or get_captcha_solver()
         self.task: Optional[Any] = None
+        self._navigation = _NavigationTracker.for_driver(driver)
 
     def wait_for_document_ready(self):
-        WebDriverWait(self.driver, self.default_timeout).until(
-            lambda d: d.execute_script("return document.readyState") == "complete"
+        """Wait for document.readyState == 'complete', skipping the check when no
+        command that could navigate has run since the last confirmation."""
+        if self._navigation.is_confirmed(self.ready_cache_ttl):
+            self.logger.debug("Document unchanged since last ready confirmation, skipping check.")
+            return
+
+        generation = self._navigation.generation
+        candidate_token = f"{time.time():.6f}"
+        page_token = WebDriverWait(self.driver, self.default_timeout).until(
+            lambda d: d.execute_script(_DOCUMENT_READY_SCRIPT, candidate_token)
         )
-        self.logger.info("Document is in 'complete' ready state.")
+        if page_token == self._navigation.page_token:
+            self.logger.debug("Document is unchanged and in 'complete' ready state.")
+        else:
+            self.logger.info("Document is in 'complete' ready state.")
+        self._navigation.confirm(generation, page_token)
+
+    def invalidate_document_ready(self):
+        """Force the next wait_for_document_ready call to query the browser"""
+        self._navigation.invalidate()
 
     def set_task(self, task: Any):
         self.task = task
@@ -791,6 +1079,7 @@ class AutomationHelper:
                 return
             except StaleElementReferenceException:
                 self.logger.warning(f"Stale element on send_text to {locator}, attempt {attempt + 1}.")
+                record_retry('send_text')
                 # Wait for element to become stable again instead of arbitrary sleep
                 try:
                     WebDriverWait(self.driver, 2).until(
@@ -814,11 +1103,13 @@ class AutomationHelper:
                 try:
                     element.click()
                 except ElementNotInteractableException:
+                    record_fallback('js_click')
                     self.driver.execute_script("arguments[0].click();", element)
                 self.logger.info(f"Successfully clicked {locator}.")
                 return
             except StaleElementReferenceException:
                 self.logger.warning(f"Stale element on click_element {locator}, attempt {attempt + 1}.")
+                record_retry('click_element')
                 # Wait for element to become clickable again instead of arbitrary sleep
                 try:
                     WebDriverWait(self.driver, 2).until(
@@ -835,6 +1126,8 @@ class AutomationHelper:
         num_retries = max_retries if max_retries is not None else self.default_retries
         for attempt in range(num_retries):
             self.logger.info(f"--- Starting {step_name}: Attempt {attempt + 1}/{num_retries} ---")
+            if attempt > 0:
+                record_retry(step_name)
             try:
                 if attempt > 0 and recovery_callable:
                     self.logger.info(f"Performing recovery action for {step_name}...")
@@ -873,53 +1166,215 @@ class AutomationHelper:
         self._save_screenshot_on_error(step_name)
         raise VerificationStepFailed(f"{step_name} could not be completed after {num_retries} attempts.")
 
-    def solve_and_enter_captcha(self):
-        self.wait_for_document_ready()
-        self.logger.info("Solving captcha via TrueCaptcha API...")
+    def _capture_captcha_image(self, condition) -> Tuple[str, Optional[str]]:
+        """Locate the captcha image and return (base64 PNG, image src)."""
+        # HTML: <img id="imgCaptcha" ...>
+        captcha_element = WebDriverWait(self.driver, self.default_timeout).until(
+            condition((By.ID, ELEMENTS["LOGIN_CAPTCHA_IMAGE"]))
+        )
+        self.logger.info("Found captcha image element with ID 'imgCaptcha'.")
+
+        # Read the image bytes straight from the page in a single script call
+        try:
+            result = self.driver.execute_async_script(
+                _CAPTCHA_IMAGE_SCRIPT, captcha_element, CAPTCHA_IMAGE_MAX_WIDTH, CAPTCHA_IMAGE_GRAYSCALE
+            ) or {}
+            if result.get('data'):
+                self.logger.info(f"Captcha image read from page via {result['via']} ({len(result['data'])} base64 chars).")
+                return result['data'], result.get('src')
+            self.logger.warning(f"In-page captcha capture failed ({result.get('error')}), falling back to element screenshot")
+        except WebDriverException as e:
+            self.logger.warning(f"In-page captcha capture failed ({type(e).__name__}), falling back to element screenshot")
+
+        # Fallback: take screenshot of the captcha element
+        record_fallback('captcha_screenshot')
+        return captcha_element.screenshot_as_base64, captcha_element.get_property("src")
+
+    def _current_captcha_src(self) -> Optional[str]:
+        try:
+            return self.driver.find_element(By.ID, ELEMENTS["LOGIN_CAPTCHA_IMAGE"]).get_property("src")
+        except Exception:
+            return None
 
-        if not TRUECAPTCHA_USER or not TRUECAPTCHA_KEY:
-            raise AutomationError("TrueCaptcha credentials (TRUECAPTCHA_USER, TRUECAPTCHA_KEY) are missing. Please ensure they are loaded.")
+    def _wait_for_captcha_refresh(self, previous_src: Optional[str], refresh_locator: Optional[Tuple[str, str]] = None, timeout: float = 3):
+        """Wait for the portal to swap in a new captcha image, clicking refresh if it does not."""
+        def _src_changed(d):
+            try:
+                src = d.find_element(By.ID, ELEMENTS["LOGIN_CAPTCHA_IMAGE"]).get_property("src")
+                return src if src and src != previous_src else False
+            except (NoSuchElementException, StaleElementReferenceException):
+                return False
 
         try:
-            # Locate the CAPTCHA image using its specific ID from the HTML
-            # HTML: <img id="imgCaptcha" ...>
-            captcha_element = WebDriverWait(self.driver, self.default_timeout).until(
-                EC.presence_of_element_located((By.ID, "imgCaptcha"))
-            )
-            self.logger.info(f"Found captcha image element with ID 'imgCaptcha'.")
+            WebDriverWait(self.driver, timeout, poll_frequency=0.1).until(_src_changed)
+            return
+        except TimeoutException:
+            pass
 
-            # Take screenshot of the captcha element
-            encoded_string = captcha_element.screenshot_as_base64
+        if refresh_locator:
+            self.logger.info("Captcha image not refreshed by the portal, requesting a new one...")
+            try:
+                self.driver.find_element(*refresh_locator).click()
+                WebDriverWait(self.driver, timeout, poll_frequency=0.1).until(_src_changed)
+            except (NoSuchElementException, ElementNotInteractableException, TimeoutException) as e:
+                self.logger.warning(f"Captcha refresh did not change the image: {type(e).__name__}")
+
+    def _execute_captcha_step(self, step_name: str, input_locator: Tuple[str, str], submit_callable: Callable, success_condition: Callable, rejection_condition: Callable, prepare_callable: Optional[Callable[[int], None]] = None, recovery_callable: Optional[Callable] = None, refresh_locator: Optional[Tuple[str, str]] = None, max_retries: int = 10, wait_timeout: int = 10, prefetched: Optional[CaptchaPrefetch] = None):
+        """
+        Captcha-specific retry loop. Rejection is detected as soon as the portal shows it
+        (fast polling, no document/jQuery settling between attempts), and the next image
+        is captured and sent to the solver before the failure is cleaned up, so solving
+        overlaps with recovery. `prefetched` reuses a solve started earlier in the flow.
+        """
+        start = time.monotonic()
+        if prefetched is None:
+            prefetched = self.prefetch_captcha(visible=True)
+
+        def _outcome(d):
+            for outcome, condition in (('success', success_condition), ('rejected', rejection_condition)):
+                try:
+                    if condition(d):
+                        return outcome
+                except (NoSuchElementException, StaleElementReferenceException):
+                    pass
+            return False
 
-            # Send to TrueCaptcha API
-            response = requests.post(
-                'https://api.apitruecaptcha.org/one/gettext',
-                json={'userid': TRUECAPTCHA_USER, 'apikey': TRUECAPTCHA_KEY, 'data': encoded_string, 'numeric': True, 'mode': 'human'},
-                timeout=70 # API call timeout
-            )
-            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-            result = response.json()
-
-            captcha_text = ""
-            if 'result' in result and result['result']:
-                captcha_text = result['result'].strip()
-                self.logger.info(f"CAPTCHA solved by API: {captcha_text}")
-            else:
-                raise AutomationError(f"Failed to get CAPTCHA result from API. Response: {result}")
-
-            # Enter the solved CAPTCHA text using its specific ID from the HTML
-            # HTML: <input ... id="captcha" name="captcha" ...>
-            self.send_text(locator=(By.ID, "captcha"), keys=captcha_text)
-            self.logger.info("CAPTCHA text entered successfully.")
-
-        except requests.exceptions.RequestException as req_err:
-            raise AutomationError(f"Network or API error during captcha verification: {req_err}")
-        except TimeoutException as te:
-            # Capture the element not found case specifically
-            raise AutomationError(f"CAPTCHA image or input field not found within timeout: {te}")
+        for attempt in range(1, max_retries + 1):
+            self.logger.info(f"--- Starting {step_name}: Attempt {attempt}/{max_retries} ---")
+            if attempt > 1:
+                record_retry(step_name)
+            backend, submitted_src = None, None
+            try:
+                if prepare_callable:
+                    prepare_callable(attempt)
+                captcha_text, backend = self._solve_captcha(EC.visibility_of_element_located, prefetched)
+                self.send_text(locator=input_locator, keys=captcha_text)
+                submitted_src = self.driver.find_element(By.ID, ELEMENTS["LOGIN_CAPTCHA_IMAGE"]).get_property("src")
+                submit_callable()
+
+                outcome = WebDriverWait(self.driver, wait_timeout, poll_frequency=0.1).until(_outcome)
+            except Exception as e:
+                self.logger.warning(f"Caught exception during {step_name} attempt {attempt}: {type(e).__name__}. Retrying...")
+                # A submitted answer that got no verdict counts against its backend; an unsolved one only as a failed attempt
+                if submitted_src is not None:
+                    self.report_captcha_outcome(False, backend)
+                else:
+                    record_captcha_outcome(False)
+                prefetched = None
+                if attempt < max_retries:
+                    # Never retry on the same image: wait for (or request) a new one and start solving it
+                    self._wait_for_captcha_refresh(submitted_src or self._current_captcha_src(), refresh_locator)
+                    prefetched = self.prefetch_captcha(visible=True)
+                continue
+
+            if outcome == 'success':
+                self.report_captcha_outcome(True, backend)
+                elapsed = time.monotonic() - start
+                _CAPTCHA_STEP_TIMINGS.record(step_name, attempt, elapsed)
+                self.logger.info(f"SUCCESS: {step_name} completed on attempt {attempt} after {elapsed:.1f}s.")
+                self.logger.info(f"{step_name} expected time by attempt count: {_CAPTCHA_STEP_TIMINGS.expected_times(step_name)}")
+                return
+
+            self.report_captcha_outcome(False, backend)
+            self.logger.warning(f"FAILURE: {step_name} captcha rejected on attempt {attempt}. Solving next image...")
+            if attempt < max_retries:
+                # Start solving the replacement image, then clean up while the solver works
+                self._wait_for_captcha_refresh(submitted_src, refresh_locator)
+                prefetched = self.prefetch_captcha(visible=True)
+                if recovery_callable:
+                    try:
+                        recovery_callable()
+                    except Exception as e:
+                        self.logger.warning(f"Recovery action for {step_name} failed: {type(e).__name__}")
+
+        self.logger.critical(f"FINAL FAILURE: {step_name} failed after {max_retries} attempts.")
+        self._save_screenshot_on_error(step_name)
+        raise VerificationStepFailed(f"{step_name} could not be completed after {max_retries} attempts.")
+
+    def _ensure_captcha_solver(self):
+        if not self.captcha_solver.is_configured():
+            raise AutomationError(f"Captcha backend '{self.captcha_solver.name}' is not configured. For TrueCaptcha, ensure TRUECAPTCHA_USER and TRUECAPTCHA_KEY are loaded.")
+
+    def _request_captcha_solution(self, encoded_string: str) -> Tuple[str, CaptchaSolver]:
+        """Send a captcha image to the configured solver backend; returns the text and the backend that solved it."""
+        try:
+            captcha_text, backend = self.captcha_solver.solve_with_backend(encoded_string)
+        except CaptchaSolverError as solver_err:
+            raise AutomationError(f"Captcha solver error during captcha verification: {solver_err}")
+
+        record_captcha_attempt(backend.name)
+        self.logger.info(f"CAPTCHA solved by {backend.name}: {captcha_text}")
+        return captcha_text, backend
+
+    def report_captcha_outcome(self, accepted: bool, backend: Optional[CaptchaSolver] = None):
+        """
+        Tell the backend that produced an answer whether the portal accepted it. The backend is
+        passed in rather than remembered, since a background and a foreground solve can overlap.
+        """
+        record_captcha_outcome(accepted)
+        if backend is not None:
+            backend.report_outcome(accepted)
+        if backend is not self.captcha_solver:
+            # Hedged solvers keep their own end-to-end accuracy as well
+            self.captcha_solver.report_outcome(accepted)
+
+    def prefetch_captcha(self, visible: bool = False) -> Optional[CaptchaPrefetch]:
+        """
+        Capture the captcha image as soon as it is on the page and start solving it
+        on a background thread, so the API round trip overlaps with form filling.
+        Pass the returned handle to solve_and_enter_captcha/handle_initial_captcha.
+        Returns None if the image could not be captured; the caller then solves inline.
+        """
+        if not self.captcha_solver.is_configured():
+            return None
+
+        condition = EC.visibility_of_element_located if visible else EC.presence_of_element_located
+        try:
+            encoded_string, image_src = self._capture_captcha_image(condition)
         except Exception as e:
-            # Catch any other unexpected errors
-            raise AutomationError(f"An unexpected error occurred during captcha solving and entry: {e}")
+            self.logger.warning(f"Could not capture captcha early, will solve it inline: {type(e).__name__}: {e}")
+            return None
+
+        self.logger.info("Captcha captured early, solving in the background...")
+        # Run in a copy of this thread's context so the solver's log lines keep the job id
+        future = _CAPTCHA_EXECUTOR.submit(contextvars.copy_context().run, self._request_captcha_solution, encoded_string)
+        return CaptchaPrefetch(image_src, future)
+
+    def _solve_captcha(self, condition, prefetched: Optional[CaptchaPrefetch]) -> Tuple[str, CaptchaSolver]:
+        """Return captcha text and its backend, reusing a background solve when the image is unchanged."""
+        if prefetched is not None:
+            try:
+                current_src = self.driver.find_element(By.ID, ELEMENTS["LOGIN_CAPTCHA_IMAGE"]).get_property("src")
+                if current_src == prefetched.image_src:
+                    solution = cancellable_result(prefetched.future)
+                    self.logger.info("Using captcha solved in the background.")
+                    return solution
+                self.logger.warning("Captcha image changed since it was captured, solving the new one...")
+                record_fallback('captcha_prefetch_stale')
+                prefetched.future.cancel()
+            except Exception as e:
+                self.logger.warning(f"Background captcha solve unusable, solving inline: {type(e).__name__}: {e}")
+
+        encoded_string, _ = self._capture_captcha_image(condition)
+        # Solved off-thread so a cancelled job stops waiting on the solver's HTTP call
+        future = _CAPTCHA_EXECUTOR.submit(contextvars.copy_context().run, self._request_captcha_solution, encoded_string)
+        return cancellable_result(future)
+
+    def solve_and_enter_captcha(self, submit_callable: Callable, success_condition: Callable, prefetched: Optional[CaptchaPrefetch] = None, **kwargs):
+        """Part A captcha: enter the answer, submit, and retry with a fresh image if the portal rejects it."""
+        self.wait_for_document_ready()
+        self.logger.info(f"Solving captcha via {self.captcha_solver.name} solver...")
+        self._ensure_captcha_solver()
+        # HTML: <input ... id="captcha" name="captcha" ...>
+        self._execute_captcha_step(
+            step_name="Part A CAPTCHA",
+            input_locator=(By.ID, ELEMENTS["LOGIN_CAPTCHA_INPUT"]),
+            submit_callable=submit_callable,
+            success_condition=success_condition,
+            rejection_condition=EC.presence_of_element_located(CAPTCHA_REJECTED_LOCATOR),
+            prefetched=prefetched,
+            **kwargs
+        )
 
     def poll_for_otp(self, otp_type: str, timeout: int = 120, poll_interval: int = 3) -> str:
         self.wait_for_document_ready()
@@ -930,6 +1385,7 @@ class AutomationHelper:
         max_consecutive_failures = 3
         
         while time.time() - start_time < timeout:
+            check_cancelled()
             try:
                 url = f"{OTP_SERVER_URL}/get-otp?type={otp_type}"
                 response = requests.get(url, timeout=5)
@@ -939,6 +1395,7 @@ class AutomationHelper:
                     otp_value = data.get("otp")
                     if otp_value:
                         self.logger.info(f"OTP '{otp_value}' received for type '{otp_type}'!")
+                        record_wait(otp_type, time.time() - start_time)
                         return otp_value
                     consecutive_failures = 0  # Reset failure count on successful connection
                 else:
@@ -975,59 +1432,23 @@ class AutomationHelper:
                     self.logger.warning("Browser connection lost during OTP polling")
                     break
                     
+        record_wait(otp_type, time.time() - start_time)
         raise TimeoutException(f"Timed out waiting for {otp_type} from local server.")
 
-    def handle_initial_captcha(self):
+    def handle_initial_captcha(self, submit_callable: Callable, success_condition: Callable, prefetched: Optional[CaptchaPrefetch] = None, **kwargs):
+        """TRN login captcha: enter the answer into 'captchatrn', submit, and retry if the portal rejects it."""
         self.wait_for_document_ready()
-        self.logger.info("Solving captcha via TrueCaptcha API...")
-
-        if not TRUECAPTCHA_USER or not TRUECAPTCHA_KEY:
-            raise AutomationError("TrueCaptcha credentials (TRUECAPTCHA_USER, TRUECAPTCHA_KEY) are missing.")
-
-        try:
-            # Wait for CAPTCHA image to be visible
-            captcha_element = WebDriverWait(self.driver, self.default_timeout).until(
-                EC.visibility_of_element_located((By.ID, "imgCaptcha"))
-            )
-            self.logger.info("Found visible CAPTCHA image with ID 'imgCaptcha'.")
-
-            # Screenshot as base64
-            encoded_string = captcha_element.screenshot_as_base64
-
-            # Solve CAPTCHA using API
-            response = requests.post(
-                'https://api.apitruecaptcha.org/one/gettext',
-                json={
-                    'userid': TRUECAPTCHA_USER,
-                    'apikey': TRUECAPTCHA_KEY,
-                    'data': encoded_string,
-                    'numeric': True,
-                    'mode': 'human'
-                },
-                timeout=70
-            )
-            response.raise_for_status()
-            result = response.json()
-
-            if 'result' not in result or not result['result']:
-                raise AutomationError(f"Invalid CAPTCHA API response: {result}")
-
-            captcha_text = result['result'].strip()
-            self.logger.info(f"CAPTCHA solved: {captcha_text}")
-
-            # Wait for the input field with ID 'captchatrn' to be ready
-            input_element = WebDriverWait(self.driver, self.default_timeout).until(
-                EC.element_to_be_clickable((By.ID, "captchatrn"))
-            )
-            self.send_text(locator=(By.ID, "captchatrn"), keys=captcha_text)
-            self.logger.info("CAPTCHA entered successfully into input with ID 'captchatrn'.")
-
-        except requests.exceptions.RequestException as req_err:
-            raise AutomationError(f"Network/API error while solving CAPTCHA: {req_err}")
-        except TimeoutException as te:
-            raise AutomationError(f"CAPTCHA image or input not found or not visible within timeout: {te}")
-        except Exception as e:
-            raise AutomationError(f"Unexpected error during CAPTCHA handling: {e}")
+        self.logger.info(f"Solving captcha via {self.captcha_solver.name} solver...")
+        self._ensure_captcha_solver()
+        self._execute_captcha_step(
+            step_name="TRN login CAPTCHA",
+            input_locator=(By.ID, "captchatrn"),
+            submit_callable=submit_callable,
+            success_condition=success_condition,
+            rejection_condition=EC.presence_of_element_located(CAPTCHA_REJECTED_LOCATOR),
+            prefetched=prefetched,
+            **kwargs
+        )
 
     def handle_mobile_otp(self, **kwargs):
         self.logger.info("Starting Mobile OTP verification step...")
@@ -1103,21 +1524,18 @@ class AutomationHelper:
 
     def handle_final_captcha(self, ekyc_password: str, **kwargs):
         # Removed job_id parameter
-        def action():
-            self.send_text(locator=(By.ID, ELEMENTS["PASSWORD_INPUT"]), keys=ekyc_password, clear_first=False)
-            self.send_text(locator=(By.ID, ELEMENTS["CONFIRM_PASSWORD_INPUT"]), keys=ekyc_password, clear_first=False)
-            self.solve_and_enter_captcha()
-        def recovery():
-            self.send_text(locator=(By.ID, ELEMENTS["PASSWORD_INPUT"]), keys=ekyc_password)
-            self.send_text(locator=(By.ID, ELEMENTS["CONFIRM_PASSWORD_INPUT"]), keys=ekyc_password)
-        self._execute_verification_step(
+        def prepare(attempt: int):
+            # Fields keep their value on the first pass; retries re-enter them from scratch
+            self.send_text(locator=(By.ID, ELEMENTS["PASSWORD_INPUT"]), keys=ekyc_password, clear_first=attempt > 1)
+            self.send_text(locator=(By.ID, ELEMENTS["CONFIRM_PASSWORD_INPUT"]), keys=ekyc_password, clear_first=attempt > 1)
+        kwargs.setdefault('max_retries', 15)
+        self._execute_captcha_step(
             step_name="Final Password/CAPTCHA",
-            action_callable=action,
+            input_locator=(By.ID, ELEMENTS["LOGIN_CAPTCHA_INPUT"]),
             submit_callable=lambda: self.click_element(locator=(By.ID, ELEMENTS["NEXT_BUTTON"])),
             success_condition=EC.url_contains("/UploadVerification/VideoUpload"),
-            failure_condition=EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'Invalid Captcha Code')]")),
-            recovery_callable=recovery,
-            max_retries=15,
+            rejection_condition=EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'Invalid Captcha Code')]")),
+            prepare_callable=prepare,
             **kwargs
         )
     
@@ -0,0 +1,268 @@
+# File: governor.py
+#
+# Portal-aware rate limiting for concurrent registration runs
+# All jobs in this process share one governor: a cap on concurrent portal sessions, and token
+# buckets for captcha solves (per minute) and Part A submissions (per interval). Callers wait
+# their turn instead of failing. The session cap adapts to the portal: page-load latency fed in
+# from the flow's wait metrics halves it when the portal slows down and raises it one step at a
+# time once it recovers (AIMD).
+# The TrueCaptcha quota belongs to the account, not the box: with the Redis queue backend the
+# captcha bucket lives in Redis and every worker node draws from the same tokens.
+
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from cancellation import CHECK_INTERVAL, cancellable_sleep, check_cancelled
+from logger import logger
+from metrics import record_wait
+
+MAX_SESSIONS = int(os.getenv('GST_PORTAL_MAX_SESSIONS', os.getenv('GST_JOB_WORKERS', '1')))
+MIN_SESSIONS = int(os.getenv('GST_PORTAL_MIN_SESSIONS', '1'))
+# Page loads slower than this (EWMA, seconds) mean the portal is struggling
+SLOW_PAGE_SECONDS = float(os.getenv('GST_PORTAL_SLOW_PAGE_SECONDS', '10'))
+ADJUST_INTERVAL = float(os.getenv('GST_GOVERNOR_ADJUST_SECONDS', '30'))
+LATENCY_ALPHA = 0.2
+MIN_SAMPLES = 3
+# 0 disables a bucket
+CAPTCHA_PER_MINUTE = float(os.getenv('GST_CAPTCHA_PER_MINUTE', '0'))
+CAPTCHA_BURST = int(os.getenv('GST_CAPTCHA_BURST', '3'))
+PART_A_PER_INTERVAL = float(os.getenv('GST_PART_A_PER_INTERVAL', '0'))
+PART_A_INTERVAL = float(os.getenv('GST_PART_A_INTERVAL_SECONDS', '60'))
+PART_A_BURST = int(os.getenv('GST_PART_A_BURST', '1'))
+
+# Refill a bucket stored as a hash and take one token if available. Uses the server clock so
+# every node agrees on elapsed time. Returns {1, tokens} on success or {0, tokens} when empty.
+_TAKE_TOKEN = """
+local rate, per, burst = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate / per)
+local taken = 0
+if ARGV[4] == '1' and tokens >= 1 then
+  tokens = tokens - 1
+  taken = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(per * burst / rate) + 60)
+return {taken, tostring(tokens)}
+"""
+
+
+class TokenBucket:
+    """`rate` tokens per `per` seconds, holding at most `burst`; acquire() waits for a token"""
+
+    def __init__(self, name: str, rate: float, per: float = 60.0, burst: int = 1):
+        self.name = name
+        self.rate = rate
+        self.per = per
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.waiting = 0
+        self.throttled = 0
+        self.waited_seconds = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate / self.per)
+        self._updated = now
+
+    def _take(self) -> Tuple[bool, float]:
+        """Take a token if one is available; returns (taken, tokens left). Called with the lock held."""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, self.tokens
+        return False, self.tokens
+
+    def acquire(self) -> float:
+        """Take one token, waiting (cancellably) until one is available; returns the seconds waited"""
+        if not self.enabled:
+            return 0.0
+        started = time.monotonic()
+        queued = False
+        try:
+            while True:
+                with self._lock:
+                    taken, tokens = self._take()
+                    if taken:
+                        break
+                    shortfall = (1 - tokens) * self.per / self.rate
+                    if not queued:
+                        queued = True
+                        self.waiting += 1
+                        self.throttled += 1
+                        logger.info(f"🚦 {self.name} rate limit reached, waiting {shortfall:.1f}s for a slot")
+                cancellable_sleep(min(shortfall, CHECK_INTERVAL))
+        finally:
+            if queued:
+                with self._lock:
+                    self.waiting -= 1
+        waited = time.monotonic() - started
+        if queued:
+            with self._lock:
+                self.waited_seconds += waited
+            record_wait(f'{self.name}_quota', waited)
+        return waited
+
+    def _peek(self) -> float:
+        self._refill(time.monotonic())
+        return self.tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'rate': self.rate, 'per_seconds': self.per, 'burst': self.burst, 'tokens': round(self._peek(), 2),
+                'waiting': self.waiting, 'throttled': self.throttled, 'waited_seconds': round(self.waited_seconds, 1),
+            }
+
+
+class RedisTokenBucket(TokenBucket):
+    """
+    A TokenBucket whose tokens live in Redis, shared by every node using the same key. Waiting,
+    throttle and wait-time counts stay per node. If Redis is unreachable the node falls back to
+    its own local bucket until Redis answers again.
+    """
+
+    def __init__(self, name: str, rate: float, per: float = 60.0, burst: int = 1, client=None, key: str = ''):
+        super().__init__(name, rate, per, burst)
+        self.client = client
+        self.key = key
+        self.shared = True
+        self._script = client.register_script(_TAKE_TOKEN)
+
+    def _call(self, take: bool) -> Tuple[bool, float]:
+        try:
+            taken, tokens = self._script(keys=[self.key], args=[self.rate, self.per, self.burst, '1' if take else '0'])
+        except Exception as e:
+            if self.shared:
+                logger.warning(f"⚠️ Shared {self.name} rate limit unavailable, limiting this node on its own: {e}")
+                self.shared = False
+            return super()._take() if take else (False, super()._peek())
+        if not self.shared:
+            logger.info(f"✅ Shared {self.name} rate limit reachable again")
+            self.shared = True
+        return bool(taken), float(tokens)
+
+    def _take(self) -> Tuple[bool, float]:
+        return self._call(take=True)
+
+    def _peek(self) -> float:
+        return self._call(take=False)[1]
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats['shared'] = self.shared
+        return stats
+
+
+class SessionGovernor:
+    """Caps concurrent portal sessions; the cap follows page-load latency between min and max"""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, min_sessions: int = MIN_SESSIONS,
+                 slow_page_seconds: float = SLOW_PAGE_SECONDS, adjust_interval: float = ADJUST_INTERVAL):
+        self.max_sessions = max(1, max_sessions)
+        self.min_sessions = max(1, min(min_sessions, self.max_sessions))
+        self.slow_page_seconds = slow_page_seconds
+        self.adjust_interval = adjust_interval
+        self.limit = self.max_sessions
+        self.in_use = 0
+        self.waiting = 0
+        self.latency: Optional[float] = None
+        self.decreases = 0
+        self.increases = 0
+        self._samples = 0
+        self._adjusted = time.monotonic()
+        self._cond = threading.Condition()
+
+    def acquire(self) -> float:
+        """Wait (cancellably) for a free session slot; returns the seconds waited"""
+        started = time.monotonic()
+        with self._cond:
+            if self.in_use >= self.limit:
+                logger.info(f"🚦 {self.in_use}/{self.limit} portal sessions in use, waiting for a slot")
+            self.waiting += 1
+            try:
+                while self.in_use >= self.limit:
+                    self._cond.wait(CHECK_INTERVAL)
+                    check_cancelled()
+            finally:
+                self.waiting -= 1
+            self.in_use += 1
+        waited = time.monotonic() - started
+        if waited >= CHECK_INTERVAL:
+            record_wait('portal_session', waited)
+        return waited
+
+    def release(self):
+        with self._cond:
+            self.in_use = max(0, self.in_use - 1)
+            self._cond.notify()
+
+    def observe(self, seconds: float):
+        """Feed one page-load latency sample and adjust the cap at most once per adjust interval"""
+        with self._cond:
+            self.latency = seconds if self.latency is None else LATENCY_ALPHA * seconds + (1 - LATENCY_ALPHA) * self.latency
+            self._samples += 1
+            now = time.monotonic()
+            if self._samples < MIN_SAMPLES or now - self._adjusted < self.adjust_interval:
+                return
+            previous = self.limit
+            if self.latency > self.slow_page_seconds and self.limit > self.min_sessions:
+                self.limit = max(self.min_sessions, self.limit // 2)
+                self.decreases += 1
+            elif self.latency < 0.6 * self.slow_page_seconds and self.limit < self.max_sessions:
+                self.limit += 1
+                self.increases += 1
+                self._cond.notify_all()
+            self._adjusted, self._samples = now, 0
+            if self.limit != previous:
+                trend = '📉 Portal slowing down' if self.limit < previous else '📈 Portal recovered'
+                logger.warning(f"{trend} (page load ~{self.latency:.1f}s): "
+                               f"session limit {previous} -> {self.limit}")
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'limit': self.limit, 'min': self.min_sessions, 'max': self.max_sessions, 'in_use': self.in_use,
+                'waiting': self.waiting, 'page_load_ewma': round(self.latency, 2) if self.latency is not None else None,
+                'decreases': self.decreases, 'increases': self.increases,
+            }
+
+
+def _captcha_bucket() -> TokenBucket:
+    """The captcha quota is per solver account, so nodes sharing a Redis queue share one bucket"""
+    # Same settings as redis_queue.py; importing it here would be circular
+    if CAPTCHA_PER_MINUTE <= 0 or os.getenv('GST_QUEUE_BACKEND', 'local').lower() != 'redis':
+        return TokenBucket('captcha', CAPTCHA_PER_MINUTE, per=60.0, burst=CAPTCHA_BURST)
+    import redis
+    client = redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'), decode_responses=True)
+    prefix = os.getenv('GST_REDIS_QUEUE_PREFIX', 'gst:queue')
+    return RedisTokenBucket('captcha', CAPTCHA_PER_MINUTE, per=60.0, burst=CAPTCHA_BURST,
+                            client=client, key=f'{prefix}:bucket:captcha')
+
+
+class PortalGovernor:
+    """The process-wide set of portal limits"""
+
+    def __init__(self):
+        self.sessions = SessionGovernor()
+        self.captcha = _captcha_bucket()
+        self.part_a = TokenBucket('part_a', PART_A_PER_INTERVAL, per=PART_A_INTERVAL, burst=PART_A_BURST)
+
+    def stats(self) -> Dict[str, dict]:
+        return {'sessions': self.sessions.stats(), 'captcha': self.captcha.stats(), 'part_a': self.part_a.stats()}
+
+
+portal_governor = PortalGovernor()
+
+__all__ = ['TokenBucket', 'RedisTokenBucket', 'SessionGovernor', 'PortalGovernor', 'portal_governor']
@@ -0,0 +1,329 @@
+# File: jobs.py
+#
+# In-process job queue for GST registration runs
+# Registrations are queued on a bounded queue and run by a fixed pool of worker threads, in
+# priority/SLA order (see scheduling.py).
+# JSONL batches are parsed one line at a time and enqueued as they are read, so a large
+# batch never has to be held in memory; submit() blocks while the queue is full. The bound is
+# applied per priority class: a submit only counts pending jobs of its own or a higher class,
+# so an urgent job is never stuck behind a full queue of bulk backfill.
+
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterator, Optional
+
+from cancellation import CancelToken, JobCancelled, cancel_scope, cancellable_result
+from logger import job_log_context, job_log_path, logger, set_log_step
+from metrics import RunReport, enter_section, run_report
+from profiling import profile_job
+from scheduling import PRIORITIES, QueueWaitStats, Schedule
+from validation import validate_config
+
+JOB_WORKERS = int(os.getenv('GST_JOB_WORKERS', '1'))
+JOB_QUEUE_SIZE = int(os.getenv('GST_JOB_QUEUE_SIZE', '8'))
+JOB_HISTORY_SIZE = int(os.getenv('GST_JOB_HISTORY_SIZE', '500'))
+BATCH_MAX_LINE_BYTES = int(os.getenv('GST_BATCH_MAX_LINE_BYTES', str(1024 * 1024)))
+
+
+class Job:
+    """A single queued registration run"""
+
+    def __init__(self, config: dict, source: Optional[str] = None, profile: bool = False, job_id: Optional[str] = None,
+                 schedule: Optional[Schedule] = None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.schedule = schedule or Schedule.from_config(config)
+        self.config = config
+        self.source = source
+        self.profile = profile
+        self.profile_artifacts: Optional[Dict[str, str]] = None
+        self.report: Optional[dict] = None
+        # The run report while the job is running, for progress checks from other threads
+        self.live_report: Optional[RunReport] = None
+        self.status = 'queued'
+        self.error: Optional[str] = None
+        self.traceback: Optional[str] = None
+        self.submitted_at = self.schedule.submitted_at
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.prepared: Optional[Future] = None
+        self.cancel_token = CancelToken()
+        self._done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        business = ((self.config or {}).get('initial_registration_details') or {}).get('business_name')
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'source': self.source,
+            'business_name': business if business else None,
+            'error': self.error,
+            'cancel_reason': self.cancel_token.reason,
+            'priority': self.schedule.priority,
+            'deadline': self.schedule.deadline,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'log_file': job_log_path(self.id),
+            'profile': self.profile_artifacts,
+            'report': self.report,
+        }
+
+
+class JobQueue:
+    """Bounded queue of registration jobs, served by a pool of worker threads earliest run-by time first"""
+
+    def __init__(self, runner: Callable[[dict], None], workers: int = JOB_WORKERS,
+                 maxsize: int = JOB_QUEUE_SIZE, history_size: int = JOB_HISTORY_SIZE,
+                 prepare: Optional[Callable[[dict], Future]] = None,
+                 on_finish: Optional[Callable[[Job, dict], None]] = None):
+        self.runner = runner
+        # Optional non-blocking stage started at submit time (e.g. document preprocessing),
+        # so it overlaps with whatever job is currently in the browser
+        self.prepare = prepare
+        # Optional hook called with the finished job and its full config (e.g. run history),
+        # before the config is stripped from the job
+        self.on_finish = on_finish
+        self.workers = max(1, workers)
+        self.history_size = history_size
+        self.maxsize = max(1, maxsize)
+        # (run_by, sequence, job): the sequence keeps equal run-by times in submission order.
+        # Unbounded itself; admission is limited per priority class in submit()
+        self._queue: "queue.PriorityQueue[tuple]" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self.queue_waits = QueueWaitStats()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        self._pending = {priority: 0 for priority in PRIORITIES}
+        self._threads = []
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"gst-job-worker-{index + 1}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"👷 Started {self.workers} job worker(s), queue capacity {self.maxsize} per priority class")
+
+    def submit(self, config: dict, source: Optional[str] = None, block: bool = True,
+               timeout: Optional[float] = None, profile: bool = False, job_id: Optional[str] = None,
+               schedule: Optional[Schedule] = None) -> Job:
+        """
+        Queue a config for processing; blocks while the queue is full for its priority class
+        unless block=False (then raises queue.Full). Without a schedule, priority and deadline
+        come from the config.
+        """
+        self._start_workers()
+        job = Job(config, source=source, profile=profile, job_id=job_id, schedule=schedule)
+        with self._space:
+            if not self._space.wait_for(lambda: self._has_room(job.schedule.priority), timeout if block else 0):
+                raise queue.Full
+            self._pending[job.schedule.priority] += 1
+            self._jobs[job.id] = job
+            self._trim_history()
+        if self.prepare is not None:
+            job.prepared = self.prepare(config)
+        self._queue.put((job.schedule.run_by, next(self._sequence), job))
+        logger.info(f"📥 Queued {job.schedule.priority} job {job.id}" + (f" ({source})" if source else ""))
+        return job
+
+    def _has_room(self, priority: str) -> bool:
+        """Room for a job of this class: pending jobs of the same or a higher class are below the bound"""
+        ahead = PRIORITIES[:PRIORITIES.index(priority) + 1]
+        return sum(self._pending[name] for name in ahead) < self.maxsize
+
+    def _dequeued(self, job: Job):
+        """Free the job's admission slot; called with the lock held"""
+        self._pending[job.schedule.priority] -= 1
+        self._space.notify_all()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str, reason: str = 'cancelled by request') -> Optional[Job]:
+        """
+        Cancel a queued or running job. A queued job is finished on the spot; a running job's
+        browser is killed and the worker returns within a WebDriver poll. Returns the job, or
+        None if it is unknown; finished jobs are returned unchanged.
+        """
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        if not job.cancel_token.cancel(reason):
+            return job
+        logger.warning(f"🛑 Cancelling job {job.id} ({job.status}): {reason}")
+        with self._lock:
+            queued = job.status == 'queued'
+            if queued:
+                job.status = 'cancelled'
+                self._dequeued(job)
+        if queued:
+            if job.prepared is not None:
+                job.prepared.cancel()
+            job.error = f"cancelled: {reason}"
+            job.finished_at = time.time()
+            self._finish(job)
+            job._done.set()
+        return job
+
+    def is_active(self, job_id: str) -> bool:
+        """True while the job is queued or running"""
+        job = self.get(job_id)
+        return job is not None and not job.finished
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts: Dict = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            counts['pending'] = sum(self._pending.values())
+        counts['queue_wait'] = self.queue_waits.snapshot()
+        return counts
+
+    def _trim_history(self):
+        # Only finished jobs are evicted; queued and running jobs always stay visible
+        excess = len(self._jobs) - self.history_size
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished][:excess]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            with self._lock:
+                # Jobs cancelled while queued are already finished; just drop them
+                skip = job.status == 'cancelled'
+                if not skip:
+                    job.status = 'running'
+                    self._dequeued(job)
+            if not skip:
+                self.queue_waits.record(job.schedule, time.time())
+                with job_log_context(job.id):
+                    self._run(job)
+                job._done.set()
+            self._queue.task_done()
+
+    def _run(self, job: Job):
+        job.started_at = time.time()
+        logger.info(f"🚀 Starting job {job.id}")
+        report = None
+        try:
+            with cancel_scope(job.cancel_token), run_report() as report:
+                job.live_report = report
+                enter_section('documents')
+                config = cancellable_result(job.prepared) if job.prepared is not None else job.config
+                with profile_job(job.id, enabled=job.profile) as artifacts:
+                    job.profile_artifacts = artifacts
+                    self.runner(config)
+                # A cancel swallowed by a bare `except:` in the flow still ends the job as cancelled
+                job.cancel_token.raise_if_cancelled()
+            set_log_step(None)
+            job.status = 'succeeded'
+            logger.info(f"✅ Job {job.id} completed in {time.time() - job.started_at:.1f}s")
+        except JobCancelled:
+            set_log_step(None)
+            job.status = 'cancelled'
+            job.error = f"cancelled: {job.cancel_token.reason}"
+            logger.warning(f"🛑 Job {job.id} cancelled after {time.time() - job.started_at:.1f}s")
+        except Exception as e:
+            set_log_step(None)
+            job.status = 'failed'
+            job.error = str(e)
+            job.traceback = traceback.format_exc()
+            logger.error(f"❌ Job {job.id} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+            job.report = report.to_dict() if report is not None else None
+            job.live_report = None
+            self._finish(job)
+
+    def _finish(self, job: Job):
+        """Hand a finished (or cancelled-while-queued) job to on_finish, then drop its payload"""
+        if self.on_finish is not None:
+            self.on_finish(job, job.config)
+        # Keep the business name for status lookups but drop the rest of the payload
+        business = (job.config or {}).get('initial_registration_details') or {}
+        job.config = {'initial_registration_details': {'business_name': business.get('business_name')}}
+        job.prepared = None
+
+
+def _read_lines(stream, max_line_bytes: int) -> Iterator[tuple]:
+    """Yield (line, too_long) from a file-like stream without ever buffering more than one bounded line"""
+    if not hasattr(stream, 'readline'):
+        for line in stream:
+            yield line, len(line) > max_line_bytes
+        return
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        if len(line) > max_line_bytes and not line.endswith(b'\n' if isinstance(line, bytes) else '\n'):
+            # Skip the rest of the over-long line in bounded chunks
+            while True:
+                rest = stream.readline(max_line_bytes + 1)
+                if not rest or rest.endswith(b'\n' if isinstance(rest, bytes) else '\n'):
+                    break
+            yield line, True
+            continue
+        yield line, False
+
+
+def iter_jsonl(stream, max_line_bytes: int = BATCH_MAX_LINE_BYTES) -> Iterator[tuple]:
+    """
+    Yield (line_number, config, errors) for each non-blank line of a JSONL stream.
+    Accepts open files, request streams or any iterable of str/bytes lines; over-long
+    lines are reported as errors instead of being parsed.
+    """
+    for line_number, (raw, too_long) in enumerate(_read_lines(stream, max_line_bytes), start=1):
+        if too_long:
+            yield line_number, None, [f"line exceeds {max_line_bytes} bytes"]
+            continue
+        if isinstance(raw, bytes):
+            raw = raw.decode('utf-8', errors='replace')
+        raw = raw.strip()
+        if not raw or raw.startswith('#'):
+            continue
+        try:
+            config = json.loads(raw)
+        except json.JSONDecodeError as e:
+            yield line_number, None, [f"invalid JSON: {e}"]
+            continue
+        yield line_number, config, validate_config(config)
+
+
+def ingest_jsonl(stream, job_queue: JobQueue, source: str = 'batch', profile: bool = False,
+                 priority: Optional[str] = None) -> Iterator[dict]:
+    """
+    Validate and enqueue each JSONL record as it is read, yielding one result per record.
+    `priority` applies to records that don't set their own (e.g. 'bulk' for a backfill).
+    """
+    for line_number, config, errors in iter_jsonl(stream):
+        if errors:
+            logger.warning(f"⚠️ {source} line {line_number} rejected with {len(errors)} error(s)")
+            yield {'line': line_number, 'status': 'invalid', 'errors': errors}
+            continue
+        job = job_queue.submit(config, source=f"{source}:{line_number}", profile=profile,
+                               schedule=Schedule.from_config(config, priority=priority))
+        yield {'line': line_number, 'status': 'queued', 'job_id': job.id}
+
+
+__all__ = ['Job', 'JobQueue', 'iter_jsonl', 'ingest_jsonl']
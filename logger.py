@@ -1,47 +1,245 @@
 # File: logger.py
 #
 # Logger configuration for the GST registration automation
-# Provides a configured logger instance for all automation operations
+# Automation threads only put records on an in-memory queue; a single QueueListener thread does
+# the file and console I/O. Records carry the current job id and step, and each job also gets
+# its own rotating JSON-lines file under logs/jobs/.
+# Importing this module has no side effects: the pipeline is built by configure_logging(),
+# called by entry points or automatically on the first record.
 
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Dict, Optional
 
-# Create logs directory if it doesn't exist
-if not os.path.exists('logs'):
-    os.makedirs('logs')
+LOG_DIR = os.getenv('GST_LOG_DIR', 'logs')
+JOB_LOG_DIR = os.path.join(LOG_DIR, 'jobs')
+# GST_LOG_LEVEL=WARNING silences the per-click INFO chatter on the hot path
+LOG_LEVEL = os.getenv('GST_LOG_LEVEL', 'INFO').upper()
+CONSOLE_LOG_LEVEL = os.getenv('GST_CONSOLE_LOG_LEVEL', LOG_LEVEL).upper()
+LOG_FORMAT = os.getenv('GST_LOG_FORMAT', 'text').lower()  # text | json for the main log file
+LOG_MAX_BYTES = int(os.getenv('GST_LOG_MAX_BYTES', str(20 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('GST_LOG_BACKUP_COUNT', '5'))
+JOB_LOG_MAX_BYTES = int(os.getenv('GST_JOB_LOG_MAX_BYTES', str(5 * 1024 * 1024)))
+JOB_LOG_BACKUP_COUNT = int(os.getenv('GST_JOB_LOG_BACKUP_COUNT', '2'))
 
-# Create logger instance
+_job_id: contextvars.ContextVar = contextvars.ContextVar('gst_job_id', default=None)
+_step: contextvars.ContextVar = contextvars.ContextVar('gst_step', default=None)
+
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the job id and step of the thread that logged them"""
+
+    def filter(self, record):
+        record.job_id = _job_id.get()
+        record.step = _step.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'job_id': getattr(record, 'job_id', None),
+            'step': getattr(record, 'step', None),
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class ContextTextFormatter(logging.Formatter):
+    """The classic text format, prefixed with [job/step] when a job is running"""
+
+    def format(self, record):
+        line = super().format(record)
+        job_id = getattr(record, 'job_id', None)
+        if not job_id:
+            return line
+        step = getattr(record, 'step', None)
+        return f"[{job_id}{'/' + step if step else ''}] {line}"
+
+
+class JobFileHandler(logging.Handler):
+    """Routes records that carry a job id to that job's own rotating JSON-lines file"""
+
+    def __init__(self, directory: str = JOB_LOG_DIR):
+        super().__init__()
+        self.directory = directory
+        self._handlers: Dict[str, logging.Handler] = {}
+        self._handlers_lock = threading.Lock()
+
+    def _handler_for(self, job_id: str) -> logging.Handler:
+        with self._handlers_lock:
+            handler = self._handlers.get(job_id)
+            if handler is None:
+                os.makedirs(self.directory, exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    os.path.join(self.directory, f'{job_id}.log'), maxBytes=JOB_LOG_MAX_BYTES,
+                    backupCount=JOB_LOG_BACKUP_COUNT, encoding='utf-8')
+                handler.setFormatter(JsonFormatter())
+                self._handlers[job_id] = handler
+            return handler
+
+    def emit(self, record):
+        job_id = getattr(record, 'job_id', None)
+        if job_id:
+            self._handler_for(job_id).handle(record)
+
+    def close_job(self, job_id: str):
+        with self._handlers_lock:
+            handler = self._handlers.pop(job_id, None)
+        if handler is not None:
+            handler.close()
+
+    def close(self):
+        with self._handlers_lock:
+            handlers, self._handlers = list(self._handlers.values()), {}
+        for handler in handlers:
+            handler.close()
+        super().close()
+
+
+class _JobClosed:
+    """Queue sentinel asking the listener thread to close a job's file once its records are written"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+
+class _GstQueueListener(logging.handlers.QueueListener):
+    def handle(self, record):
+        if isinstance(record, _JobClosed):
+            _job_file_handler.close_job(record.job_id)
+            return
+        super().handle(record)
+
+
+class _LazyBootstrapHandler(logging.Handler):
+    """Sits on the logger until the first record, then installs the real pipeline and hands the record over"""
+
+    def emit(self, record):
+        configure_logging()
+        logger.handle(record)
+
+
+# Create logger instance; nothing touches the filesystem until configure_logging() runs
 logger = logging.getLogger('gst_automation')
-logger.setLevel(logging.INFO)
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+
+_log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+_job_file_handler = JobFileHandler()
+_listener: Optional[_GstQueueListener] = None
+_listener_handlers = []
+_configure_lock = threading.Lock()
+_bootstrap_handler = _LazyBootstrapHandler()
 
 # Prevent duplicate handlers
 if not logger.handlers:
-    # Create formatters
-    file_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
-    console_formatter = logging.Formatter(
-        '%(asctime)s - %(levelname)s - %(message)s',
-        datefmt='%H:%M:%S'
-    )
-    
-    # File handler - logs to file with timestamp
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    file_handler = logging.FileHandler(f'logs/gst_automation_{timestamp}.log')
-    file_handler.setLevel(logging.INFO)
-    file_handler.setFormatter(file_formatter)
-    
-    # Console handler - logs to console
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(console_formatter)
-    
-    # Add handlers to logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    logger.addHandler(_bootstrap_handler)
+
+
+def configure_logging(level: Optional[str] = None, console_level: Optional[str] = None) -> logging.Logger:
+    """
+    Build the queue-based pipeline. Entry points call this explicitly; library code never needs
+    to, since the first record logged triggers it. Safe to call more than once.
+    """
+    global _listener, _listener_handlers
+    with _configure_lock:
+        if level:
+            logger.setLevel(level.upper())
+        if _listener is not None:
+            return logger
+
+        os.makedirs(LOG_DIR, exist_ok=True)
+
+        text_formatter = ContextTextFormatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+        console_formatter = ContextTextFormatter(
+            '%(asctime)s - %(levelname)s - %(message)s',
+            datefmt='%H:%M:%S'
+        )
+
+        # File handler - process-wide log, rotated by size; opened on first write
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        file_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(LOG_DIR, f'gst_automation_{timestamp}.log'), maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True)
+        file_handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else text_formatter)
+
+        # Console handler - logs to console
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel((console_level or CONSOLE_LOG_LEVEL).upper())
+        console_handler.setFormatter(console_formatter)
+
+        # The only handler on the hot path: stamp context, enqueue, return
+        queue_handler = logging.handlers.QueueHandler(_log_queue)
+        queue_handler.addFilter(ContextFilter())
+
+        _listener_handlers = [file_handler, console_handler, _job_file_handler]
+        _listener = _GstQueueListener(_log_queue, *_listener_handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+        logger.removeHandler(_bootstrap_handler)
+        logger.addHandler(queue_handler)
+    return logger
+
+
+def shutdown_logging():
+    """Flush queued records and close every handler"""
+    global _listener
+    with _configure_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+        for handler in _listener_handlers:
+            handler.close()
+
+
+@contextmanager
+def job_log_context(job_id: str):
+    """Tag every record logged inside the block with job_id and mirror it to logs/jobs/<job_id>.log"""
+    job_token = _job_id.set(job_id)
+    step_token = _step.set(None)
+    try:
+        yield
+    finally:
+        _step.reset(step_token)
+        _job_id.reset(job_token)
+        # Goes through the queue so the file closes after the job's last record is written
+        if _listener is not None:
+            _log_queue.put(_JobClosed(job_id))
+
+
+def set_log_step(step: Optional[str]):
+    """Name the step that subsequent records from this thread belong to"""
+    _step.set(step)
+
+
+def current_job_id() -> Optional[str]:
+    """The job whose log context is active in this thread, if any"""
+    return _job_id.get()
+
+
+def job_log_path(job_id: str) -> str:
+    return os.path.join(JOB_LOG_DIR, f'{job_id}.log')
+
 
 # Export the configured logger
-__all__ = ['logger'] 
\ No newline at end of file
+__all__ = ['logger', 'configure_logging', 'job_log_context', 'set_log_step', 'current_job_id', 'job_log_path',
+           'shutdown_logging']
@@ -0,0 +1,192 @@
+# File: metrics.py
+#
+# Per-run timing report
+# A RunReport is bound to the running job through a contextvar. Helpers in functions.py and
+# the section modules record retries, captcha attempts, fallbacks and waits into whichever
+# report is active; with no active report every record_* call is a no-op.
+
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from cancellation import JobCancelled
+from logger import set_log_step
+
+_current_report: contextvars.ContextVar = contextvars.ContextVar('gst_run_report', default=None)
+
+
+class RunReport:
+    """Structured breakdown of one registration run"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.status = 'running'
+        self.error_class: Optional[str] = None
+        self.sections: List[dict] = []
+        self.retries: Dict[str, int] = {}
+        self.fallbacks: Dict[str, int] = {}
+        self.waits: Dict[str, float] = {}
+        self.captcha = {'attempts': 0, 'accepted': 0, 'rejected': 0, 'backends': {}}
+        self.labels: Dict[str, str] = {}
+        self.section_errors: List[dict] = []
+        self._section_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    # --- Sections ---
+
+    def enter_section(self, name: str):
+        with self._lock:
+            self._close_section('completed')
+            self.sections.append({'name': name, 'seconds': None, 'status': 'running'})
+            self._section_started = time.monotonic()
+
+    def _close_section(self, status: str):
+        if self.sections and self.sections[-1]['status'] == 'running':
+            self.sections[-1]['seconds'] = round(time.monotonic() - self._section_started, 3)
+            self.sections[-1]['status'] = status
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._lock:
+            self._close_section('cancelled' if isinstance(error, JobCancelled) else 'failed' if error else 'completed')
+            self.finished_at = time.time()
+            self.status = 'cancelled' if isinstance(error, JobCancelled) else 'failed' if error else 'succeeded'
+            self.error_class = type(error).__name__ if error else None
+
+    # --- Counters ---
+
+    def record_retry(self, step: str):
+        with self._lock:
+            self.retries[step] = self.retries.get(step, 0) + 1
+
+    def record_fallback(self, strategy: str):
+        with self._lock:
+            self.fallbacks[strategy] = self.fallbacks.get(strategy, 0) + 1
+
+    def record_wait(self, kind: str, seconds: float):
+        with self._lock:
+            self.waits[kind] = round(self.waits.get(kind, 0.0) + seconds, 3)
+
+    def record_captcha_attempt(self, backend: str):
+        with self._lock:
+            self.captcha['attempts'] += 1
+            self.captcha['backends'][backend] = self.captcha['backends'].get(backend, 0) + 1
+
+    def record_captcha_outcome(self, accepted: bool):
+        with self._lock:
+            self.captcha['accepted' if accepted else 'rejected'] += 1
+
+    def record_section_error(self, section: str, error: BaseException, action: str):
+        with self._lock:
+            self.section_errors.append({'section': section, 'error_class': type(error).__name__,
+                                        'message': str(error).strip()[:500], 'action': action})
+
+    def set_label(self, key: str, value: str):
+        with self._lock:
+            self.labels[key] = value
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                'status': self.status,
+                'error_class': self.error_class,
+                'total_seconds': round(end - self.started_at, 3),
+                'sections': [dict(section) for section in self.sections],
+                'retries': dict(self.retries),
+                'total_retries': sum(self.retries.values()),
+                'captcha': {**self.captcha, 'backends': dict(self.captcha['backends'])},
+                'fallbacks': dict(self.fallbacks),
+                'waits': dict(self.waits),
+                'labels': dict(self.labels),
+                'section_errors': [dict(error) for error in self.section_errors],
+            }
+
+
+@contextmanager
+def run_report():
+    """Bind a fresh RunReport to the current context for the duration of the block"""
+    report = RunReport()
+    token = _current_report.set(report)
+    try:
+        yield report
+    except BaseException as e:
+        report.finish(e)
+        raise
+    else:
+        report.finish()
+    finally:
+        _current_report.reset(token)
+
+
+def current_report() -> Optional[RunReport]:
+    return _current_report.get()
+
+
+def enter_section(name: str):
+    """Mark the start of a named section; also becomes the step on log records"""
+    set_log_step(name)
+    report = _current_report.get()
+    if report is not None:
+        report.enter_section(name)
+
+
+def record_retry(step: str):
+    report = _current_report.get()
+    if report is not None:
+        report.record_retry(step)
+
+
+def record_fallback(strategy: str):
+    report = _current_report.get()
+    if report is not None:
+        report.record_fallback(strategy)
+
+
+def record_wait(kind: str, seconds: float):
+    report = _current_report.get()
+    if report is not None:
+        report.record_wait(kind, seconds)
+
+
+def record_captcha_attempt(backend: str):
+    report = _current_report.get()
+    if report is not None:
+        report.record_captcha_attempt(backend)
+
+
+def record_captcha_outcome(accepted: bool):
+    report = _current_report.get()
+    if report is not None:
+        report.record_captcha_outcome(accepted)
+
+
+def record_section_error(section: str, error: BaseException, action: str):
+    """A tolerant section failed; action is what the error policy did about it"""
+    report = _current_report.get()
+    if report is not None:
+        report.record_section_error(section, error, action)
+
+
+def percentile(sorted_values: List[float], pct: float, digits: Optional[int] = None) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list, optionally rounded; None when it is empty"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    value = sorted_values[min(rank, len(sorted_values)) - 1]
+    return round(value, digits) if digits is not None else value
+
+
+def set_report_label(key: str, value: str):
+    """Tag the run with how it was executed (e.g. browser profile), for comparing runs later"""
+    report = _current_report.get()
+    if report is not None:
+        report.set_label(key, value)
+
+
+__all__ = ['RunReport', 'run_report', 'current_report', 'enter_section', 'record_retry', 'record_fallback',
+           'record_wait', 'record_captcha_attempt', 'record_captcha_outcome', 'record_section_error',
+           'set_report_label', 'percentile']
@@ -4,6 +4,7 @@
 from flask import Flask, request, jsonify, render_template
 from redis import from_url, exceptions
 import os
+import time
 from flask_cors import CORS
 import logging
 
@@ -93,6 +94,38 @@ def get_otp_route():
     
     return jsonify({"success": True, "data": {"otp": otp_value}})
 
+# --- Local Captcha Stand-In ---
+# Speaks the TrueCaptcha JSON protocol so the automation can run offline against a mock portal.
+# The answer comes from the 'captcha_answer' key (set by the mock portal) or CAPTCHA_STANDIN_ANSWER.
+CAPTCHA_STANDIN_ANSWER = os.getenv("CAPTCHA_STANDIN_ANSWER", "")
+CAPTCHA_STANDIN_DELAY_MS = int(os.getenv("CAPTCHA_STANDIN_DELAY_MS", "0"))
+
+@app.route('/submit-captcha-answer', methods=['POST'])
+def submit_captcha_answer_route():
+    data = request.get_json(silent=True) or {}
+    answer = str(data.get('captcha_answer', '')).strip()
+    if not answer:
+        return jsonify({"success": False, "data": {"message": "Error: 'captcha_answer' is required."}}), 400
+
+    redis_client.set('captcha_answer', answer)
+    logger.info("Stand-in captcha answer set.")
+    return jsonify({"success": True, "data": {"message": "Success: Captcha answer received."}}), 200
+
+@app.route('/solve-captcha', methods=['POST'])
+def solve_captcha_route():
+    data = request.get_json(silent=True) or {}
+    if not data.get('data'):
+        return jsonify({"error": "Missing image 'data'."}), 400
+
+    if CAPTCHA_STANDIN_DELAY_MS:
+        # Simulated solver latency for benchmarking
+        time.sleep(CAPTCHA_STANDIN_DELAY_MS / 1000)
+
+    answer = redis_client.get('captcha_answer') or CAPTCHA_STANDIN_ANSWER
+    if not answer:
+        return jsonify({"error": "No stand-in captcha answer configured."}), 503
+    return jsonify({"result": answer})
+
 if __name__ == '__main__':
     port = int(os.getenv("PORT", 3000))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,183 @@
+# File: profiling.py
+#
+# Opt-in sampling profiler for single registration runs
+# A background thread samples the job thread's Python stack every few milliseconds with
+# sys._current_frames() (no extra dependencies, negligible overhead) and writes a speedscope
+# profile plus folded stacks for flamegraph.pl next to the job's log.
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from logger import JOB_LOG_DIR, logger
+
+PROFILE_INTERVAL = float(os.getenv('GST_PROFILE_INTERVAL_MS', '10')) / 1000.0
+PROFILE_MAX_DEPTH = int(os.getenv('GST_PROFILE_MAX_DEPTH', '128'))
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+_SELENIUM_MARKER = f"{os.sep}selenium{os.sep}"
+
+Frame = Tuple[str, str, int]  # (filename, function, first line)
+
+
+class SamplingProfiler:
+    """Samples one thread's stack on a timer; consecutive identical stacks are merged into one weighted sample"""
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.frames: List[Frame] = []
+        self._frame_index: Dict[Frame, int] = {}
+        self.samples: List[Tuple[int, ...]] = []
+        self.weights: List[float] = []
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._sample_loop, name='gst-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.monotonic() - (self.started_at or time.monotonic())
+
+    def _frame_id(self, frame) -> int:
+        code = frame.f_code
+        key = (code.co_filename, code.co_name, code.co_firstlineno)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = self._frame_index[key] = len(self.frames)
+            self.frames.append(key)
+        return index
+
+    def _sample_loop(self):
+        last = time.monotonic()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.monotonic()
+            elapsed, last = now - last, now
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                stack.append(self._frame_id(frame))
+                frame = frame.f_back
+            stack = tuple(reversed(stack))  # root first, as speedscope expects
+            if self.samples and self.samples[-1] == stack:
+                self.weights[-1] += elapsed
+            else:
+                self.samples.append(stack)
+                self.weights.append(elapsed)
+
+    # --- Output ---
+
+    def _label(self, index: int) -> str:
+        filename, function, line = self.frames[index]
+        return f"{function} ({os.path.basename(filename)}:{line})"
+
+    def to_speedscope(self, name: str) -> dict:
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'gst-automation profiling.py',
+            'shared': {'frames': [
+                {'name': function, 'file': filename, 'line': line} for filename, function, line in self.frames
+            ]},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': round(sum(self.weights), 6),
+                'samples': [list(stack) for stack in self.samples],
+                'weights': [round(weight, 6) for weight in self.weights],
+            }],
+        }
+
+    def to_folded(self) -> str:
+        """Brendan Gregg's folded format, weights in milliseconds"""
+        totals: Dict[Tuple[int, ...], float] = {}
+        for stack, weight in zip(self.samples, self.weights):
+            totals[stack] = totals.get(stack, 0.0) + weight
+        lines = [
+            f"{';'.join(self._label(index) for index in stack)} {max(1, round(weight * 1000))}"
+            for stack, weight in totals.items()
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, top: int = 15) -> dict:
+        """
+        Seconds attributed to the innermost repo function on the stack (so time spent inside
+        Selenium is charged to the helper that called it) and total time inside WebDriver calls.
+        """
+        by_function: Dict[str, float] = {}
+        in_webdriver = 0.0
+        for stack, weight in zip(self.samples, self.weights):
+            frames = [self.frames[index] for index in stack]
+            if any(_SELENIUM_MARKER in filename for filename, _, _ in frames):
+                in_webdriver += weight
+            for position in range(len(stack) - 1, -1, -1):
+                if frames[position][0].startswith(_REPO_DIR):
+                    label = self._label(stack[position])
+                    by_function[label] = by_function.get(label, 0.0) + weight
+                    break
+        ranked = sorted(by_function.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {
+            'duration_s': round(self.duration, 3),
+            'sampled_s': round(sum(self.weights), 3),
+            'webdriver_s': round(in_webdriver, 3),
+            'outside_webdriver_s': round(sum(self.weights) - in_webdriver, 3),
+            'top_functions': [{'function': label, 'seconds': round(seconds, 3)} for label, seconds in ranked],
+        }
+
+
+def profile_paths(job_id: str, directory: str = JOB_LOG_DIR) -> Dict[str, str]:
+    return {
+        'speedscope': os.path.join(directory, f'{job_id}.speedscope.json'),
+        'folded': os.path.join(directory, f'{job_id}.folded'),
+        'summary': os.path.join(directory, f'{job_id}.profile.json'),
+    }
+
+
+@contextmanager
+def profile_job(job_id: str, enabled: bool = True, directory: str = JOB_LOG_DIR):
+    """
+    Profile the calling thread for the duration of the block and write the artifacts on exit,
+    whether the job succeeded or not. Yields the artifact paths (None when disabled).
+    """
+    if not enabled:
+        yield None
+        return
+    profiler = SamplingProfiler()
+    paths = profile_paths(job_id, directory)
+    logger.info(f"🔬 Profiling job {job_id} every {profiler.interval * 1000:.0f}ms")
+    profiler.start()
+    try:
+        yield paths
+    finally:
+        profiler.stop()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(paths['speedscope'], 'w') as f:
+                json.dump(profiler.to_speedscope(f'GST job {job_id}'), f)
+            with open(paths['folded'], 'w') as f:
+                f.write(profiler.to_folded())
+            summary = profiler.summary()
+            with open(paths['summary'], 'w') as f:
+                json.dump(summary, f, indent=2)
+            logger.info(f"🔥 Profile for job {job_id}: {summary['webdriver_s']}s in WebDriver, {summary['outside_webdriver_s']}s outside; "
+                        f"open {paths['speedscope']} in https://www.speedscope.app")
+        except OSError as e:
+            logger.error(f"❌ Could not write profile for job {job_id}: {e}")
+
+
+__all__ = ['SamplingProfiler', 'profile_job', 'profile_paths']
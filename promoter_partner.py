@@ -18,13 +18,16 @@ from functions import (
 )
 import time
 from logger import logger
+from metrics import record_fallback
 import json
 
 # --- Helper functions are now imported from functions.py ---
 
-def fill_promoter_partner_details(driver):
-    with open('config.json', 'r') as f:
-        config = json.load(f)
+def fill_promoter_partner_details(driver, config=None):
+    # The config is passed in by run_full_automation; config.json is only a fallback for standalone use
+    if config is None:
+        with open('config.json', 'r') as f:
+            config = json.load(f)
 
     promoters_list = config.get('promoter_partner_details')
     
@@ -107,6 +110,7 @@ def fill_promoter_partner_details(driver):
                             if add_new_button.is_displayed() and add_new_button.is_enabled():
                                 add_new_button.click()
                                 logger.info(f"✅ Successfully clicked 'Add New' button (Strategy 2: {selector})")
+                                record_fallback('add_new_strategy_2')
                                 # Handle confirmation dialog if it appears
                                 handle_confirmation_dialog(driver, logger)
                                 add_new_clicked = True
@@ -124,6 +128,7 @@ def fill_promoter_partner_details(driver):
                             if "Add New" in btn.text and btn.is_displayed() and btn.is_enabled():
                                 btn.click()
                                 logger.info(f"✅ Successfully clicked 'Add New' button (Strategy 3: text match)")
+                                record_fallback('add_new_strategy_3')
                                 # Handle confirmation dialog if it appears
                                 handle_confirmation_dialog(driver, logger)
                                 add_new_clicked = True
@@ -154,6 +159,7 @@ def fill_promoter_partner_details(driver):
                                 if ("Add New" in text or "Add New" in title) and displayed and enabled:
                                     driver.execute_script("arguments[0].click();", btn)
                                     logger.info(f"✅ Successfully clicked 'Add New' button (Strategy 4: JavaScript on button {idx})")
+                                    record_fallback('add_new_strategy_4_js')
                                     # Handle confirmation dialog if it appears
                                     handle_confirmation_dialog(driver, logger)
                                     add_new_clicked = True
@@ -172,6 +178,7 @@ def fill_promoter_partner_details(driver):
                         add_new_button = driver.find_element(By.XPATH, "/html/body/div[2]/div/div/div[3]/form/div[2]/div[2]/div/button[2]")
                         driver.execute_script("arguments[0].click();", add_new_button)
                         logger.info("✅ Successfully clicked 'Add New' button (Strategy 5: Force JavaScript)")
+                        record_fallback('add_new_strategy_5_force_js')
                         # Handle confirmation dialog if it appears
                         handle_confirmation_dialog(driver, logger)
                         add_new_clicked = True
@@ -234,6 +241,7 @@ def fill_promoter_partner_details(driver):
                         )
                         button.click()
                         logger.info(f"✅ Save & Continue clicked for last promoter (Strategy 2: {xpath})")
+                        record_fallback('save_continue_strategy_2')
                         # Handle confirmation dialog if it appears
                         handle_confirmation_dialog(driver, logger)
                         save_continue_clicked = True
@@ -250,6 +258,7 @@ def fill_promoter_partner_details(driver):
                     wait_for_element_stable(driver, (By.XPATH, "/html/body/div[2]/div/div/div[3]/form/div[2]/div[2]/div/button[3]"))  # Replace time.sleep(1)
                     driver.execute_script("arguments[0].click();", button)
                     logger.info(f"✅ Save & Continue clicked for last promoter (Strategy 3: JavaScript)")
+                    record_fallback('save_continue_strategy_3_js')
                     # Handle confirmation dialog if it appears
                     handle_confirmation_dialog(driver, logger)
                     save_continue_clicked = True
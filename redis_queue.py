@@ -0,0 +1,507 @@
+# File: redis_queue.py
+#
+# Redis-backed job queue for running registrations on several nodes
+# The API node pushes jobs onto a Redis list; `app.py --worker` processes on any number of
+# boxes claim them into a visibility-timeout set and run them on their local JobQueue (and
+# so their local browser pool), at most GST_NODE_CONCURRENCY at a time. Workers heartbeat
+# their in-flight jobs; a job whose deadline lapses (worker died or hung) goes back on the
+# queue until it has used GST_QUEUE_MAX_ATTEMPTS attempts, then lands on the dead-letter list.
+# Only jobs that never got Part A accepted by the portal are retried: a rerun after that point
+# would file a duplicate application, so those go straight to the dead-letter list.
+# Pending jobs are a sorted set scored by their run-by time, so every node serves the most
+# urgent job first (see scheduling.py).
+
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from jobs import JobQueue
+from logger import job_log_path, logger
+from scheduling import Schedule
+
+QUEUE_BACKEND = os.getenv('GST_QUEUE_BACKEND', 'local').lower()
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+QUEUE_PREFIX = os.getenv('GST_REDIS_QUEUE_PREFIX', 'gst:queue')
+QUEUE_MAX_PENDING = int(os.getenv('GST_REDIS_QUEUE_SIZE', '1000'))
+VISIBILITY_TIMEOUT = float(os.getenv('GST_VISIBILITY_TIMEOUT', '600'))
+MAX_ATTEMPTS = int(os.getenv('GST_QUEUE_MAX_ATTEMPTS', '3'))
+# 0 means one slot per local job worker (GST_JOB_WORKERS)
+NODE_CONCURRENCY = int(os.getenv('GST_NODE_CONCURRENCY', '0'))
+NODE_ID = os.getenv('GST_NODE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+JOB_TTL = int(os.getenv('GST_REDIS_JOB_TTL_HOURS', '168')) * 3600
+POLL_INTERVAL = 1.0
+# How often a worker checks its running jobs for cancel requests (independent of the heartbeat)
+CANCEL_POLL_INTERVAL = float(os.getenv('GST_CANCEL_POLL_SECONDS', '1'))
+# Run report label set once the portal has accepted Part A (see app.py)
+PART_A_SUBMITTED = 'part_a_submitted'
+
+FINISHED = ('succeeded', 'failed', 'cancelled')
+
+# Pop the pending job with the earliest run-by time and mark it in flight until now + visibility timeout
+_CLAIM = """
+local id = redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+if not id then return nil end
+redis.call('ZREM', KEYS[1], id)
+local key = ARGV[4] .. id
+if redis.call('EXISTS', key) == 0 then return '' end
+redis.call('ZADD', KEYS[2], tonumber(ARGV[1]) + tonumber(ARGV[2]), id)
+redis.call('HSET', key, 'status', 'running', 'node', ARGV[3], 'started_at', ARGV[1])
+redis.call('HINCRBY', key, 'attempts', 1)
+return id
+"""
+
+# Settle an in-flight job, but only if this node still owns it
+_FINISH = """
+local id = ARGV[1]
+local key = ARGV[6] .. id
+if redis.call('HGET', key, 'node') ~= ARGV[2] or not redis.call('ZSCORE', KEYS[1], id) then return 0 end
+redis.call('ZREM', KEYS[1], id)
+for i = 8, #ARGV, 2 do redis.call('HSET', key, ARGV[i], ARGV[i + 1]) end
+if ARGV[3] == 'retry' then
+  redis.call('HSET', key, 'status', 'queued', 'node', '')
+  redis.call('ZADD', KEYS[3], redis.call('HGET', key, 'run_by') or ARGV[4], id)
+  return 1
+end
+redis.call('HSET', key, 'status', ARGV[3], 'finished_at', ARGV[4])
+if ARGV[5] == '1' then
+  redis.call('LPUSH', KEYS[2], id)
+else
+  redis.call('EXPIRE', key, ARGV[7])
+end
+return 1
+"""
+
+# Requeue (or dead-letter) jobs whose visibility deadline has passed
+_REAP = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local requeued, dead = 0, 0
+for _, id in ipairs(ids) do
+  redis.call('ZREM', KEYS[1], id)
+  local key = ARGV[3] .. id
+  local node = redis.call('HGET', key, 'node') or '?'
+  if redis.call('HGET', key, 'cancel_requested') then
+    redis.call('HSET', key, 'status', 'cancelled', 'node', '', 'finished_at', ARGV[1])
+    redis.call('EXPIRE', key, ARGV[4])
+  elseif redis.call('HGET', key, 'part_a_submitted') then
+    redis.call('HSET', key, 'status', 'failed', 'node', '', 'finished_at', ARGV[1], 'dead_letter', '1',
+               'error', 'visibility timeout expired on node ' .. node .. ' after Part A was submitted (not retried)')
+    redis.call('LPUSH', KEYS[3], id)
+    dead = dead + 1
+  elseif tonumber(redis.call('HGET', key, 'attempts') or '0') >= tonumber(ARGV[2]) then
+    redis.call('HSET', key, 'status', 'failed', 'node', '', 'finished_at', ARGV[1], 'dead_letter', '1',
+               'error', 'visibility timeout expired on node ' .. node .. ' (attempts exhausted)')
+    redis.call('LPUSH', KEYS[3], id)
+    dead = dead + 1
+  else
+    redis.call('HSET', key, 'status', 'queued', 'node', '', 'error', 'visibility timeout expired on node ' .. node)
+    redis.call('ZADD', KEYS[2], redis.call('HGET', key, 'run_by') or ARGV[1], id)
+    requeued = requeued + 1
+  end
+end
+return {requeued, dead}
+"""
+
+# Cancel a queued job outright; flag a running one for its worker
+_CANCEL = """
+local id = ARGV[1]
+local key = ARGV[4] .. id
+local status = redis.call('HGET', key, 'status')
+if not status then return nil end
+if status == 'queued' then
+  redis.call('ZREM', KEYS[1], id)
+  redis.call('HSET', key, 'status', 'cancelled', 'cancel_reason', ARGV[2], 'finished_at', ARGV[3])
+  redis.call('EXPIRE', key, ARGV[5])
+elseif status == 'running' then
+  redis.call('HSET', key, 'cancel_requested', '1', 'cancel_reason', ARGV[2])
+end
+return status
+"""
+
+
+class RedisJob:
+    """Snapshot of a job stored in Redis, with the same surface the API uses on a local Job"""
+
+    def __init__(self, job_queue: 'RedisJobQueue', job_id: str, fields: Dict[str, str]):
+        self._queue = job_queue
+        self.id = job_id
+        self._load(fields)
+
+    def _load(self, fields: Dict[str, str]):
+        number = lambda name: float(fields[name]) if fields.get(name) else None
+        loads = lambda name: json.loads(fields[name]) if fields.get(name) else None
+        self.status = fields.get('status', 'unknown')
+        self.source = fields.get('source') or None
+        self.business_name = fields.get('business_name') or None
+        self.error = fields.get('error') or None
+        self.traceback = fields.get('traceback') or None
+        self.cancel_reason = fields.get('cancel_reason') or None
+        self.node = fields.get('node') or None
+        self.attempts = int(fields.get('attempts') or 0)
+        self.priority = fields.get('priority') or None
+        self.deadline = number('deadline')
+        self.dead_letter = fields.get('dead_letter') == '1'
+        self.submitted_at = number('submitted_at')
+        self.started_at = number('started_at')
+        self.finished_at = number('finished_at')
+        self.report = loads('report')
+        self.profile_artifacts = loads('profile')
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def refresh(self):
+        fields = self._queue.client.hgetall(self._queue.job_key(self.id))
+        if fields:
+            self._load(fields)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.finished:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+            self.refresh()
+        return True
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'source': self.source,
+            'business_name': self.business_name,
+            'error': self.error,
+            'cancel_reason': self.cancel_reason,
+            'priority': self.priority,
+            'deadline': self.deadline,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'node': self.node,
+            'attempts': self.attempts,
+            'dead_letter': self.dead_letter,
+            'log_file': job_log_path(self.id),
+            'profile': self.profile_artifacts,
+            'report': self.report,
+        }
+
+
+class RedisJobQueue:
+    """Drop-in for JobQueue on the API side: jobs are pushed to Redis and run by --worker nodes"""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = QUEUE_PREFIX, maxsize: int = QUEUE_MAX_PENDING,
+                 visibility_timeout: float = VISIBILITY_TIMEOUT, max_attempts: int = MAX_ATTEMPTS, client=None):
+        if client is None:
+            import redis
+            client = redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+        self.maxsize = max(1, maxsize)
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.pending_key = f'{prefix}:pending'
+        self.inflight_key = f'{prefix}:inflight'
+        self.dead_key = f'{prefix}:dead'
+        self._claim = client.register_script(_CLAIM)
+        self._finish = client.register_script(_FINISH)
+        self._reap = client.register_script(_REAP)
+        self._cancel = client.register_script(_CANCEL)
+
+    def job_key(self, job_id: str) -> str:
+        return f'{self.prefix}:job:{job_id}'
+
+    def node_key(self, node_id: str) -> str:
+        return f'{self.prefix}:node:{node_id}'
+
+    # --- API side ---
+
+    def submit(self, config: dict, source: Optional[str] = None, block: bool = True,
+               timeout: Optional[float] = None, profile: bool = False, schedule: Optional[Schedule] = None) -> RedisJob:
+        """Push a config onto the shared queue; blocks while GST_REDIS_QUEUE_SIZE jobs are pending unless block=False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.client.zcard(self.pending_key) >= self.maxsize:
+            if not block or (deadline is not None and time.monotonic() >= deadline):
+                raise queue.Full
+            time.sleep(POLL_INTERVAL)
+        job_id = uuid.uuid4().hex[:12]
+        schedule = schedule or Schedule.from_config(config)
+        business = ((config or {}).get('initial_registration_details') or {}).get('business_name')
+        fields = {
+            'status': 'queued', 'config': json.dumps(config), 'source': source or '', 'business_name': business or '',
+            'profile_requested': '1' if profile else '0', 'attempts': 0, 'priority': schedule.priority,
+            'deadline': schedule.deadline if schedule.deadline is not None else '', 'run_by': schedule.run_by,
+            'submitted_at': schedule.submitted_at,
+        }
+        with self.client.pipeline() as pipe:
+            pipe.hset(self.job_key(job_id), mapping=fields)
+            pipe.zadd(self.pending_key, {job_id: schedule.run_by})
+            pipe.execute()
+        logger.info(f"📥 Queued {schedule.priority} job {job_id} on Redis" + (f" ({source})" if source else ""))
+        return RedisJob(self, job_id, {key: str(value) for key, value in fields.items()})
+
+    def get(self, job_id: str) -> Optional[RedisJob]:
+        fields = self.client.hgetall(self.job_key(job_id))
+        return RedisJob(self, job_id, fields) if fields else None
+
+    def cancel(self, job_id: str, reason: str = 'cancelled by request') -> Optional[RedisJob]:
+        """Queued jobs are cancelled at once; running jobs are flagged and stopped by their worker's heartbeat"""
+        status = self._cancel(keys=[self.pending_key], args=[job_id, reason, time.time(), self.job_key(''), JOB_TTL])
+        if status in ('queued', 'running'):
+            logger.warning(f"🛑 Cancelling job {job_id} ({status}): {reason}")
+        return self.get(job_id)
+
+    def is_active(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        return job is not None and not job.finished
+
+    def stats(self) -> Dict:
+        nodes = {}
+        for key in self.client.scan_iter(match=self.node_key('*')):
+            value = self.client.get(key)
+            if value:
+                nodes[key[len(self.node_key('')):]] = json.loads(value)
+        return {
+            'backend': 'redis',
+            'pending': self.client.zcard(self.pending_key),
+            'running': self.client.zcard(self.inflight_key),
+            'dead_letter': self.client.llen(self.dead_key),
+            'nodes': nodes,
+        }
+
+    def dead_letters(self, limit: int = 100) -> List[RedisJob]:
+        return [job for job in (self.get(job_id) for job_id in self.client.lrange(self.dead_key, 0, limit - 1)) if job]
+
+    def requeue_dead(self, job_id: Optional[str] = None) -> int:
+        """Move one (or every) dead-lettered job back onto the queue with a fresh attempt count"""
+        job_ids = [job_id] if job_id else self.client.lrange(self.dead_key, 0, -1)
+        moved = 0
+        for dead_id in job_ids:
+            if not self.client.lrem(self.dead_key, 0, dead_id):
+                continue
+            with self.client.pipeline() as pipe:
+                pipe.hset(self.job_key(dead_id), mapping={'status': 'queued', 'attempts': 0, 'dead_letter': '0'})
+                pipe.hdel(self.job_key(dead_id), 'finished_at', PART_A_SUBMITTED)
+                pipe.zadd(self.pending_key, {dead_id: float(self.client.hget(self.job_key(dead_id), 'run_by') or time.time())})
+                pipe.execute()
+            moved += 1
+        return moved
+
+    # --- Worker side ---
+
+    def claim(self, node_id: str) -> Optional[str]:
+        """Take the next pending job for node_id, or None when the queue is empty"""
+        while True:
+            job_id = self._claim(keys=[self.pending_key, self.inflight_key],
+                                 args=[time.time(), self.visibility_timeout, node_id, self.job_key('')])
+            # '' is a job whose hash expired while queued; skip it
+            if job_id != '':
+                return job_id
+
+    def extend(self, job_ids: List[str]):
+        """Heartbeat: push the visibility deadline of jobs still in flight"""
+        if not job_ids:
+            return
+        deadline = time.time() + self.visibility_timeout
+        self.client.zadd(self.inflight_key, {job_id: deadline for job_id in job_ids}, xx=True)
+
+    def finish(self, job_id: str, node_id: str, status: str, attempts: int, retryable: bool = True, **fields) -> str:
+        """
+        Record a job's outcome. Failed jobs that are retryable and have attempts left go back on the
+        queue; the rest are dead-lettered. Returns the resulting status, or 'lost' if another node
+        has taken the job over.
+        """
+        dead = False
+        if status == 'failed':
+            if retryable and attempts < self.max_attempts:
+                status = 'retry'
+            else:
+                dead = True
+                fields['dead_letter'] = '1'
+        pairs = []
+        for key, value in fields.items():
+            if value is not None:
+                pairs += [key, value if isinstance(value, str) else json.dumps(value)]
+        settled = self._finish(keys=[self.inflight_key, self.dead_key, self.pending_key],
+                               args=[job_id, node_id, status, time.time(), '1' if dead else '0', self.job_key(''),
+                                     JOB_TTL] + pairs)
+        if not settled:
+            return 'lost'
+        return 'queued' if status == 'retry' else status
+
+    def mark_part_a_submitted(self, job_id: str):
+        """Record that the portal accepted Part A, so a lost worker's job is not rerun"""
+        self.client.hset(self.job_key(job_id), PART_A_SUBMITTED, '1')
+
+    def cancel_requests(self, job_ids: List[str]) -> Dict[str, str]:
+        """job_id -> cancel reason for the given jobs that have a pending cancel request"""
+        if not job_ids:
+            return {}
+        with self.client.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                pipe.hmget(self.job_key(job_id), 'cancel_requested', 'cancel_reason')
+            flags = pipe.execute()
+        return {job_id: reason or 'cancelled by request' for job_id, (requested, reason) in zip(job_ids, flags) if requested}
+
+    def reap(self) -> tuple:
+        """Requeue jobs whose worker stopped heartbeating; returns (requeued, dead_lettered)"""
+        requeued, dead = self._reap(keys=[self.inflight_key, self.pending_key, self.dead_key],
+                                    args=[time.time(), self.max_attempts, self.job_key(''), JOB_TTL])
+        return requeued, dead
+
+
+class RedisWorker:
+    """Claims jobs from Redis and runs them on this node's JobQueue, at most `concurrency` at a time"""
+
+    def __init__(self, redis_queue: RedisJobQueue, local_queue: JobQueue, concurrency: int = NODE_CONCURRENCY,
+                 node_id: str = NODE_ID):
+        self.redis_queue = redis_queue
+        self.local_queue = local_queue
+        # More slots than local workers would only park claimed jobs in the local queue
+        self.concurrency = min(concurrency, local_queue.workers) if concurrency > 0 else local_queue.workers
+        self.node_id = node_id
+        self.started_at = time.time()
+        self.processed: Dict[str, int] = {}
+        self._inflight: Dict[str, object] = {}
+        self._part_a_marked: set = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _slot(self):
+        while not self._stop.is_set():
+            try:
+                job_id = self.redis_queue.claim(self.node_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not claim a job from Redis: {e}")
+                self._stop.wait(5)
+                continue
+            if job_id is None:
+                self._stop.wait(POLL_INTERVAL)
+                continue
+            self._process(job_id)
+
+    def _process(self, job_id: str):
+        fields = self.redis_queue.client.hgetall(self.redis_queue.job_key(job_id))
+        attempts = int(fields.get('attempts') or 1)
+        logger.info(f"📦 Claimed job {job_id} (attempt {attempts}/{self.redis_queue.max_attempts})")
+        try:
+            config = json.loads(fields['config'])
+        except (KeyError, ValueError) as e:
+            self._settle(job_id, 'failed', self.redis_queue.max_attempts, error=f"unreadable job payload: {e}")
+            return
+        # Keep the original submission time so queue waits include the time spent in Redis
+        schedule = Schedule(fields.get('priority') or 'normal', float(fields['deadline']) if fields.get('deadline') else None,
+                            float(fields['submitted_at']) if fields.get('submitted_at') else None)
+        job = self.local_queue.submit(config, source=fields.get('source') or None,
+                                      profile=fields.get('profile_requested') == '1', job_id=job_id, schedule=schedule)
+        with self._lock:
+            self._inflight[job_id] = job
+        try:
+            job.wait()
+        finally:
+            with self._lock:
+                self._inflight.pop(job_id, None)
+                self._part_a_marked.discard(job_id)
+        labels = (job.report or {}).get('labels') or {}
+        self._settle(job_id, job.status, attempts, retryable=PART_A_SUBMITTED not in labels, error=job.error,
+                     traceback=job.traceback, report=job.report, profile=job.profile_artifacts,
+                     cancel_reason=job.cancel_token.reason)
+
+    def _settle(self, job_id: str, status: str, attempts: int, retryable: bool = True, **fields):
+        outcome = status
+        for delay in (1, 5, 15, None):
+            try:
+                outcome = self.redis_queue.finish(job_id, self.node_id, status, attempts, retryable, **fields)
+                break
+            except Exception as e:
+                if delay is None:
+                    logger.error(f"❌ Could not record job {job_id} in Redis: {e}")
+                    return
+                logger.warning(f"⚠️ Recording job {job_id} in Redis failed, retrying in {delay}s: {e}")
+                time.sleep(delay)
+        with self._lock:
+            self.processed[outcome] = self.processed.get(outcome, 0) + 1
+        if outcome == 'lost':
+            logger.warning(f"⚠️ Job {job_id} outlived its visibility timeout and was taken over by another node")
+        elif outcome == 'queued':
+            logger.warning(f"🔁 Job {job_id} failed on attempt {attempts}, returned to the queue")
+        elif status == 'failed' and not retryable:
+            logger.error(f"💀 Job {job_id} failed after Part A was submitted, moved to the dead-letter list without a retry")
+        elif status == 'failed':
+            logger.error(f"💀 Job {job_id} failed {attempts} time(s), moved to the dead-letter list")
+
+    def _heartbeat(self):
+        interval = max(1.0, self.redis_queue.visibility_timeout / 3)
+        while True:
+            with self._lock:
+                inflight = dict(self._inflight)
+            try:
+                self.redis_queue.extend(list(inflight))
+                self.redis_queue.client.set(self.redis_queue.node_key(self.node_id), json.dumps(self.stats()),
+                                            ex=int(interval * 3))
+                requeued, dead = self.redis_queue.reap()
+                if requeued or dead:
+                    logger.warning(f"⏱️ Reclaimed {requeued} job(s) from unresponsive workers, {dead} dead-lettered")
+            except Exception as e:
+                logger.warning(f"⚠️ Worker heartbeat failed: {e}")
+            if self._stop.wait(interval):
+                return
+
+    def _watch(self):
+        """
+        Poll running jobs every CANCEL_POLL_INTERVAL: stop the ones with a cancel request, and
+        record in Redis when a job gets Part A accepted so it is never retried after a lost worker.
+        """
+        while not self._stop.wait(CANCEL_POLL_INTERVAL):
+            with self._lock:
+                inflight = dict(self._inflight)
+            if not inflight:
+                continue
+            try:
+                for job_id, reason in self.redis_queue.cancel_requests(list(inflight)).items():
+                    if not inflight[job_id].cancel_token.cancelled:
+                        self.local_queue.cancel(job_id, reason=reason)
+                for job_id, job in inflight.items():
+                    report = job.live_report
+                    if job_id not in self._part_a_marked and report is not None and PART_A_SUBMITTED in report.labels:
+                        self.redis_queue.mark_part_a_submitted(job_id)
+                        with self._lock:
+                            self._part_a_marked.add(job_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Checking running jobs in Redis failed: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'node': self.node_id, 'concurrency': self.concurrency, 'running': len(self._inflight),
+                    'processed': dict(self.processed), 'queue_wait': self.local_queue.queue_waits.snapshot(),
+                    'started_at': self.started_at, 'heartbeat_at': time.time()}
+
+    def run(self):
+        """Serve jobs until interrupted"""
+        threads = [threading.Thread(target=self._heartbeat, name='gst-redis-heartbeat', daemon=True),
+                   threading.Thread(target=self._watch, name='gst-redis-watch', daemon=True)]
+        threads += [threading.Thread(target=self._slot, name=f'gst-redis-slot-{index + 1}', daemon=True)
+                    for index in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        logger.info(f"👷 Worker {self.node_id} serving {self.redis_queue.prefix} with {self.concurrency} slot(s)")
+        try:
+            while not self._stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            logger.info(f"🛑 Worker {self.node_id} stopping; in-flight jobs return to the queue after their timeout")
+        self.stop()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self.redis_queue.client.delete(self.redis_queue.node_key(self.node_id))
+        except Exception:
+            pass
+
+
+__all__ = ['RedisJobQueue', 'RedisJob', 'RedisWorker', 'QUEUE_BACKEND']
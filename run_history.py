@@ -0,0 +1,275 @@
+# File: run_history.py
+#
+# Embedded run history for GST automation jobs
+# Every finished job's outcome and per-section durations are written to SQLite, indexed by
+# job id, PAN, state and date, so step percentiles and slow runs can be queried over a window.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from logger import logger
+from metrics import percentile
+
+HISTORY_DB = os.getenv('GST_HISTORY_DB', os.path.join('logs', 'run_history.db'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    job_id TEXT PRIMARY KEY,
+    pan TEXT,
+    state TEXT,
+    business_name TEXT,
+    source TEXT,
+    status TEXT NOT NULL,
+    error_class TEXT,
+    error TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    total_seconds REAL,
+    total_retries INTEGER DEFAULT 0,
+    captcha_attempts INTEGER DEFAULT 0,
+    captcha_rejected INTEGER DEFAULT 0,
+    report TEXT
+);
+CREATE TABLE IF NOT EXISTS steps (
+    job_id TEXT NOT NULL REFERENCES runs(job_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    step TEXT NOT NULL,
+    seconds REAL,
+    status TEXT,
+    started_at REAL NOT NULL,
+    PRIMARY KEY (job_id, position)
+);
+CREATE TABLE IF NOT EXISTS retries (
+    job_id TEXT NOT NULL REFERENCES runs(job_id) ON DELETE CASCADE,
+    step TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    PRIMARY KEY (job_id, step)
+);
+CREATE TABLE IF NOT EXISTS waits (
+    job_id TEXT NOT NULL REFERENCES runs(job_id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    started_at REAL NOT NULL,
+    PRIMARY KEY (job_id, kind)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_pan ON runs(pan);
+CREATE INDEX IF NOT EXISTS idx_runs_state ON runs(state);
+CREATE INDEX IF NOT EXISTS idx_runs_started_at ON runs(started_at);
+CREATE INDEX IF NOT EXISTS idx_steps_step_started_at ON steps(step, started_at);
+CREATE INDEX IF NOT EXISTS idx_retries_started_at ON retries(started_at);
+CREATE INDEX IF NOT EXISTS idx_waits_kind_started_at ON waits(kind, started_at);
+"""
+
+# Columns added after the first release; applied to existing databases on open
+_MIGRATIONS = [
+    ('runs', 'browser_profile', 'TEXT'),
+    ('runs', 'browser_mode', 'TEXT'),
+    ('runs', 'priority', 'TEXT'),
+    ('runs', 'deadline', 'REAL'),
+    ('runs', 'queue_seconds', 'REAL'),
+]
+
+# Waits compared between browser profiles in stats()
+COMPARED_WAITS = ('page_load', 'ajax_settle')
+
+
+class RunHistory:
+    """SQLite store of finished runs; one short-lived connection per call keeps it thread safe"""
+
+    def __init__(self, path: str = HISTORY_DB):
+        self.path = path
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    with sqlite3.connect(self.path) as conn:
+                        conn.execute('PRAGMA journal_mode=WAL')
+                        conn.executescript(_SCHEMA)
+                        for table, column, kind in _MIGRATIONS:
+                            existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+                            if column not in existing:
+                                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {kind}')
+                    self._initialized = True
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
+
+    def record_run(self, job_id: str, config: Optional[dict], report: Optional[dict], status: str,
+                   error: Optional[str] = None, source: Optional[str] = None,
+                   started_at: Optional[float] = None, finished_at: Optional[float] = None,
+                   priority: Optional[str] = None, deadline: Optional[float] = None,
+                   queue_seconds: Optional[float] = None):
+        """Insert (or replace) one finished run and its section timings"""
+        initial = (config or {}).get('initial_registration_details') or {}
+        report = report or {}
+        captcha = report.get('captcha') or {}
+        labels = report.get('labels') or {}
+        started_at = started_at or time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    """INSERT OR REPLACE INTO runs (job_id, pan, state, business_name, source, status, error_class, error,
+                       started_at, finished_at, total_seconds, total_retries, captcha_attempts, captcha_rejected, report,
+                       browser_profile, browser_mode, priority, deadline, queue_seconds)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (job_id, initial.get('pan_card'), initial.get('selected_state'), initial.get('business_name'),
+                     source, status, report.get('error_class'), error, started_at, finished_at,
+                     report.get('total_seconds'), report.get('total_retries', 0), captcha.get('attempts', 0),
+                     captcha.get('rejected', 0), json.dumps(report) if report else None, labels.get('browser_profile'),
+                     labels.get('browser_mode'), priority, deadline, queue_seconds),
+                )
+                conn.execute('DELETE FROM steps WHERE job_id = ?', (job_id,))
+                conn.execute('DELETE FROM retries WHERE job_id = ?', (job_id,))
+                conn.execute('DELETE FROM waits WHERE job_id = ?', (job_id,))
+                conn.executemany(
+                    'INSERT INTO steps (job_id, position, step, seconds, status, started_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    [(job_id, position, section['name'], section.get('seconds'), section.get('status'), started_at)
+                     for position, section in enumerate(report.get('sections') or [])],
+                )
+                conn.executemany(
+                    'INSERT INTO retries (job_id, step, count, started_at) VALUES (?, ?, ?, ?)',
+                    [(job_id, step, count, started_at) for step, count in (report.get('retries') or {}).items()],
+                )
+                conn.executemany(
+                    'INSERT INTO waits (job_id, kind, seconds, started_at) VALUES (?, ?, ?, ?)',
+                    [(job_id, kind, seconds, started_at) for kind, seconds in (report.get('waits') or {}).items()],
+                )
+        finally:
+            conn.close()
+
+    def stats(self, hours: float = 24.0, state: Optional[str] = None, slowest: int = 10) -> Dict:
+        """Outcome counts, P50/P95/P99 per step, retries and the slowest runs started in the last `hours`"""
+        since = time.time() - hours * 3600
+        run_filter, params = 'started_at >= ?', [since]
+        if state:
+            run_filter += ' AND state = ?'
+            params.append(state)
+
+        conn = self._connect()
+        try:
+            outcomes = {row['status']: row['runs'] for row in conn.execute(
+                f'SELECT status, COUNT(*) AS runs FROM runs WHERE {run_filter} GROUP BY status', params)}
+            error_classes = {row['error_class']: row['runs'] for row in conn.execute(
+                f"""SELECT error_class, COUNT(*) AS runs FROM runs WHERE {run_filter} AND status = 'failed'
+                    GROUP BY error_class ORDER BY runs DESC""", params)}
+
+            child_filter, child_params = 'started_at >= ?', [since]
+            if state:
+                child_filter += ' AND job_id IN (SELECT job_id FROM runs WHERE state = ? AND started_at >= ?)'
+                child_params += [state, since]
+            durations: Dict[str, List[float]] = {}
+            for row in conn.execute(
+                    f'SELECT step, seconds FROM steps WHERE {child_filter} AND seconds IS NOT NULL ORDER BY step, seconds',
+                    child_params):
+                durations.setdefault(row['step'], []).append(row['seconds'])
+            retries = {row['step']: row['total'] for row in conn.execute(
+                f'SELECT step, SUM(count) AS total FROM retries WHERE {child_filter} GROUP BY step ORDER BY total DESC',
+                child_params)}
+
+            slowest_runs = [dict(row) for row in conn.execute(
+                f"""SELECT job_id, pan, state, business_name, status, error_class, started_at, total_seconds,
+                           total_retries, captcha_attempts, browser_profile, browser_mode, priority
+                    FROM runs WHERE {run_filter} AND total_seconds IS NOT NULL
+                    ORDER BY total_seconds DESC LIMIT ?""", params + [slowest])]
+
+            # Per-run wait totals and run time split by browser profile (lean vs default)
+            by_profile: Dict[str, Dict[str, List[float]]] = {}
+            for row in conn.execute(
+                    f"""SELECT COALESCE(browser_profile, 'unknown') AS profile, total_seconds FROM runs
+                        WHERE {run_filter} AND total_seconds IS NOT NULL ORDER BY total_seconds""", params):
+                by_profile.setdefault(row['profile'], {}).setdefault('total', []).append(row['total_seconds'])
+            placeholders = ', '.join('?' for _ in COMPARED_WAITS)
+            for row in conn.execute(
+                    f"""SELECT r.profile, waits.kind, waits.seconds FROM waits
+                        JOIN (SELECT job_id, COALESCE(browser_profile, 'unknown') AS profile FROM runs WHERE {run_filter}) AS r
+                          ON r.job_id = waits.job_id
+                        WHERE waits.kind IN ({placeholders})
+                        ORDER BY waits.seconds""", params + list(COMPARED_WAITS)):
+                by_profile.setdefault(row['profile'], {}).setdefault(row['kind'], []).append(row['seconds'])
+
+            # Time from submission to start, and deadlines missed, per priority class
+            queue_waits: Dict[str, List[float]] = {}
+            for row in conn.execute(
+                    f"""SELECT COALESCE(priority, 'normal') AS priority, queue_seconds FROM runs
+                        WHERE {run_filter} AND queue_seconds IS NOT NULL ORDER BY queue_seconds""", params):
+                queue_waits.setdefault(row['priority'], []).append(row['queue_seconds'])
+            missed = {row['priority']: row['runs'] for row in conn.execute(
+                f"""SELECT COALESCE(priority, 'normal') AS priority, COUNT(*) AS runs FROM runs
+                    WHERE {run_filter} AND deadline IS NOT NULL AND finished_at > deadline GROUP BY priority""", params)}
+        finally:
+            conn.close()
+
+        return {
+            'window_hours': hours,
+            'state': state,
+            'runs': {'total': sum(outcomes.values()), **outcomes, 'error_classes': error_classes},
+            'steps': {
+                step: {
+                    'count': len(values),
+                    'p50': percentile(values, 50, 3),
+                    'p95': percentile(values, 95, 3),
+                    'p99': percentile(values, 99, 3),
+                    'max': round(values[-1], 3),
+                }
+                for step, values in durations.items()
+            },
+            'retries': retries,
+            'browser_profiles': {
+                profile: {
+                    'runs': len(series.get('total', [])),
+                    **{name: {'p50': percentile(values, 50, 3), 'p95': percentile(values, 95, 3)}
+                       for name, values in series.items()},
+                }
+                for profile, series in by_profile.items()
+            },
+            'queue_wait': {
+                priority: {
+                    'count': len(values),
+                    'p50': percentile(values, 50, 3),
+                    'p95': percentile(values, 95, 3),
+                    'max': round(values[-1], 3),
+                    'deadlines_missed': missed.get(priority, 0),
+                }
+                for priority, values in queue_waits.items()
+            },
+            'slowest_runs': slowest_runs,
+        }
+
+    def runs_for_pan(self, pan: str, limit: int = 20) -> List[Dict]:
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute(
+                """SELECT job_id, state, business_name, status, error_class, started_at, total_seconds
+                   FROM runs WHERE pan = ? ORDER BY started_at DESC LIMIT ?""", (pan, limit))]
+        finally:
+            conn.close()
+
+
+run_history = RunHistory()
+
+
+def record_job(job, config: Optional[dict]):
+    """JobQueue on_finish hook; history problems are logged and never fail the job"""
+    try:
+        run_history.record_run(job.id, config, job.report, job.status, error=job.error, source=job.source,
+                               started_at=job.started_at, finished_at=job.finished_at,
+                               priority=job.schedule.priority, deadline=job.schedule.deadline,
+                               queue_seconds=job.started_at - job.submitted_at if job.started_at else None)
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ Could not record job {job.id} in run history: {e}")
+
+
+__all__ = ['RunHistory', 'run_history', 'record_job']
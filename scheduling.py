@@ -0,0 +1,114 @@
+# File: scheduling.py
+#
+# Priority and SLA ordering for queued registrations
+# Each job carries a priority class and an optional deadline. Queues run jobs in order of their
+# "run by" time: the deadline minus the expected run time, capped at submission time plus the
+# class's maximum queue wait. Urgent work therefore jumps ahead, and jobs close to their SLA
+# overtake bulk backfill. Bulk jobs still get a finite run-by time, so they move up as they age
+# and are never starved.
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from metrics import percentile
+
+PRIORITIES = ('urgent', 'normal', 'bulk')
+DEFAULT_PRIORITY = os.getenv('GST_DEFAULT_PRIORITY', 'normal')
+# Longest a job of each class should sit in the queue before it is due, in minutes
+MAX_QUEUE_WAIT = {
+    'urgent': float(os.getenv('GST_MAX_WAIT_URGENT_MINUTES', '0')),
+    'normal': float(os.getenv('GST_MAX_WAIT_NORMAL_MINUTES', '30')),
+    'bulk': float(os.getenv('GST_MAX_WAIT_BULK_MINUTES', '480')),
+}
+# Typical run time; a job with a deadline is due this long before it
+RUN_LEAD_MINUTES = float(os.getenv('GST_SLA_LEAD_MINUTES', '20'))
+QUEUE_WAIT_WINDOW = 500
+
+
+def parse_deadline(value) -> Optional[float]:
+    """Epoch seconds from an ISO 8601 string (naive values are local time); raises ValueError otherwise"""
+    if value is None or value == '':
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"invalid deadline {value!r}")
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def priority_errors(value, path: str) -> List[str]:
+    """Validation for the optional `priority` config key"""
+    if value is None or value in PRIORITIES:
+        return []
+    return [f"{path}: must be one of {list(PRIORITIES)} (got {value!r})"]
+
+
+def deadline_errors(value, path: str) -> List[str]:
+    """Validation for the optional `deadline` config key"""
+    try:
+        parse_deadline(value)
+    except (TypeError, ValueError):
+        return [f"{path}: expected an ISO 8601 date-time, e.g. 2026-01-31T17:00:00+05:30"]
+    return []
+
+
+class Schedule:
+    """When a job should run: its priority class, optional deadline and submission time"""
+
+    def __init__(self, priority: str = DEFAULT_PRIORITY, deadline: Optional[float] = None,
+                 submitted_at: Optional[float] = None):
+        self.priority = priority if priority in PRIORITIES else 'normal'
+        self.deadline = deadline
+        self.submitted_at = submitted_at or time.time()
+
+    @classmethod
+    def from_config(cls, config: Optional[dict], priority: Optional[str] = None) -> 'Schedule':
+        """Schedule from the payload's priority/deadline; `priority` is the default when the payload has none"""
+        config = config or {}
+        try:
+            deadline = parse_deadline(config.get('deadline'))
+        except (TypeError, ValueError):
+            deadline = None
+        return cls(config.get('priority') or priority or DEFAULT_PRIORITY, deadline)
+
+    @property
+    def run_by(self) -> float:
+        """Time by which the job should start; queues serve the smallest first"""
+        due = self.submitted_at + MAX_QUEUE_WAIT[self.priority] * 60
+        if self.deadline is not None:
+            due = min(due, self.deadline - RUN_LEAD_MINUTES * 60)
+        return due
+
+    def to_dict(self) -> dict:
+        return {'priority': self.priority, 'deadline': self.deadline, 'run_by': self.run_by}
+
+
+class QueueWaitStats:
+    """Recent queue waits (submission to start) per priority class"""
+
+    def __init__(self, window: int = QUEUE_WAIT_WINDOW):
+        self._waits: Dict[str, deque] = {priority: deque(maxlen=window) for priority in PRIORITIES}
+        self._late: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._lock = threading.Lock()
+
+    def record(self, schedule: Schedule, started_at: float):
+        with self._lock:
+            self._waits[schedule.priority].append(started_at - schedule.submitted_at)
+            # Started with less than the expected run time left before its deadline
+            if schedule.deadline is not None and started_at > schedule.deadline - RUN_LEAD_MINUTES * 60:
+                self._late[schedule.priority] += 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            waits = {priority: sorted(values) for priority, values in self._waits.items()}
+            late = dict(self._late)
+        return {
+            priority: {'count': len(values), 'p50': percentile(values, 50, 1), 'p95': percentile(values, 95, 1),
+                       'max': round(values[-1], 1) if values else None, 'started_late': late[priority]}
+            for priority, values in waits.items()
+        }
+
+
+__all__ = ['PRIORITIES', 'Schedule', 'QueueWaitStats', 'parse_deadline', 'priority_errors', 'deadline_errors']
@@ -0,0 +1,8 @@
+# File: tests/conftest.py
+#
+# The service modules live flat in the repository root; make them importable from tests/
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,36 @@
+# File: tests/test_browser_watchdog.py
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from browser_watchdog import BrowserWatchdog, _read_stat
+
+pytestmark = pytest.mark.skipif(not os.path.isdir('/proc'), reason='needs /proc')
+
+
+def test_killed_children_are_not_left_as_zombies():
+    child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    watchdog = BrowserWatchdog(interval=3600, reap_orphans=False)
+    cleaned = []
+    watchdog.track(child.pid, cleanup=lambda: cleaned.append(True), job_id='job1')
+
+    assert watchdog.kill(child.pid, 'cancelled')
+    assert _read_stat(child.pid) is None  # collected, not a zombie
+    assert cleaned == [True]
+    assert watchdog.stats()['reaped'] == {'cancelled': 1}
+
+
+def test_untracked_children_of_the_server_are_not_orphans():
+    child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    try:
+        watchdog = BrowserWatchdog(interval=3600)
+        stat = dict(pid=child.pid, ppid=os.getpid(), comm='geckodriver', start=0.0, rss=0)
+        watchdog._reap_orphans({child.pid: stat}, tracked_pids=set())
+        assert child.poll() is None
+        assert watchdog.stats()['reaped'] == {}
+    finally:
+        child.kill()
+        child.wait()
@@ -0,0 +1,91 @@
+# File: tests/test_displays.py
+
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from displays import DisplayAllocator, DisplayError
+
+# Stands in for Xvfb: creates the lock file and socket path a real server would, removes them on SIGTERM
+FAKE_XVFB = '''#!{python}
+import os, signal, sys, time
+number = sys.argv[1][1:]
+lock, socket = f'/tmp/.X{{number}}-lock', f'/tmp/.X11-unix/X{{number}}'
+os.makedirs('/tmp/.X11-unix', exist_ok=True)
+for path, content in ((lock, '%10d\\n' % os.getpid()), (socket, '')):
+    with open(path, 'w') as f:
+        f.write(content)
+def stop(*_):
+    for path in (lock, socket):
+        os.path.exists(path) and os.remove(path)
+    sys.exit(0)
+signal.signal(signal.SIGTERM, stop)
+while True:
+    time.sleep(1)
+'''
+
+BASE = 4200 + os.getpid() % 500
+
+
+@pytest.fixture
+def allocator(tmp_path):
+    script = tmp_path / 'Xvfb'
+    script.write_text(FAKE_XVFB.format(python=sys.executable))
+    script.chmod(0o755)
+
+    def make(max_displays):
+        allocator = DisplayAllocator(base=BASE, max_displays=max_displays)
+        allocator.xvfb = str(script)
+        made.append(allocator)
+        return allocator
+
+    made = []
+    yield make
+    for allocator in made:
+        allocator.shutdown()
+    for number in range(BASE, BASE + 3):
+        for path in (f'/tmp/.X{number}-lock', f'/tmp/.X11-unix/X{number}'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def test_acquire_waits_for_a_slot_held_by_a_running_job(allocator):
+    displays = allocator(max_displays=1)
+    first = displays.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(displays.acquire(timeout=10)))
+    waiter.start()
+    waiter.join(0.5)
+    assert waiter.is_alive() and not acquired
+
+    displays.release(first)
+    waiter.join(10)
+    assert acquired and acquired[0].name == first.name and acquired[0].alive
+
+
+def test_acquire_times_out_when_no_slot_frees_up(allocator):
+    displays = allocator(max_displays=1)
+    displays.acquire()
+    with pytest.raises(DisplayError):
+        displays.acquire(timeout=0.3)
+
+
+def test_stale_lock_of_a_killed_server_is_reclaimed(allocator):
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    with open(f'/tmp/.X{BASE}-lock', 'w') as f:
+        f.write('%10d\n' % dead.pid)
+    displays = allocator(max_displays=1)
+    display = displays.acquire(timeout=1)
+    assert display.number == BASE
+
+
+def test_lock_of_a_live_server_is_respected(allocator):
+    with open(f'/tmp/.X{BASE}-lock', 'w') as f:
+        f.write('%10d\n' % os.getpid())
+    displays = allocator(max_displays=2)
+    assert displays.acquire(timeout=1).number == BASE + 1
+    assert os.path.exists(f'/tmp/.X{BASE}-lock')
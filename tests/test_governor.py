@@ -0,0 +1,44 @@
+# File: tests/test_governor.py
+
+import pytest
+
+from governor import RedisTokenBucket, TokenBucket
+from test_redis_queue import _client
+
+
+def test_token_bucket_allows_its_burst_then_reports_the_shortfall():
+    bucket = TokenBucket('captcha', rate=60, per=60.0, burst=2)
+    assert [bucket._take()[0] for _ in range(3)] == [True, True, False]
+    assert bucket.acquire() == pytest.approx(1.0, abs=0.3)
+    assert bucket.stats()['throttled'] == 1
+
+
+def test_disabled_bucket_never_waits():
+    assert TokenBucket('captcha', rate=0).acquire() == 0.0
+
+
+@pytest.fixture
+def shared_key():
+    client = _client()
+    key = 'gst:test:bucket:captcha'
+    client.delete(key)
+    yield client, key
+    client.delete(key)
+    client.close()
+
+
+def test_redis_bucket_is_shared_between_nodes(shared_key):
+    client, key = shared_key
+    node_a = RedisTokenBucket('captcha', rate=1, per=60.0, burst=3, client=client, key=key)
+    node_b = RedisTokenBucket('captcha', rate=1, per=60.0, burst=3, client=client, key=key)
+    taken = [node_a._take()[0], node_b._take()[0], node_a._take()[0], node_b._take()[0]]
+    assert taken == [True, True, True, False]
+    assert node_a.stats()['tokens'] < 1 and node_a.stats()['shared']
+
+
+def test_redis_bucket_falls_back_to_a_local_bucket():
+    import redis
+    client = redis.from_url('redis://127.0.0.1:1/0', socket_connect_timeout=0.2)
+    bucket = RedisTokenBucket('captcha', rate=1, per=60.0, burst=1, client=client, key='unused')
+    assert [bucket._take()[0] for _ in range(2)] == [True, False]
+    assert bucket.stats()['shared'] is False
@@ -0,0 +1,73 @@
+# File: tests/test_jobs.py
+
+import queue
+import threading
+import time
+
+import pytest
+
+from jobs import JobQueue
+from scheduling import Schedule
+from test_validation import VALID
+
+
+def test_job_cancelled_while_queued_reaches_on_finish():
+    release = threading.Event()
+    finished = []
+    job_queue = JobQueue(lambda config: release.wait(5), workers=1,
+                         on_finish=lambda job, config: finished.append((job.id, job.status, job.error, config)))
+    running = job_queue.submit(dict(VALID))
+    queued = job_queue.submit(dict(VALID))
+
+    job_queue.cancel(queued.id, reason='duplicate')
+    assert queued.finished and queued.status == 'cancelled'
+    assert finished == [(queued.id, 'cancelled', 'cancelled: duplicate', VALID)]
+    # The payload is dropped once recorded, as for jobs that ran
+    assert queued.config == {'initial_registration_details': {'business_name': 'Verma Traders'}}
+
+    release.set()
+    assert running.wait(5)
+    assert [job_id for job_id, *_ in finished] == [queued.id, running.id]
+
+
+def test_full_queue_admits_higher_priority_jobs():
+    release = threading.Event()
+    job_queue = JobQueue(lambda config: release.wait(5), workers=1, maxsize=2)
+    running = job_queue.submit(dict(VALID), schedule=Schedule('bulk'))
+    assert wait_until(lambda: running.status == 'running')
+    job_queue.submit(dict(VALID), schedule=Schedule('bulk'))
+    job_queue.submit(dict(VALID), schedule=Schedule('bulk'))
+
+    with pytest.raises(queue.Full):
+        job_queue.submit(dict(VALID), block=False, schedule=Schedule('bulk'))
+    urgent = job_queue.submit(dict(VALID), block=False, schedule=Schedule('urgent'))
+    job_queue.submit(dict(VALID), block=False, schedule=Schedule('normal'))
+    # Normal jobs count against each other and against urgent ones, not against bulk
+    with pytest.raises(queue.Full):
+        job_queue.submit(dict(VALID), block=False, schedule=Schedule('normal'))
+    assert job_queue.stats()['pending'] == 4
+
+    release.set()
+    assert urgent.wait(5) and urgent.status == 'succeeded'
+
+
+def test_cancelling_a_queued_job_frees_its_slot():
+    release = threading.Event()
+    job_queue = JobQueue(lambda config: release.wait(5), workers=1, maxsize=1)
+    running = job_queue.submit(dict(VALID))
+    assert wait_until(lambda: running.status == 'running')
+    queued = job_queue.submit(dict(VALID))
+    with pytest.raises(queue.Full):
+        job_queue.submit(dict(VALID), block=False)
+    job_queue.cancel(queued.id)
+    job_queue.submit(dict(VALID), block=False)
+    release.set()
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
@@ -0,0 +1,95 @@
+# File: tests/test_jsonl.py
+
+import io
+import json
+
+import pytest
+
+from jobs import _read_lines, ingest_jsonl, iter_jsonl
+from test_validation import VALID
+
+RECORD = json.dumps(VALID)
+
+
+class RecordingQueue:
+    """Stands in for JobQueue.submit and remembers what was queued"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, config, source=None, profile=False, schedule=None):
+        job = type('QueuedJob', (), {'id': f"job{len(self.submitted) + 1}"})()
+        self.submitted.append((source, config, schedule))
+        return job
+
+
+def as_stream(text: str, binary: bool):
+    return io.BytesIO(text.encode()) if binary else io.StringIO(text)
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_read_lines_bounds_long_lines(binary):
+    stream = as_stream('short\n' + 'x' * 50 + '\nafter\n', binary)
+    lines = list(_read_lines(stream, max_line_bytes=10))
+    assert [too_long for _, too_long in lines] == [False, True, False]
+    assert lines[2][0] == (b'after\n' if binary else 'after\n')
+
+
+def test_read_lines_long_final_line_without_newline():
+    lines = list(_read_lines(io.StringIO('ok\n' + 'x' * 50), max_line_bytes=10))
+    assert [too_long for _, too_long in lines] == [False, True]
+
+
+def test_read_lines_accepts_plain_iterables():
+    assert list(_read_lines(['a\n', 'b' * 20], max_line_bytes=10)) == [('a\n', False), ('b' * 20, True)]
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_blank_and_comment_lines_are_skipped_but_counted(binary):
+    stream = as_stream(f"\n   \n# backfill\n{RECORD}\n\n{RECORD}\n", binary)
+    assert [(number, errors) for number, _, errors in iter_jsonl(stream)] == [(4, []), (6, [])]
+
+
+def test_final_line_without_newline_is_parsed():
+    results = list(iter_jsonl(io.StringIO(f"{RECORD}\n{RECORD}")))
+    assert [(number, errors) for number, _, errors in results] == [(1, []), (2, [])]
+
+
+def test_truncated_final_line_is_reported():
+    results = list(iter_jsonl(io.StringIO(f"{RECORD}\n{RECORD[:40]}")))
+    assert results[0][2] == []
+    number, config, errors = results[1]
+    assert (number, config) == (2, None)
+    assert len(errors) == 1 and errors[0].startswith('invalid JSON:')
+
+
+def test_each_line_reports_its_own_errors():
+    broken = dict(VALID, goods_services_details={'hsn_value': 'abc'})
+    lines = [RECORD, '{not json', json.dumps(broken), 'x' * (len(RECORD) + 10), RECORD]
+    results = list(iter_jsonl(io.StringIO('\n'.join(lines) + '\n'), max_line_bytes=len(RECORD) + 1))
+    assert [(number, errors) for number, _, errors in results] == [
+        (1, []),
+        (2, [results[1][2][0]]),
+        (3, ["config.goods_services_details.hsn_value: expected a 2-8 digit HSN code (got 'abc')"]),
+        (4, [f"line exceeds {len(RECORD) + 1} bytes"]),
+        (5, []),
+    ]
+    assert results[1][2][0].startswith('invalid JSON:')
+
+
+def test_ingest_queues_valid_lines_and_reports_invalid_ones():
+    job_queue = RecordingQueue()
+    stream = io.BytesIO(f"{RECORD}\n\n[]\n{RECORD[:-1]}\n{RECORD}".encode())
+    results = list(ingest_jsonl(stream, job_queue, source='upload'))
+    assert [result['status'] for result in results] == ['queued', 'invalid', 'invalid', 'queued']
+    assert [result['line'] for result in results] == [1, 3, 4, 5]
+    assert results[0]['job_id'] == 'job1' and results[3]['job_id'] == 'job2'
+    assert results[1]['errors'] == ['config: expected an object, got list']
+    assert [source for source, _, _ in job_queue.submitted] == ['upload:1', 'upload:5']
+
+
+def test_ingest_applies_the_default_priority():
+    job_queue = RecordingQueue()
+    urgent = dict(VALID, priority='urgent')
+    list(ingest_jsonl(io.StringIO(f"{RECORD}\n{json.dumps(urgent)}\n"), job_queue, priority='bulk'))
+    assert [schedule.priority for _, _, schedule in job_queue.submitted] == ['bulk', 'urgent']
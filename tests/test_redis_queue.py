@@ -0,0 +1,206 @@
+# File: tests/test_redis_queue.py
+#
+# Exercises the queue's Lua scripts (claim, finish, reap, cancel) against the Redis at
+# REDIS_URL, or fakeredis (with lupa for scripting) when no server is reachable.
+
+import os
+import threading
+import time
+import uuid
+
+import pytest
+
+from cancellation import cancellable_sleep
+from jobs import JobQueue
+from redis_queue import PART_A_SUBMITTED, RedisJobQueue, RedisWorker
+from scheduling import Schedule
+from test_validation import VALID
+
+
+def _client():
+    try:
+        import redis
+        client = redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'), decode_responses=True,
+                                socket_connect_timeout=0.5)
+        client.ping()
+        return client
+    except Exception:
+        pass
+    try:
+        import fakeredis
+        import lupa  # noqa: F401 - fakeredis needs it for EVALSHA
+    except ImportError:
+        pytest.skip('needs a Redis server at REDIS_URL, or fakeredis and lupa')
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture
+def client():
+    client = _client()
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def make_queue(client):
+    prefix = f'gst:test:{uuid.uuid4().hex[:8]}'
+
+    def make(**kwargs):
+        return RedisJobQueue(prefix=prefix, client=client, **kwargs)
+
+    yield make
+    for key in client.scan_iter(match=f'{prefix}:*'):
+        client.delete(key)
+
+
+def submit(job_queue, priority='normal', **kwargs):
+    return job_queue.submit(dict(VALID), schedule=Schedule(priority), **kwargs).id
+
+
+def test_claim_serves_earliest_run_by_first(make_queue):
+    job_queue = make_queue()
+    bulk, urgent, normal = submit(job_queue, 'bulk'), submit(job_queue, 'urgent'), submit(job_queue, 'normal')
+    assert [job_queue.claim('node-a') for _ in range(4)] == [urgent, normal, bulk, None]
+    job = job_queue.get(urgent)
+    assert (job.status, job.node, job.attempts) == ('running', 'node-a', 1)
+    assert job_queue.stats()['running'] == 3 and job_queue.stats()['pending'] == 0
+
+
+def test_claim_skips_jobs_whose_hash_expired(make_queue, client):
+    job_queue = make_queue()
+    gone, kept = submit(job_queue), submit(job_queue)
+    client.delete(job_queue.job_key(gone))
+    assert job_queue.claim('node-a') == kept
+    assert job_queue.claim('node-a') is None
+
+
+def test_finish_only_by_the_owning_node(make_queue, client):
+    job_queue = make_queue()
+    job_id = submit(job_queue)
+    job_queue.claim('node-a')
+    assert job_queue.finish(job_id, 'node-b', 'succeeded', 1) == 'lost'
+    assert job_queue.finish(job_id, 'node-a', 'succeeded', 1, report={'total_seconds': 12}) == 'succeeded'
+    job = job_queue.get(job_id)
+    assert job.status == 'succeeded' and job.finished_at and job.report == {'total_seconds': 12}
+    assert client.ttl(job_queue.job_key(job_id)) > 0
+    assert job_queue.stats()['running'] == 0
+
+
+def test_failed_job_is_retried_until_attempts_run_out(make_queue):
+    job_queue = make_queue(max_attempts=2)
+    job_id = submit(job_queue)
+    job_queue.claim('node-a')
+    assert job_queue.finish(job_id, 'node-a', 'failed', 1, error='portal down') == 'queued'
+    assert job_queue.get(job_id).status == 'queued'
+    assert job_queue.claim('node-b') == job_id
+    assert job_queue.finish(job_id, 'node-b', 'failed', 2, error='portal down') == 'failed'
+    job = job_queue.get(job_id)
+    assert job.dead_letter and job.attempts == 2 and job.error == 'portal down'
+    assert [dead.id for dead in job_queue.dead_letters()] == [job_id]
+
+
+def test_failure_after_part_a_is_not_retried(make_queue):
+    job_queue = make_queue(max_attempts=3)
+    job_id = submit(job_queue)
+    job_queue.claim('node-a')
+    assert job_queue.finish(job_id, 'node-a', 'failed', 1, retryable=False) == 'failed'
+    assert job_queue.get(job_id).dead_letter
+    assert job_queue.claim('node-a') is None
+
+
+def test_reap_requeues_then_dead_letters_lost_jobs(make_queue):
+    job_queue = make_queue(visibility_timeout=-1, max_attempts=2)
+    job_id = submit(job_queue)
+    job_queue.claim('node-a')
+    assert job_queue.reap() == (1, 0)
+    job = job_queue.get(job_id)
+    assert job.status == 'queued' and 'node-a' in job.error
+    job_queue.claim('node-b')
+    assert job_queue.reap() == (0, 1)
+    job = job_queue.get(job_id)
+    assert job.status == 'failed' and job.dead_letter and 'attempts exhausted' in job.error
+
+
+def test_reap_does_not_rerun_a_job_past_part_a(make_queue):
+    job_queue = make_queue(visibility_timeout=-1, max_attempts=3)
+    job_id = submit(job_queue)
+    job_queue.claim('node-a')
+    job_queue.mark_part_a_submitted(job_id)
+    assert job_queue.reap() == (0, 1)
+    job = job_queue.get(job_id)
+    assert job.status == 'failed' and job.dead_letter and 'after Part A' in job.error
+    assert job_queue.requeue_dead(job_id) == 1
+    assert job_queue.get(job_id).status == 'queued' and job_queue.get(job_id).attempts == 0
+    assert job_queue.claim('node-a') == job_id
+    assert job_queue.reap() == (1, 0)  # the requeued run starts with a clean slate
+
+
+def test_reap_leaves_live_jobs_alone(make_queue):
+    job_queue = make_queue(visibility_timeout=60)
+    submit(job_queue)
+    job_queue.claim('node-a')
+    assert job_queue.reap() == (0, 0)
+
+
+def test_cancel(make_queue):
+    job_queue = make_queue(visibility_timeout=-1)
+    queued, running = submit(job_queue), submit(job_queue)
+    assert job_queue.claim('node-a') == queued
+    # `queued` is now running; cancel the other one while it is still pending
+    job = job_queue.cancel(running, reason='duplicate')
+    assert (job.status, job.cancel_reason) == ('cancelled', 'duplicate')
+    assert job_queue.claim('node-a') is None
+    job = job_queue.cancel(queued, reason='operator')
+    assert job.status == 'running'
+    assert job_queue.cancel_requests([queued, running]) == {queued: 'operator'}
+    # A flagged job that lost its worker is cancelled rather than requeued
+    assert job_queue.reap() == (0, 0)
+    assert job_queue.get(queued).status == 'cancelled'
+    assert job_queue.cancel('missing') is None
+
+
+def test_worker_stops_a_cancelled_job_without_waiting_for_the_heartbeat(make_queue):
+    job_queue = make_queue(visibility_timeout=600)
+    local_queue = JobQueue(lambda config: cancellable_sleep(30), workers=1)
+    worker = RedisWorker(job_queue, local_queue, node_id='node-a')
+    job_id = submit(job_queue)
+    threading.Thread(target=worker.run, daemon=True).start()
+    try:
+        deadline = time.monotonic() + 5
+        while job_queue.get(job_id).status != 'running' and time.monotonic() < deadline:
+            time.sleep(0.05)
+        cancelled_at = time.monotonic()
+        job_queue.cancel(job_id, reason='operator')
+        assert job_queue.get(job_id).wait(timeout=10)
+        assert time.monotonic() - cancelled_at < 5
+        job = job_queue.get(job_id)
+        assert (job.status, job.cancel_reason) == ('cancelled', 'operator')
+    finally:
+        worker.stop()
+
+
+def test_worker_marks_part_a_in_redis(make_queue):
+    job_queue = make_queue(visibility_timeout=600)
+    reached = threading.Event()
+
+    def runner(config):
+        from metrics import set_report_label
+        set_report_label(PART_A_SUBMITTED, 'yes')
+        reached.set()
+        cancellable_sleep(2)
+        raise RuntimeError('portal error after Part A')
+
+    worker = RedisWorker(job_queue, JobQueue(runner, workers=1), node_id='node-a')
+    job_id = submit(job_queue)
+    threading.Thread(target=worker.run, daemon=True).start()
+    try:
+        assert reached.wait(5)
+        deadline = time.monotonic() + 5
+        while not job_queue.client.hget(job_queue.job_key(job_id), PART_A_SUBMITTED) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert job_queue.client.hget(job_queue.job_key(job_id), PART_A_SUBMITTED) == '1'
+        assert job_queue.get(job_id).wait(timeout=10)
+        job = job_queue.get(job_id)
+        assert job.status == 'failed' and job.dead_letter and job.attempts == 1
+    finally:
+        worker.stop()
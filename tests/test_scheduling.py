@@ -0,0 +1,32 @@
+# File: tests/test_scheduling.py
+
+import pytest
+
+from metrics import percentile
+from scheduling import MAX_QUEUE_WAIT, RUN_LEAD_MINUTES, Schedule, deadline_errors, parse_deadline
+
+
+def test_percentile_is_nearest_rank():
+    values = [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]
+    assert [percentile(values, pct) for pct in (0, 10, 50, 90, 95, 100)] == [1.0, 1.0, 5.0, 9.0, 10.0, 10.0]
+    assert percentile([0.12345], 99, 3) == 0.123
+    assert percentile([], 50) is None
+
+
+def test_deadline_accepts_iso_8601_strings_only():
+    assert parse_deadline('2026-01-31T11:30:00Z') == parse_deadline('2026-01-31T17:00:00+05:30')
+    assert parse_deadline(None) is None and parse_deadline('') is None
+    assert deadline_errors('2026-01-31T17:00:00+05:30', 'config.deadline') == []
+    for value in (1767182400, 1767182400.5, True, 'tomorrow'):
+        assert deadline_errors(value, 'config.deadline') == [
+            'config.deadline: expected an ISO 8601 date-time, e.g. 2026-01-31T17:00:00+05:30'
+        ]
+
+
+def test_run_by_uses_the_earlier_of_class_wait_and_deadline():
+    bulk = Schedule('bulk', submitted_at=1000.0)
+    assert bulk.run_by == 1000.0 + MAX_QUEUE_WAIT['bulk'] * 60
+    near = Schedule('bulk', deadline=1000.0 + 3600, submitted_at=1000.0)
+    assert near.run_by == pytest.approx(1000.0 + 3600 - RUN_LEAD_MINUTES * 60)
+    assert Schedule('unknown').priority == 'normal'
+    assert Schedule.from_config({'deadline': 12345}).deadline is None
@@ -0,0 +1,173 @@
+# File: tests/test_validation.py
+
+import copy
+
+import pytest
+
+from validation import validate_config
+
+PERSON = {
+    'first_name': 'Asha',
+    'last_name': 'Verma',
+    'date_of_birth': '01/02/1985',
+    'mobile_number': '9876543210',
+    'email': 'asha@example.com',
+    'is_citizen_of_india': 'Yes',
+    'pan_number': 'ABCDE1234F',
+}
+
+VALID = {
+    'initial_registration_details': {
+        'selected_taxpayer_type': 'Taxpayer',
+        'selected_state': 'Delhi',
+        'selected_district': 'New Delhi',
+        'business_name': 'Verma Traders',
+        'pan_card': 'ABCDE1234F',
+        'email': 'asha@example.com',
+        'mobile_number': '9876543210',
+    },
+    'business_details': {
+        'trade_name': 'Verma Traders',
+        'constitution_of_business': 'Proprietorship',
+        'reason_to_obtain_registration': 'Voluntary Basis',
+        'date_of_commencement_of_business': '01/04/2024',
+        'Proof_of_Constitution_of_Business': 'Others',
+    },
+    'promoter_partner_details': [dict(PERSON)],
+    'authorized_signatory_details': [dict(PERSON)],
+    'principal_place_of_business_details': {'address_map_search': 'Connaught Place'},
+    'goods_services_details': {'hsn_value': '1001'},
+}
+
+
+def payload(**sections):
+    config = copy.deepcopy(VALID)
+    config.update(sections)
+    return config
+
+
+def test_valid_payload_has_no_errors():
+    assert validate_config(payload()) == []
+
+
+def test_non_object_payload():
+    assert validate_config([]) == ['config: expected an object, got list']
+
+
+def test_missing_sections_are_reported_together():
+    errors = validate_config({})
+    assert 'config.initial_registration_details: section is required' in errors
+    assert 'config.promoter_partner_details: at least one entry is required' in errors
+    assert 'config.goods_services_details: section is required' in errors
+
+
+@pytest.mark.parametrize('pan', ['abcde1234f', 'ABCD1234F', 'ABCDE12345'])
+def test_invalid_pan(pan):
+    config = payload()
+    config['initial_registration_details']['pan_card'] = pan
+    assert validate_config(config) == [
+        f"config.initial_registration_details.pan_card: expected a 10 character PAN like ABCDE1234F (got '{pan}')"
+    ]
+
+
+@pytest.mark.parametrize('mobile', ['5876543210', '98765', '98765432100'])
+def test_invalid_mobile(mobile):
+    config = payload()
+    config['initial_registration_details']['mobile_number'] = mobile
+    assert validate_config(config) == [
+        f"config.initial_registration_details.mobile_number: expected a 10 digit Indian mobile number (got '{mobile}')"
+    ]
+
+
+def test_invalid_date_format():
+    config = payload()
+    config['business_details']['date_of_commencement_of_business'] = '2024-04-01'
+    assert validate_config(config) == [
+        "config.business_details.date_of_commencement_of_business: "
+        "expected a valid date in DD/MM/YYYY format (got '2024-04-01')"
+    ]
+
+
+def test_date_of_birth_in_the_future():
+    config = payload()
+    config['promoter_partner_details'][0]['date_of_birth'] = '01/01/2999'
+    assert validate_config(config) == [
+        "config.promoter_partner_details[0].date_of_birth: must not be in the future (got '01/01/2999')"
+    ]
+
+
+def test_citizen_promoter_requires_pan():
+    config = payload()
+    del config['promoter_partner_details'][0]['pan_number']
+    assert validate_config(config) == [
+        "config.promoter_partner_details[0].pan_number: is required when is_citizen_of_india is 'Yes'"
+    ]
+
+
+def test_citizenship_defaults_to_yes_for_the_pan_rule():
+    config = payload()
+    promoter = config['promoter_partner_details'][0]
+    del promoter['pan_number'], promoter['is_citizen_of_india']
+    assert validate_config(config) == [
+        "config.promoter_partner_details[0].pan_number: is required when is_citizen_of_india is 'Yes'"
+    ]
+
+
+def test_foreign_promoter_requires_passport_not_pan():
+    config = payload()
+    promoter = config['promoter_partner_details'][0]
+    promoter['is_citizen_of_india'] = 'No'
+    del promoter['pan_number']
+    assert validate_config(config) == [
+        "config.promoter_partner_details[0].passport_number: is required when is_citizen_of_india is 'No'"
+    ]
+    promoter['passport_number'] = 'Z1234567'
+    assert validate_config(config) == []
+
+
+def test_invalid_citizenship_choice():
+    config = payload()
+    config['promoter_partner_details'][0]['is_citizen_of_india'] = 'Maybe'
+    assert validate_config(config) == [
+        "config.promoter_partner_details[0].is_citizen_of_india: must be one of ['Yes', 'No'] (got 'Maybe')"
+    ]
+
+
+def test_other_registration_type_required_for_others():
+    config = payload()
+    config['business_details']['type_of_registration'] = 'Others (Please Specify)'
+    assert validate_config(config) == [
+        "config.business_details.other_registration_type: "
+        "is required when type_of_registration is 'Others (Please Specify)'"
+    ]
+
+
+def test_single_object_accepted_for_one_or_many_sections():
+    assert validate_config(payload(promoter_partner_details=dict(PERSON),
+                                   authorized_signatory_details=dict(PERSON))) == []
+
+
+def test_single_object_errors_are_indexed():
+    person = dict(PERSON, mobile_number='123')
+    assert validate_config(payload(authorized_signatory_details=person)) == [
+        "config.authorized_signatory_details[0].mobile_number: expected a 10 digit Indian mobile number (got '123')"
+    ]
+
+
+def test_each_entry_of_a_list_is_validated():
+    second = dict(PERSON, first_name='')
+    assert validate_config(payload(promoter_partner_details=[dict(PERSON), second])) == [
+        'config.promoter_partner_details[1].first_name: is required'
+    ]
+
+
+def test_empty_one_or_many_section_is_required():
+    assert validate_config(payload(authorized_signatory_details=[])) == [
+        'config.authorized_signatory_details: at least one entry is required'
+    ]
+
+
+def test_non_object_entry_in_one_or_many_section():
+    assert validate_config(payload(promoter_partner_details=['Asha'])) == [
+        'config.promoter_partner_details[0]: expected an object, got str'
+    ]
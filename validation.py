@@ -0,0 +1,282 @@
+# File: validation.py
+#
+# Fail-fast validation of GST registration payloads
+# The schema below is compiled once at import into plain check functions, so a payload
+# is validated in milliseconds and every problem is reported together, before a browser,
+# captcha solve or OTP is spent on it.
+
+import os
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from error_policy import policy_errors
+from scheduling import deadline_errors, priority_errors
+
+# A compiled check appends "path: message" strings to the error list
+Check = Callable[[Any, str, List[str]], None]
+
+PAN_PATTERN = re.compile(r'^[A-Z]{5}[0-9]{4}[A-Z]$')
+MOBILE_PATTERN = re.compile(r'^[6-9][0-9]{9}$')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[A-Za-z]{2,}$')
+PINCODE_PATTERN = re.compile(r'^[1-9][0-9]{5}$')
+HSN_PATTERN = re.compile(r'^[0-9]{2,8}$')
+DIGITS_PATTERN = re.compile(r'^[0-9]+$')
+DATE_FORMAT = '%d/%m/%Y'
+YES_NO = ('Yes', 'No')
+GENDERS = ('Male', 'Female', 'Other', 'Others', 'Transgender')
+
+
+def _is_blank(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+# --- Field Builders ---
+
+def text(required: bool = False, pattern: Optional[re.Pattern] = None, message: str = '', choices: Optional[tuple] = None) -> Check:
+    def check(value, path, errors):
+        if _is_blank(value):
+            if required:
+                errors.append(f"{path}: is required")
+            return
+        if not isinstance(value, (str, int)):
+            errors.append(f"{path}: expected a string, got {type(value).__name__}")
+            return
+        value = str(value).strip()
+        if pattern is not None and not pattern.match(value):
+            errors.append(f"{path}: {message or 'has an invalid format'} (got '{value}')")
+        if choices is not None and value not in choices:
+            errors.append(f"{path}: must be one of {list(choices)} (got '{value}')")
+    return check
+
+
+def date(required: bool = False, past: bool = False) -> Check:
+    def check(value, path, errors):
+        if _is_blank(value):
+            if required:
+                errors.append(f"{path}: is required")
+            return
+        try:
+            parsed = datetime.strptime(str(value).strip(), DATE_FORMAT)
+        except ValueError:
+            errors.append(f"{path}: expected a valid date in DD/MM/YYYY format (got '{value}')")
+            return
+        if past and parsed > datetime.now():
+            errors.append(f"{path}: must not be in the future (got '{value}')")
+    return check
+
+
+def document(required: bool = False) -> Check:
+    def check(value, path, errors):
+        if _is_blank(value):
+            if required:
+                errors.append(f"{path}: is required")
+            return
+        if not isinstance(value, str):
+            errors.append(f"{path}: expected a file path, got {type(value).__name__}")
+        elif not os.path.isfile(value):
+            errors.append(f"{path}: file not found ('{value}')")
+        elif not os.access(value, os.R_OK):
+            errors.append(f"{path}: file is not readable ('{value}')")
+    return check
+
+
+def string_list(required: bool = False) -> Check:
+    def check(value, path, errors):
+        if value is None or value == []:
+            if required:
+                errors.append(f"{path}: at least one entry is required")
+            return
+        if not isinstance(value, list):
+            errors.append(f"{path}: expected a list, got {type(value).__name__}")
+            return
+        for index, item in enumerate(value):
+            if _is_blank(item) or not isinstance(item, str):
+                errors.append(f"{path}[{index}]: expected a non-empty string")
+    return check
+
+
+def section(fields: Dict[str, Check], required: bool = True, rules: tuple = ()) -> Check:
+    """An object with known fields plus cross-field rules (each rule is a Check on the whole object)"""
+    def check(value, path, errors):
+        if value is None:
+            if required:
+                errors.append(f"{path}: section is required")
+            return
+        if not isinstance(value, dict):
+            errors.append(f"{path}: expected an object, got {type(value).__name__}")
+            return
+        for name, field_check in fields.items():
+            field_check(value.get(name), f"{path}.{name}", errors)
+        for rule in rules:
+            rule(value, path, errors)
+    return check
+
+
+def error_policy() -> Check:
+    def check(value, path, errors):
+        errors.extend(policy_errors(value, path))
+    return check
+
+
+def priority() -> Check:
+    def check(value, path, errors):
+        errors.extend(priority_errors(value, path))
+    return check
+
+
+def deadline() -> Check:
+    def check(value, path, errors):
+        errors.extend(deadline_errors(value, path))
+    return check
+
+
+def one_or_many(item: Check, required: bool = True) -> Check:
+    """A list of objects; a single object is accepted too, as the section modules do"""
+    def check(value, path, errors):
+        if value is None or value == []:
+            if required:
+                errors.append(f"{path}: at least one entry is required")
+            return
+        items = value if isinstance(value, list) else [value]
+        for index, entry in enumerate(items):
+            item(entry, f"{path}[{index}]", errors)
+    return check
+
+
+def required_when(field: str, condition: Callable[[dict], bool], reason: str) -> Check:
+    def check(obj, path, errors):
+        if condition(obj) and _is_blank(obj.get(field)):
+            errors.append(f"{path}.{field}: is required when {reason}")
+    return check
+
+
+# --- Compiled Schema ---
+
+_pan = dict(pattern=PAN_PATTERN, message="expected a 10 character PAN like ABCDE1234F")
+_mobile = dict(pattern=MOBILE_PATTERN, message="expected a 10 digit Indian mobile number")
+_email = dict(pattern=EMAIL_PATTERN, message="expected a valid email address")
+_pincode = dict(pattern=PINCODE_PATTERN, message="expected a 6 digit pincode")
+
+_person_fields = {
+    'first_name': text(),
+    'middle_name': text(),
+    'last_name': text(),
+    'father_first_name': text(),
+    'father_middle_name': text(),
+    'father_last_name': text(),
+    'date_of_birth': date(past=True),
+    'mobile_number': text(**_mobile),
+    'email': text(**_email),
+    'gender': text(choices=GENDERS),
+    'designation_status': text(),
+    'director_identification_number': text(pattern=DIGITS_PATTERN, message="expected digits only"),
+    'is_citizen_of_india': text(choices=YES_NO),
+    'pan_number': text(**_pan),
+    'passport_number': text(),
+    'pincode_map_search': text(),
+    'building_flat_door_no': text(),
+}
+
+_is_citizen = lambda obj: obj.get('is_citizen_of_india', 'Yes') != 'No'
+_is_foreigner = lambda obj: obj.get('is_citizen_of_india') == 'No'
+
+_promoter = section(
+    {
+        **_person_fields,
+        'first_name': text(required=True),
+        'country': text(),
+        'state': text(),
+        'pincode': text(**_pincode),
+        'district': text(),
+        'city': text(),
+        'locality': text(),
+        'street': text(),
+        'Building': text(),
+        'floor_number': text(),
+        'nearby_landmark': text(),
+        'document_upload': document(),
+        'is_also_authorized_signatory': text(choices=YES_NO),
+    },
+    rules=(
+        required_when('pan_number', _is_citizen, "is_citizen_of_india is 'Yes'"),
+        required_when('passport_number', _is_foreigner, "is_citizen_of_india is 'No'"),
+    ),
+)
+
+_signatory = section({
+    **_person_fields,
+    'is_primary_signatory': text(choices=YES_NO),
+    'type_of_authorization': text(),
+    'document_upload1': document(),
+    'document_upload2': document(),
+})
+
+CONFIG_SCHEMA = section({
+    'initial_registration_details': section({
+        'selected_taxpayer_type': text(required=True),
+        'selected_state': text(required=True),
+        'selected_district': text(required=True),
+        'business_name': text(required=True),
+        'pan_card': text(required=True, **_pan),
+        'email': text(required=True, **_email),
+        'mobile_number': text(required=True, **_mobile),
+    }),
+    'business_details': section(
+        {
+            'trade_name': text(required=True),
+            'constitution_of_business': text(required=True),
+            'specific_other_constitution': text(),
+            'reason_to_obtain_registration': text(required=True),
+            'date_of_commencement_of_business': date(required=True),
+            'type_of_registration': text(),
+            'other_registration_type': text(),
+            'other_registration_number': text(),
+            'date_of_registration': date(past=True),
+            'Proof_of_Constitution_of_Business': text(required=True),
+            'proof_of_consititution': document(),
+        },
+        rules=(
+            required_when('other_registration_type',
+                          lambda obj: obj.get('type_of_registration') == "Others (Please Specify)",
+                          "type_of_registration is 'Others (Please Specify)'"),
+        ),
+    ),
+    'promoter_partner_details': one_or_many(_promoter),
+    'authorized_signatory_details': one_or_many(_signatory),
+    'principal_place_of_business_details': section({
+        'address_map_search': text(required=True),
+        'pincode': text(**_pincode),
+        'district': text(),
+        'city_town_village': text(),
+        'street': text(),
+        'building_no': text(),
+        'jurisdiction': section({
+            'ward': text(),
+            'commissionerate': text(),
+            'division': text(),
+            'range': text(),
+        }, required=False),
+        'nature_of_possession_of_premises': text(),
+        'document_proof': text(),
+        'document_upload': document(),
+        'document_upload_2': document(),
+        'nature_of_business': string_list(),
+    }),
+    'goods_services_details': section({
+        'hsn_value': text(required=True, pattern=HSN_PATTERN, message="expected a 2-8 digit HSN code"),
+    }),
+    'error_policy': error_policy(),
+    'priority': priority(),
+    'deadline': deadline(),
+})
+
+
+def validate_config(config: Any) -> List[str]:
+    """Validate a registration payload and return every error found (empty list if valid)"""
+    errors: List[str] = []
+    CONFIG_SCHEMA(config, 'config', errors)
+    return errors
+
+
+__all__ = ['CONFIG_SCHEMA', 'validate_config']